@@ -1,3 +1,46 @@
 from django.contrib import admin
 
+from .classification_queue import requeue
+from .models import ClassificationDeadLetter, ClassificationTask, ClassifierModel, Sites, ThreatKeyword, TrainingExample
+
 # Register your models here.
+@admin.register(Sites)
+class SitesAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'connector', 'max_concurrency')
+    list_filter = ('connector',)
+    search_fields = ('name', 'url')
+
+@admin.register(ThreatKeyword)
+class ThreatKeywordAdmin(admin.ModelAdmin):
+    list_display = ('term', 'severity', 'weight', 'active', 'updated_at')
+    list_filter = ('severity', 'active')
+    list_editable = ('severity', 'weight', 'active')
+    search_fields = ('term',)
+
+@admin.register(ClassifierModel)
+class ClassifierModelAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'version', 'active', 'created_at', 'updated_at')
+    list_filter = ('kind', 'active')
+    search_fields = ('version',)
+
+@admin.register(ClassificationTask)
+class ClassificationTaskAdmin(admin.ModelAdmin):
+    list_display = ('result', 'urgent', 'priority', 'status', 'attempts', 'available_at', 'last_error')
+    list_filter = ('status', 'urgent')
+
+@admin.register(ClassificationDeadLetter)
+class ClassificationDeadLetterAdmin(admin.ModelAdmin):
+    list_display = ('result', 'urgent', 'priority', 'attempts', 'error', 'failed_at')
+    list_filter = ('urgent',)
+    search_fields = ('error',)
+    actions = ['requeue_selected']
+
+    @admin.action(description="Remettre en file de classification")
+    def requeue_selected(self, request, queryset):
+        self.message_user(request, f"{requeue(queryset)} résultat(s) remis en file.")
+
+@admin.register(TrainingExample)
+class TrainingExampleAdmin(admin.ModelAdmin):
+    list_display = ('result', 'label', 'source', 'holdout', 'model_version', 'updated_at')
+    list_filter = ('label', 'source', 'holdout')
+    search_fields = ('text',)
@@ -1,22 +1,42 @@
 import os
+import random
 import re
 import requests
 
 import json
-import pickle
-from typing import Dict
+from typing import Dict, List
 import google.generativeai as genai
 
 
 from django.conf import settings
 
-def get_recommendations_from_ai(prompt):
+from .classification_cache import cache_key, get_cached_verdict, store_verdict
+from .local_model import get_local_model
+from .model_registry import registry
+from .upstreams import get_upstream
+
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# Prompt tokens added per item by the batch prompt around each text (JSON
+# keys, quotes and the matching part of the expected answer)
+BATCH_ITEM_OVERHEAD_TOKENS = 150
+
+def estimate_tokens(text):
+    """Rough token count of a text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+class ClassificationError(Exception):
+    """Gemini couldn't be reached: the texts must be classified again later."""
+
+
+def get_recommendations_from_ai(prompt, model_name=GEMINI_MODEL, raise_errors=False):
     """
     Call an AI service to get recommendations based on the alert details.
     This is a placeholder function and should be replaced with actual AI service integration.
+    A failed request raises ClassificationError with `raise_errors`.
     """
     # Example API call to an AI service (replace with actual implementation)
-    api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
     payload = {
         "contents": [
             {
@@ -35,7 +55,7 @@ def get_recommendations_from_ai(prompt):
     }
 
     try:
-        response = requests.post(api_url, json=payload, headers=headers)
+        response = get_upstream('gemini').post(api_url, json=payload, headers=headers)
         response.raise_for_status()
         # recommendations = response.json().get('recommendations', 'No recommendations available.')
         json_response = response.json()
@@ -52,6 +72,8 @@ def get_recommendations_from_ai(prompt):
         
     except requests.RequestException as e:
         print(f"Failed to get recommendations: {e}")
+        if raise_errors:
+            raise ClassificationError(f"Gemini request failed: {e}") from e
         return "No recommendations available."
 
 
@@ -60,18 +82,74 @@ class AlertClassifier:
     An abstraction of a neural network classifier powered by Gemini.
     It classifies text into: none, low, medium, high alert,
     and provides actionable recommendations if it's an alert.
+
+    Verdicts are cached by text, prompt version and model, so the same text
+    is only sent to Gemini once. Bump PROMPT_VERSION whenever the prompt
+    changes to stop reusing verdicts given to the old one.
+
+    When the local model is available it screens texts first: the ones it
+    confidently rates "none" are dropped without calling Gemini.
+
+    One instance per version is shared by every thread of the process, see
+    get_classifier(); `version` is recorded on the alerts it raises. When
+    Gemini can't be reached, ClassificationError is raised rather than a
+    verdict given. Verdicts Gemini didn't give have a "source": "local" when
+    the local model screened the text, "error" when Gemini's answer was
+    unusable.
     """
 
-    def __init__(self, api_key: str = settings.GEMINI_API_KEY, model_name: str = "gemini-1.5-flash", language: str = settings.LANGUAGE_CODE):
+    PROMPT_VERSION = "1"
+
+    def __init__(self, api_key: str = settings.GEMINI_API_KEY, model_name: str = GEMINI_MODEL, language: str = settings.LANGUAGE_CODE, version: str = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("Gemini API key is required.")
         genai.configure(api_key=self.api_key)
+        self.model_name = model_name
         self.model = genai.GenerativeModel(model_name)
         self.language = language
+        # The prompt depends on the response language as well
+        self.prompt_version = f"{self.PROMPT_VERSION}-{language}"
+        self.version = f"{version or model_name}, prompt {self.prompt_version}"
         self.classes = ["none", "low", "medium", "high"]
 
     def predict(self, text: str) -> Dict[str, str]:
+        key = cache_key(text, self.prompt_version, self.model_name)
+        cached = get_cached_verdict(key)
+        if cached is not None:
+            return cached
+
+        if self.screen_locally([text])[0]:
+            return {
+                "severity": "none",
+                "recommendations": [],
+                "source": "local"
+            }
+        return self._predict_remote(key, text)
+
+    def screen_locally(self, texts: List[str]) -> List[bool]:
+        """
+        Tell, for each text, whether the local model is confident enough that
+        it is irrelevant to skip Gemini. DISTILLATION_AUDIT_PERCENT of those
+        go to Gemini anyway, so that the labelled examples the local model is
+        distilled from cover the texts it handles too.
+        """
+        local_model = get_local_model()
+        if local_model is None or not texts:
+            return [False] * len(texts)
+
+        try:
+            probabilities = local_model.none_probabilities(texts)
+        except Exception as e:
+            print(f"Local screening failed, sending {len(texts)} texts to Gemini: {e}")
+            return [False] * len(texts)
+
+        confident = [p >= settings.LOCAL_MODEL_NONE_THRESHOLD for p in probabilities]
+        dropped = [c and random.random() * 100 >= settings.DISTILLATION_AUDIT_PERCENT for c in confident]
+        print(f"Local model dropped {sum(dropped)}/{len(texts)} texts as irrelevant ({sum(confident) - sum(dropped)} audited)")
+        return dropped
+
+    def _predict_remote(self, key: str, text: str) -> Dict[str, str]:
         prompt = f"""
         You are a cybersecurity professional working in an African (specifically Cameroonian) bank.
         The following was picked up from a site:
@@ -97,38 +175,186 @@ class AlertClassifier:
         """
 
         try:
-            response = get_recommendations_from_ai(prompt)
-            if isinstance(response, str):
-                return {
-                    "severity": "none",
-                    "recommendations": []
-                }
-            return response
-
+            response = get_recommendations_from_ai(prompt, self.model_name, raise_errors=True)
+        except ClassificationError:
+            raise
         except Exception as e:
             print(f"Prediction failed: {e}")
+            response = None
+
+        verdict = self._parse_verdict(response)
+        if verdict is None:
+            print(f"Unusable answer from Gemini: {str(response)[:200]}")
             return {
                 "severity": "none",
-                "recommendations": []
+                "recommendations": [],
+                "source": "error"
             }
+        store_verdict(key, verdict, self.prompt_version, self.model_name)
+        return verdict
+
+    def _parse_verdict(self, answer):
+        """
+        The verdict of one of Gemini's answers, or None if it isn't an object
+        with one of the classes as severity and a list of strings as
+        recommendations.
+        """
+        if not isinstance(answer, dict) or not isinstance(answer.get("severity"), str):
+            return None
+        severity = answer["severity"].strip().lower()
+        recommendations = answer.get("recommendations") or []
+        if severity not in self.classes or not isinstance(recommendations, list):
+            return None
+        if not all(isinstance(recommendation, str) for recommendation in recommendations):
+            return None
+        return {"severity": severity, "recommendations": recommendations}
+
+    def predict_many(self, texts: List[str]) -> List[Dict[str, str]]:
+        """
+        Classify several texts, packing as many as the token budget allows
+        into each Gemini request. Returns one verdict per text, in order.
+        Cached texts and texts the local model drops are not sent; the others
+        share their verdict with every identical text of the call.
+        """
+        verdicts = [None] * len(texts)
+        pending = {}
+        for index, text in enumerate(texts):
+            key = cache_key(text, self.prompt_version, self.model_name)
+            cached = get_cached_verdict(key) if key not in pending else None
+            if cached is not None:
+                verdicts[index] = cached
+            else:
+                pending.setdefault(key, (text, []))[1].append(index)
+
+        items = [(key, text) for key, (text, _) in pending.items()]
+        dropped = self.screen_locally([text for _, text in items])
+        for (key, _), irrelevant in zip(items, dropped):
+            if irrelevant:
+                for index in pending[key][1]:
+                    verdicts[index] = {"severity": "none", "recommendations": [], "source": "local"}
+        items = [item for item, irrelevant in zip(items, dropped) if not irrelevant]
+
+        for batch in self._split_batches(items):
+            for key, verdict in self._classify_batch(batch).items():
+                for index in pending[key][1]:
+                    verdicts[index] = verdict
+
+        return verdicts
+
+    def _split_batches(self, items):
+        """
+        Group (key, text) items into batches that stay under
+        CLASSIFIER_BATCH_SIZE items and CLASSIFIER_BATCH_TOKENS estimated tokens.
+        """
+        batch, tokens = [], 0
+        for key, text in items:
+            item_tokens = estimate_tokens(text) + BATCH_ITEM_OVERHEAD_TOKENS
+            if batch and (len(batch) >= settings.CLASSIFIER_BATCH_SIZE or tokens + item_tokens > settings.CLASSIFIER_BATCH_TOKENS):
+                yield batch
+                batch, tokens = [], 0
+            batch.append((key, text))
+            tokens += item_tokens
+        if batch:
+            yield batch
+
+    def _classify_batch(self, batch):
+        """
+        Classify a batch in one request and return {key: verdict}. Items the
+        response misses or garbles are retried in halves, down to a single
+        request per item.
+        """
+        if len(batch) == 1:
+            key, text = batch[0]
+            return {key: self._predict_remote(key, text)}
+
+        ids = {str(position): key for position, (key, _) in enumerate(batch)}
+        articles = json.dumps(
+            [{"id": str(position), "text": text} for position, (_, text) in enumerate(batch)],
+            ensure_ascii=False,
+        )
+        prompt = f"""
+        You are a cybersecurity professional working in an African (specifically Cameroonian) bank.
+        The following {len(batch)} items were picked up from various sites, as a JSON list of {{"id", "text"}} objects:
+
+        {articles}
+
+        For each item, provide security recommendations considering it's for a bank system.
+        Recommendations should be short, 2–5 items, in markdown format, each like:
+        'Strengthen passwords: change old passwords to stronger ones...'
+
+        Also, classify the severity of each item as {', '.join(self.classes)} based on relevance
+        and risk to the bank's systems.
+
+        Respond with a JSON array containing exactly one object per item, like this:
+        [
+            {{
+                "id": "<id of the item>",
+                "severity": "low" | "medium" | "high" | "none",
+                "recommendations": ["Recommendation 1", "Recommendation 2", ...]
+            }}
+        ]
+
+        Respond in {self.language}.
+
+        Please don't translate the severity to the target language. Leave it in English (i.e. no matter the language, severity should either be none, high, medium or low). Don't give any recommendations if severity is none.
+        """
+
+        verdicts = {}
+        try:
+            response = get_recommendations_from_ai(prompt, self.model_name, raise_errors=True)
+        except ClassificationError:
+            # Halving the batch would only multiply the failed requests
+            raise
+        except Exception as e:
+            print(f"Batch prediction of {len(batch)} items failed: {e}")
+            response = None
+
+        if isinstance(response, list):
+            for answer in response:
+                if not isinstance(answer, dict):
+                    continue
+                key = ids.get(str(answer.get("id")))
+                verdict = self._parse_verdict(answer)
+                if key is None or verdict is None:
+                    continue
+                store_verdict(key, verdict, self.prompt_version, self.model_name)
+                verdicts[key] = verdict
+
+        missing = [(key, text) for key, text in batch if key not in verdicts]
+        if missing:
+            print(f"Batch prediction: {len(missing)}/{len(batch)} items unanswered, retrying them")
+            if len(missing) == len(batch):
+                # Nothing usable came back: halve the batch rather than resend it
+                middle = len(missing) // 2
+                verdicts.update(self._classify_batch(missing[:middle]))
+                verdicts.update(self._classify_batch(missing[middle:]))
+            else:
+                for retry in self._split_batches(missing):
+                    verdicts.update(self._classify_batch(retry))
+        return verdicts
+
+
+def load_gemini_classifier(version, config):
+    return AlertClassifier(model_name=config.get("model_name") or version, version=version)
+
+
+def default_gemini_classifier():
+    return GEMINI_MODEL, {"model_name": GEMINI_MODEL}
+
+
+registry.register("gemini", load_gemini_classifier, default_gemini_classifier)
 
-    def save(self, path: str):
-        """Pickle this object to a file."""
-        with open(path, "wb") as f:
-            pickle.dump(self, f)
 
-    @staticmethod
-    def load(path: str):
-        """Load a pickled AlertClassifier."""
-        with open(path, "rb") as f:
-            return pickle.load(f)
+def get_classifier() -> AlertClassifier:
+    """The AlertClassifier of the active Gemini version, shared by the process."""
+    return registry.get("gemini")
 
 
 """
 from main.ai_model import *
 from main.models import *
 
-classifier = AlertClassifier()
+classifier = get_classifier()
 res = ScanResult.objects.first()
 
 classifier.predict(res.details)
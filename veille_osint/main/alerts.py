@@ -0,0 +1,141 @@
+import hashlib
+
+from django.conf import settings
+
+from .models import Alert, StoryCluster, TrainingExample
+from .ai_model import get_classifier
+from .keyword_matcher import matcher
+
+def result_content(scan_result):
+    """Text judged by the classifier: the article's full text when it was extracted."""
+    return f"{scan_result.full_text or scan_result.details} {getattr(scan_result, 'titre', '')}".lower()
+
+def alert_message(matches):
+    matched = list(dict.fromkeys(match.term for match in matches))
+    return f"Mots detectees: {', '.join(matched)}"
+
+def create_alert_from_verdict(scan_result, matches, result, model_version=None):
+    alert_level = result.get('severity', None)
+    
+    if alert_level.lower() != 'none':
+        # A result classified again (retried, or updated) keeps one alert
+        Alert.objects.update_or_create(
+            result=scan_result,
+            defaults={
+                'severity': alert_level,
+                'message': alert_message(matches),
+                'recommendations': result.get('recommendations', ''),
+                'model_version': model_version,
+            },
+        )
+
+def in_holdout(text):
+    """
+    Whether a labelled text is kept out of training, to compare local model
+    versions on (DISTILLATION_HOLDOUT_PERCENT of texts; the same text always is).
+    """
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % 100 < settings.DISTILLATION_HOLDOUT_PERCENT
+
+def record_training_examples(scan_results, contents, verdicts, classifier):
+    """
+    Keep the verdicts Gemini gave, "none" included, as labelled examples for
+    the local model. Those it didn't give (screened locally, or unusable
+    answers) and those of replays are left out; a result keeps its first
+    example, or the correction of a FalseAlert.
+    """
+    examples = []
+    for scan_result, content, verdict in zip(scan_results, contents, verdicts):
+        severity = str(verdict.get('severity', '')).lower() if isinstance(verdict, dict) else ''
+        if severity not in classifier.classes or verdict.get('source') or scan_result.scan.replay_of_id:
+            continue
+        examples.append(TrainingExample(
+            result_id=scan_result.pk,
+            text=content,
+            label=severity,
+            model_version=classifier.version,
+            holdout=in_holdout(content),
+        ))
+    TrainingExample.objects.bulk_create(examples, ignore_conflicts=True)
+
+def story_representatives(scan_results):
+    """
+    The results to classify: one per story cluster not classified yet, and
+    every result outside a cluster. Copies of a known story aren't classified
+    again, they share its verdict (share_story_verdicts).
+    """
+    cluster_ids = {scan_result.cluster_id for scan_result in scan_results if scan_result.cluster_id}
+    classified = set(
+        StoryCluster.objects.filter(pk__in=cluster_ids, severity__isnull=False).values_list('pk', flat=True)
+    )
+
+    representatives = []
+    for scan_result in scan_results:
+        if scan_result.cluster_id is None:
+            representatives.append(scan_result)
+        elif scan_result.cluster_id not in classified:
+            classified.add(scan_result.cluster_id)
+            representatives.append(scan_result)
+    return representatives
+
+def share_story_verdicts(copies):
+    """
+    Give the copies of classified stories the story's alert, with the terms
+    each of them shows, so that they are listed like any classified result.
+    The alerts are created in bulk, bypassing the post_save signal: the
+    story's own alert was the one emailed.
+    """
+    if not copies:
+        return
+    cluster_ids = {scan_result.cluster_id for scan_result in copies}
+    severities = dict(
+        StoryCluster.objects.filter(pk__in=cluster_ids, severity__isnull=False).values_list('pk', 'severity')
+    )
+    story_alerts = {}
+    for alert in Alert.objects.filter(result__cluster_id__in=cluster_ids).select_related('result').order_by('alert_date'):
+        story_alerts.setdefault(alert.result.cluster_id, alert)
+
+    copies = [scan_result for scan_result in copies if severities.get(scan_result.cluster_id, 'none') != 'none']
+    matches = matcher.find_many([result_content(scan_result) for scan_result in copies])
+    alerts = []
+    for scan_result, result_matches in zip(copies, matches):
+        story_alert = story_alerts.get(scan_result.cluster_id)
+        alerts.append(Alert(
+            result=scan_result,
+            severity=severities[scan_result.cluster_id],
+            message=alert_message(result_matches),
+            recommendations=story_alert.recommendations if story_alert else '',
+            model_version=story_alert.model_version if story_alert else None,
+        ))
+    Alert.objects.bulk_create(alerts, ignore_conflicts=True)
+
+
+def check_results_for_alerts(scan_results):
+    """
+    Evaluate a batch of stored results with batched classifier calls. Raises
+    if they couldn't all be classified, for the classification queue to
+    retry them.
+    """
+    if not scan_results:
+        return
+
+    representatives = story_representatives(scan_results)
+    print(f"Checking {len(representatives)} scan results for alerts, {len(scan_results) - len(representatives)} copies of known stories share their verdict")
+    classified = {scan_result.pk for scan_result in representatives}
+    copies = [scan_result for scan_result in scan_results if scan_result.pk not in classified]
+    if not representatives:
+        share_story_verdicts(copies)
+        return
+    contents = [result_content(scan_result) for scan_result in representatives]
+    classifier = get_classifier()
+    verdicts = classifier.predict_many(contents)
+
+    record_training_examples(representatives, contents, verdicts, classifier)
+    matches = matcher.find_many(contents)
+    for scan_result, result_matches, result in zip(representatives, matches, verdicts):
+        create_alert_from_verdict(scan_result, result_matches, result, classifier.version)
+        if scan_result.cluster_id:
+            StoryCluster.objects.filter(pk=scan_result.cluster_id).update(
+                severity=(result.get('severity') or 'none').lower()
+            )
+    share_story_verdicts(copies)
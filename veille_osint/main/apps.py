@@ -6,7 +6,12 @@ class MainConfig(AppConfig):
     name = 'main'
 
     def ready(self):
+        from django.conf import settings
+
+        from .ingestion import start_workers
         from .scheduler import start_scheduler
-        start_scheduler()
+        # Scans left pending before a restart are taken back without waiting for a new one
+        if start_scheduler() and settings.INGESTION_IN_PROCESS:
+            start_workers()
         
         import main.signals
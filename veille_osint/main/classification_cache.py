@@ -0,0 +1,86 @@
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils.timezone import now
+
+from .dedup import normalize_content
+from .models import ClassificationCache
+
+# Eviction runs once every EVICT_EVERY stores rather than on each one
+EVICT_EVERY = 100
+
+_stores = 0
+_stores_lock = threading.Lock()
+
+
+def cache_key(text, prompt_version, model_name):
+    payload = f"{model_name}\x00{prompt_version}\x00{normalize_content(text)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_verdict(key):
+    """
+    Return the cached verdict for `key`, or None if it is missing or expired.
+    """
+    entry = ClassificationCache.objects.filter(key=key).first()
+    if entry is None:
+        return None
+
+    if entry.created_at < now() - timedelta(seconds=settings.CLASSIFICATION_CACHE_TTL):
+        entry.delete()
+        return None
+
+    ClassificationCache.objects.filter(pk=entry.pk).update(last_used_at=now(), hits=F('hits') + 1)
+    return {
+        "severity": entry.severity,
+        "recommendations": entry.recommendations,
+    }
+
+
+def store_verdict(key, verdict, prompt_version, model_name):
+    global _stores
+
+    try:
+        ClassificationCache.objects.update_or_create(
+            key=key,
+            defaults={
+                'model_name': model_name,
+                'prompt_version': prompt_version,
+                'severity': verdict.get('severity', 'none').lower(),
+                'recommendations': verdict.get('recommendations') or [],
+                'created_at': now(),
+                'last_used_at': now(),
+            },
+        )
+    except IntegrityError:
+        # Another worker cached the same text first
+        pass
+
+    with _stores_lock:
+        _stores += 1
+        due = _stores % EVICT_EVERY == 0
+    if due:
+        evict_verdicts()
+
+
+def evict_verdicts():
+    """
+    Drop expired entries, then the least recently used ones beyond
+    CLASSIFICATION_CACHE_MAX_ENTRIES.
+    """
+    expired, _ = ClassificationCache.objects.filter(
+        created_at__lt=now() - timedelta(seconds=settings.CLASSIFICATION_CACHE_TTL)
+    ).delete()
+
+    overflow = ClassificationCache.objects.count() - settings.CLASSIFICATION_CACHE_MAX_ENTRIES
+    evicted = 0
+    if overflow > 0:
+        stale = ClassificationCache.objects.order_by('last_used_at').values_list('pk', flat=True)[:overflow]
+        evicted, _ = ClassificationCache.objects.filter(pk__in=list(stale)).delete()
+
+    if expired or evicted:
+        print(f"Classification cache: evicted {expired} expired and {evicted} least recently used entries")
@@ -0,0 +1,232 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .ai_model import ClassificationError
+from .alerts import check_results_for_alerts, result_content
+from .keyword_matcher import matcher, threat_score
+from .leases import WORKER_ID
+from .models import ClassificationDeadLetter, ClassificationTask, Journal, ScanResult
+from .rate_limits import RateLimited
+from .upstreams import CircuitOpen
+
+# Gemini unreachable or our budget for it spent: every task of the batch
+# would fail the same way, so the whole batch backs off
+TRANSIENT_ERRORS = (ClassificationError, RateLimited, CircuitOpen)
+
+_workers = []
+_workers_lock = threading.Lock()
+# Set when tasks are queued, so idle in-process workers take them at once
+_wake = threading.Event()
+
+
+def enqueue_classification(scan_results):
+    """
+    Queue stored results for classification. Results matching a
+    high-severity term are urgent, except those of replays, which never get
+    ahead of live results. A result already queued keeps its task.
+    """
+    if not scan_results:
+        return
+    matches = matcher.find_many([result_content(scan_result) for scan_result in scan_results])
+    ClassificationTask.objects.bulk_create(
+        [
+            ClassificationTask(
+                result_id=scan_result.pk,
+                urgent=not scan_result.scan.replay_of_id and any(match.severity == 'high' for match in result_matches),
+                priority=threat_score(result_matches),
+                available_at=now(),
+            )
+            for scan_result, result_matches in zip(scan_results, matches)
+        ],
+        ignore_conflicts=True,
+    )
+    if settings.CLASSIFICATION_IN_PROCESS:
+        start_workers()
+    transaction.on_commit(_wake.set)
+
+
+def claimable_tasks():
+    """
+    Tasks waiting for a worker: pending ones past their backoff, and running
+    ones whose worker stopped before finishing them.
+    """
+    return ClassificationTask.objects.filter(
+        Q(status='pending', available_at__lte=now()) | Q(status='running', lease_expires_at__lt=now())
+    )
+
+
+def claim_tasks(limit):
+    """
+    Claim up to `limit` tasks, most urgent first, for this process under a
+    lease of CLASSIFICATION_LEASE_SECONDS, the same way claim_scans does.
+    """
+    give_up_expired_tasks()
+
+    candidates = claimable_tasks().order_by('-urgent', '-priority', 'created_at').values_list('id', flat=True)
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            claimed = take_tasks(list(candidates.select_for_update(skip_locked=True)[:limit]))
+    else:
+        claimed = take_tasks(list(candidates[:limit]))
+    return list(ClassificationTask.objects.filter(id__in=claimed).order_by('-urgent', '-priority', 'created_at'))
+
+
+def take_tasks(task_ids):
+    taken = []
+    for task_id in task_ids:
+        updated = claimable_tasks().filter(id=task_id).update(
+            status='running',
+            claimed_by=WORKER_ID,
+            lease_expires_at=now() + timedelta(seconds=settings.CLASSIFICATION_LEASE_SECONDS),
+            attempts=F('attempts') + 1,
+        )
+        if updated:
+            taken.append(task_id)
+    return taken
+
+
+def give_up_expired_tasks():
+    """Dead-letter the tasks whose worker died on their last attempt."""
+    for task in ClassificationTask.objects.filter(
+        status='running', lease_expires_at__lt=now(), attempts__gte=settings.CLASSIFICATION_MAX_ATTEMPTS
+    ):
+        dead_letter(task, "Worker lease expired")
+
+
+def load_results(result_ids):
+    """The results, as Journals where they are (their title counts too)."""
+    results = {scan_result.pk: scan_result for scan_result in ScanResult.objects.filter(pk__in=result_ids)}
+    results.update({journal.pk: journal for journal in Journal.objects.filter(pk__in=result_ids)})
+    return results
+
+
+def process_tasks(tasks):
+    """
+    Classify the results of claimed tasks in batched classifier calls. If
+    Gemini can't be reached, every task is retried after a backoff. If the
+    batch fails otherwise, its tasks are classified one by one, so that only
+    the ones that fail on their own are retried.
+    """
+    results = load_results([task.result_id for task in tasks])
+    try:
+        check_results_for_alerts([results[task.result_id] for task in tasks if task.result_id in results])
+    except TRANSIENT_ERRORS as e:
+        print(f"[Classification] Batch of {len(tasks)} results failed, backing off: {e}")
+        for task in tasks:
+            fail_task(task, e)
+        return
+    except Exception as e:
+        if len(tasks) > 1:
+            print(f"[Classification] Batch of {len(tasks)} results failed, classifying them one by one: {e}")
+            for task in tasks:
+                process_tasks([task])
+        else:
+            fail_task(tasks[0], e)
+        return
+    ClassificationTask.objects.filter(id__in=[task.id for task in tasks], claimed_by=WORKER_ID).delete()
+
+
+def retry_delay(attempts):
+    return min(settings.CLASSIFICATION_RETRY_BASE * 2 ** (attempts - 1), settings.CLASSIFICATION_RETRY_MAX)
+
+
+def fail_task(task, error):
+    """Retry the task after a backoff, or dead-letter it after its last attempt."""
+    message = f"{type(error).__name__}: {error}"
+    if task.attempts >= settings.CLASSIFICATION_MAX_ATTEMPTS:
+        dead_letter(task, message)
+        return
+    delay = retry_delay(task.attempts)
+    print(f"[Classification] Result {task.result_id} failed (attempt {task.attempts}), retrying in {delay}s: {message}")
+    ClassificationTask.objects.filter(id=task.id, claimed_by=WORKER_ID).update(
+        status='pending',
+        claimed_by=None,
+        lease_expires_at=None,
+        available_at=now() + timedelta(seconds=delay),
+        last_error=message,
+    )
+
+
+def dead_letter(task, message):
+    print(f"[Classification] Giving up on result {task.result_id} after {task.attempts} attempts: {message}")
+    with transaction.atomic():
+        ClassificationDeadLetter.objects.update_or_create(
+            result_id=task.result_id,
+            defaults={'urgent': task.urgent, 'priority': task.priority, 'attempts': task.attempts, 'error': message},
+        )
+        task.delete()
+
+
+def requeue(dead_letters):
+    """Queue dead-lettered results again, with fresh attempts. Returns how many."""
+    dead_letters = list(dead_letters)
+    with transaction.atomic():
+        ClassificationTask.objects.bulk_create(
+            [
+                ClassificationTask(
+                    result_id=dead.result_id, urgent=dead.urgent, priority=dead.priority, available_at=now()
+                )
+                for dead in dead_letters
+            ],
+            ignore_conflicts=True,
+        )
+        ClassificationDeadLetter.objects.filter(id__in=[dead.id for dead in dead_letters]).delete()
+    transaction.on_commit(_wake.set)
+    return len(dead_letters)
+
+
+def work(batch_size, poll_interval, once=False):
+    """
+    Worker loop: classify batches of claimed tasks, waiting up to
+    `poll_interval` seconds (less if tasks are queued in this process) when
+    there are none.
+    """
+    while True:
+        close_old_connections()
+        try:
+            tasks = claim_tasks(batch_size)
+            if tasks:
+                process_tasks(tasks)
+                continue
+        except Exception as e:
+            print(f"[Classification] Worker error: {e}")
+        if once:
+            return
+        _wake.wait(poll_interval)
+        _wake.clear()
+
+
+def run_classification_workers(concurrency, batch_size, poll_interval, once=False):
+    """Run `concurrency` worker loops in this process until they return."""
+    threads = [
+        threading.Thread(target=work, args=(batch_size, poll_interval, once), name=f"classification-{index}")
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def start_workers():
+    """
+    Start the CLASSIFICATION_WORKERS background workers of this process, on
+    the first results it queues.
+    """
+    with _workers_lock:
+        if _workers:
+            return
+        for index in range(settings.CLASSIFICATION_WORKERS):
+            thread = threading.Thread(
+                target=work,
+                args=(settings.CLASSIFICATION_BATCH_SIZE, settings.CLASSIFICATION_POLL_INTERVAL),
+                name=f"classification-{index}",
+                daemon=True,
+            )
+            thread.start()
+            _workers.append(thread)
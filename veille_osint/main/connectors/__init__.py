@@ -0,0 +1,3 @@
+from .base import Article, Connector, ConnectorError, get_connector, get_connector_class, register
+from .feeds import JSONFeedConnector, RSSConnector
+from .newsapi import NewsAPIConnector
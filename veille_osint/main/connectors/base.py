@@ -0,0 +1,160 @@
+import asyncio
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from dateutil import parser
+from django.conf import settings
+from django.utils.timezone import is_naive, make_aware
+
+from ..payload_archive import ArchivingReader
+from ..rate_limits import PRIORITY_SCHEDULED
+from ..upstreams import BlockingReader, body_reader, get_upstream, run_blocking
+
+# An article as every connector returns it, with the Journal field names.
+# page_title and full_text are only set by the enrichment stage.
+Article = namedtuple(
+    'Article',
+    ['source', 'titre', 'details', 'date_posted', 'auteur', 'page_title', 'full_text'],
+    defaults=(None, None),
+)
+
+CONNECTORS = {}
+
+
+class ConnectorError(Exception):
+    pass
+
+
+def register(name):
+    """Class decorator making a connector available to Sites.connector == name."""
+    def decorator(cls):
+        cls.name = name
+        CONNECTORS[name] = cls
+        return cls
+    return decorator
+
+
+def get_connector_class(name):
+    try:
+        return CONNECTORS[name]
+    except KeyError:
+        raise ConnectorError(f"Unknown connector {name!r}")
+
+
+def get_connector(site, semaphore=None, until=None, client=None):
+    return get_connector_class(site.connector)(site, semaphore, until, client)
+
+
+def parse_date(value):
+    """
+    Aware datetime of an ISO 8601 or RFC 822 date, or None if it can't be read.
+    """
+    if not value:
+        return None
+    try:
+        date = parser.parse(value) if isinstance(value, str) else value
+    except (ValueError, OverflowError):
+        return None
+    return make_aware(date) if is_naive(date) else date
+
+
+def is_local(url):
+    return url.startswith('file://') or not urlparse(url).scheme
+
+
+class Connector:
+    """
+    Fetches the articles of one Sites row.
+
+    Subclasses implement `fetch(since, terms)`, an async generator yielding
+    the Articles published after `since` (all of them if None), and
+    `parse(reader)`, the articles of one response body. Query-based
+    connectors only return articles matching `terms`; feeds return everything
+    and leave the matching to the caller. A failure before anything could be
+    fetched raises; a later partial failure sets `complete` to False, and
+    `truncated` is set when older matches were left unread because the
+    upstream capped the results it let through.
+
+    Requests go through the upstream clients, on the event loop's AsyncClient
+    (blocking calls in worker threads without one), with at most `semaphore`
+    (Sites.max_concurrency by default) in flight for the site. Bodies are
+    streamed and parsed as they arrive, so a large response never sits whole
+    in memory. URLs may also be local paths or file:// URLs, read from disk,
+    so feed fixtures can stand in for real sites. With
+    PAYLOAD_ARCHIVE_ENABLED, the bodies read from upstreams are archived and
+    listed in `archived`.
+    """
+
+    name = None
+    query_based = False
+
+    def __init__(self, site, semaphore=None, until=None, client=None):
+        self.site = site
+        self.semaphore = semaphore or asyncio.Semaphore(site.max_concurrency)
+        self.until = until
+        self.client = client
+        self.priority = PRIORITY_SCHEDULED
+        self.complete = True
+        self.truncated = False
+        self.archived = []
+
+    @classmethod
+    def endpoint(cls, site):
+        """What is read for `site`: sites with the same endpoint return the same articles."""
+        return site.url
+
+    def fork(self):
+        """A new connector for the same site, sharing its semaphore, window and client."""
+        return type(self)(self.site, self.semaphore, self.until, self.client)
+
+    async def fetch(self, since, terms):
+        raise NotImplementedError
+        yield
+
+    def parse(self, reader):
+        """Async iterable of the Articles in the body read by `reader`."""
+        raise NotImplementedError
+
+    async def get(self, url, upstream, **kwargs):
+        """
+        GET `url` through the client of `upstream` and return the response.
+        """
+        async with self.semaphore:
+            return await self.request(url, upstream, **kwargs)
+
+    async def request(self, url, upstream, **kwargs):
+        upstream = get_upstream(upstream, profile='feeds')
+        if self.client is not None:
+            return await self.client.request(upstream, 'GET', url, priority=self.priority, **kwargs)
+        return await asyncio.to_thread(run_blocking, upstream.get, url, priority=self.priority, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, url, upstream=None, **kwargs):
+        """
+        Async reader of the body of `url`, read as it arrives: from disk for
+        local files, else through the client of `upstream` (the URL's host by
+        default). The site's semaphore is held until the body is read.
+        """
+        async with self.semaphore:
+            if is_local(url):
+                path = Path(unquote(urlparse(url).path) if url.startswith('file://') else url)
+                with path.open('rb') as file:
+                    yield BlockingReader(file)
+                return
+
+            response = await self.request(url, upstream or urlparse(url).netloc, stream=True, **kwargs)
+            archive = None
+            try:
+                response.raise_for_status()
+                reader = body_reader(response)
+                if settings.PAYLOAD_ARCHIVE_ENABLED:
+                    reader = archive = ArchivingReader(reader, self, response.url)
+                yield reader
+            finally:
+                if archive is not None:
+                    await archive.aclose()
+                    if archive.payload:
+                        self.archived.append(archive.payload)
+                response.close()
@@ -0,0 +1,179 @@
+import warnings
+
+from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning
+from lxml import etree
+
+from .base import Article, Connector, ConnectorError, parse_date, register
+from .streaming import CHUNK_SIZE, JSONStream
+
+
+def strip_html(text):
+    """Plain text of an HTML fragment (feed descriptions often contain markup)."""
+    if not text or '<' not in text:
+        return text
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', MarkupResemblesLocatorWarning)
+        return BeautifulSoup(text, 'html.parser').get_text(' ', strip=True)
+
+
+def make_article(source, titre, details, date_posted, auteur):
+    date = parse_date(date_posted)
+    if date is None:
+        print(f"Skipping feed item {source} with invalid date {date_posted}")
+        return None
+    return Article(
+        source=source or 'No URL',
+        titre=strip_html(titre) or 'No Title',
+        details=strip_html(details) or 'No details available',
+        date_posted=date,
+        auteur=auteur or 'Unknown',
+    )
+
+
+def local_name(element):
+    return etree.QName(element).localname if isinstance(element.tag, str) else None
+
+
+def child_text(element, *names):
+    """Text of the first of the named children present in `element`."""
+    for name in names:
+        for child in element:
+            if local_name(child) == name:
+                text = ''.join(child.itertext()).strip()
+                if text:
+                    return text
+    return None
+
+
+def child(element, name):
+    return next((child for child in element if local_name(child) == name), None)
+
+
+def atom_link(entry):
+    links = [link for link in entry if local_name(link) == 'link']
+    link = next((link for link in links if link.get('rel', 'alternate') == 'alternate'), None)
+    link = link if link is not None else next(iter(links), None)
+    return link.get('href') if link is not None else None
+
+
+def parse_entry(entry):
+    author = child(entry, 'author')
+    return make_article(
+        source=atom_link(entry),
+        titre=child_text(entry, 'title'),
+        details=child_text(entry, 'summary', 'content'),
+        date_posted=child_text(entry, 'published', 'updated'),
+        auteur=child_text(author, 'name') if author is not None else None,
+    )
+
+
+def parse_item(item):
+    return make_article(
+        source=child_text(item, 'link', 'guid'),
+        titre=child_text(item, 'title'),
+        details=child_text(item, 'description', 'encoded'),
+        date_posted=child_text(item, 'pubDate', 'date'),
+        auteur=child_text(item, 'creator', 'author'),
+    )
+
+
+async def parse_feed(reader):
+    """
+    Yield the articles of an RSS 2.0 (or RDF) or Atom document as its items
+    are read, dropping each item once parsed.
+    """
+    parser = etree.XMLPullParser(events=('start', 'end'), resolve_entities=False, no_network=True)
+    root = None
+    while True:
+        chunk = await reader.read(CHUNK_SIZE)
+        try:
+            if chunk:
+                parser.feed(chunk)
+            else:
+                parser.close()
+        except etree.XMLSyntaxError as e:
+            raise ConnectorError(f"Invalid feed: {e}")
+
+        for event, element in parser.read_events():
+            if root is None:
+                root = local_name(element)
+                if root not in ('feed', 'rss', 'RDF'):
+                    raise ConnectorError("Not an RSS or Atom feed")
+            if event != 'end' or local_name(element) not in ('entry', 'item'):
+                continue
+            article = parse_entry(element) if root == 'feed' else parse_item(element)
+            element.clear()
+            parent = element.getparent()
+            while parent is not None and parent[0] is not element:
+                del parent[0]
+            if article:
+                yield article
+        if not chunk:
+            break
+    if root is None:
+        raise ConnectorError("Not an RSS or Atom feed")
+
+
+def json_author(item):
+    authors = item.get('authors') or ([item['author']] if item.get('author') else [])
+    names = [author.get('name') if isinstance(author, dict) else author for author in authors]
+    return ", ".join(name for name in names if name) or None
+
+
+async def parse_json_feed(reader):
+    """
+    Yield the articles of a JSON Feed (jsonfeed.org), or of any JSON list of
+    articles, bare or under "items" or "articles", using the usual field
+    names, as they are read.
+    """
+    stream = JSONStream(reader, ['item', 'items.item', 'articles.item'])
+    async for item in stream.items():
+        if not isinstance(item, dict):
+            continue
+        article = make_article(
+            source=item.get('url') or item.get('link') or item.get('external_url') or item.get('id'),
+            titre=item.get('title'),
+            details=(
+                item.get('summary') or item.get('description') or item.get('content_text')
+                or item.get('content_html') or item.get('content')
+            ),
+            date_posted=(
+                item.get('date_published') or item.get('publishedAt') or item.get('pubDate')
+                or item.get('date') or item.get('date_modified')
+            ),
+            auteur=json_author(item),
+        )
+        if article:
+            yield article
+    if not stream.found:
+        raise ConnectorError("No list of items in the JSON feed")
+
+
+class FeedConnector(Connector):
+    """
+    A document listing the site's latest articles, parsed as it streams in
+    and filtered by publication date.
+    """
+
+    async def fetch(self, since, terms):
+        if not self.site.url:
+            raise ConnectorError(f"Site {self.site} has no feed URL")
+        count = 0
+        async with self.stream(self.site.url) as reader:
+            async for article in self.parse(reader):
+                count += 1
+                if since is None or article.date_posted > since:
+                    yield article
+        print(f"Feed {self.site}: {count} articles")
+
+
+@register('rss')
+class RSSConnector(FeedConnector):
+    def parse(self, reader):
+        return parse_feed(reader)
+
+
+@register('json_feed')
+class JSONFeedConnector(FeedConnector):
+    def parse(self, reader):
+        return parse_json_feed(reader)
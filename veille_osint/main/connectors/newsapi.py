@@ -0,0 +1,174 @@
+import asyncio
+
+import requests
+from django.conf import settings
+from django.utils.timezone import now
+
+from .base import Article, Connector, ConnectorError, is_local, parse_date, register
+from .streaming import JSONStream
+
+NEWS_API_URL = "https://newsapi.org/v2/everything"
+
+
+def build_query(terms):
+    """
+    NewsAPI q= matching any of the terms, phrases kept together.
+    """
+    return " OR ".join(f'"{term}"' if " " in term else term for term in terms)
+
+
+def count_pages(total_results, page_size, max_results=None):
+    """
+    Number of pages needed to read total_results, capped at the number of
+    results the NewsAPI plan lets us page through.
+    """
+    if max_results:
+        total_results = min(total_results, max_results)
+    return -(-total_results // page_size)
+
+
+def parse_article(item):
+    """Article of a NewsAPI result, or None if its date can't be read."""
+    source = item.get('url') or 'No URL'
+    date_posted = parse_date(item.get('publishedAt')) if item.get('publishedAt') else now()
+    if date_posted is None:
+        print(f"Skipping article {source} with invalid date {item.get('publishedAt')}")
+        return None
+    return Article(
+        source=source,
+        titre=item.get('title') or 'No Title',
+        details=item.get('description') or 'No details available',
+        date_posted=date_posted,
+        auteur=item.get('author') or 'Unknown',
+    )
+
+
+@register('newsapi')
+class NewsAPIConnector(Connector):
+    """
+    /v2/everything, sorted by publication date. Page 1 gives totalResults;
+    the remaining pages are requested concurrently. Articles are parsed from
+    each page as it streams in and yielded one at a time, at most
+    INGESTION_BATCH_SIZE of them waiting while pages arrive faster than they
+    are stored. A site whose URL is a local file serves that JSON as its
+    only page.
+
+    When more articles match than NEWS_API_MAX_RESULTS lets us page
+    through, the window is read backward: the query is sent again ending at
+    the oldest article read, up to NEWS_API_BACKFILL_QUERIES times.
+    `truncated` is only left set if older matches still couldn't be read
+    (too many of them, or one of these queries failed).
+    """
+
+    query_based = True
+
+    @classmethod
+    def endpoint(cls, site):
+        # The site only names a source of interest, the articles come from NewsAPI
+        return site.url if site.url and is_local(site.url) else NEWS_API_URL
+
+    def params(self, since, terms, until):
+        params = {
+            'q': build_query(terms),
+            'apiKey': settings.NEWS_API_KEY,
+            'pageSize': settings.NEWS_API_PAGE_SIZE,
+            'sortBy': 'publishedAt',
+            'to': until.isoformat(),
+        }
+        if since:
+            params['from'] = since.isoformat()  # Filter by the schedules' watermarks
+        return params
+
+    async def fetch_page(self, params, page, values=None):
+        """
+        Yield the articles of a result page, storing its top-level
+        totalResults in `values`.
+        """
+        if self.site.url and is_local(self.site.url):
+            if page > 1:
+                return
+            url, kwargs = self.site.url, {}
+        else:
+            url, kwargs = NEWS_API_URL, {'upstream': 'newsapi', 'params': {**params, 'page': page}}
+
+        async with self.stream(url, **kwargs) as reader:
+            async for article in self.parse(reader, values):
+                yield article
+
+    async def parse(self, reader, values=None):
+        stream = JSONStream(reader, ['articles.item'], scalars=['totalResults'])
+        async for item in stream.items():
+            article = parse_article(item) if isinstance(item, dict) else None
+            if article:
+                yield article
+        if values is not None:
+            values.update(stream.values)
+
+    async def fetch(self, since, terms):
+        until = self.until or now()
+        for query in range(settings.NEWS_API_BACKFILL_QUERIES + 1):
+            self.truncated = False
+            oldest = None
+            try:
+                async for article in self.fetch_window(since, terms, until):
+                    if oldest is None or article.date_posted < oldest:
+                        oldest = article.date_posted
+                    yield article
+            except (requests.RequestException, ConnectorError) as e:
+                if not query:
+                    raise
+                # What the earlier queries read is kept
+                print(f"[NewsAPI] Error reading the matches of {terms} older than {until.isoformat()}: {e}")
+                self.truncated = True
+                break
+            if not self.truncated:
+                return
+            if oldest is None or oldest >= until:
+                break  # No older article to resume from
+            until = oldest
+            if query < settings.NEWS_API_BACKFILL_QUERIES:
+                print(f"[NewsAPI] Reading the matches of {terms} older than {until.isoformat()}")
+        print(f"[NewsAPI] The matches of {terms} between {since.isoformat() if since else 'the start'} and {until.isoformat()} can't be read")
+
+    async def fetch_window(self, since, terms, until):
+        """The articles matching `terms` published between `since` and `until`, newest first."""
+        params = self.params(since, terms, until)
+        values = {}
+        async for article in self.fetch_page(params, 1, values):
+            yield article
+
+        total_results = values.get('totalResults') or 0
+        page_count = count_pages(total_results, settings.NEWS_API_PAGE_SIZE, settings.NEWS_API_MAX_RESULTS)
+        print(f"Query {terms}: {total_results} matching articles over {page_count} page(s)")
+        if settings.NEWS_API_MAX_RESULTS and total_results > settings.NEWS_API_MAX_RESULTS:
+            # The older matches can't be paged to, only queried again (see fetch)
+            print(f"[NewsAPI] Only the newest {settings.NEWS_API_MAX_RESULTS} results of {terms} can be read")
+            self.truncated = True
+
+        queue = asyncio.Queue(maxsize=settings.INGESTION_BATCH_SIZE)
+
+        async def read_page(page):
+            try:
+                async for article in self.fetch_page(params, page):
+                    await queue.put(article)
+            except (requests.RequestException, ConnectorError) as e:
+                print(f"[NewsAPI] Error fetching page {page} of {terms}: {e}")
+                self.complete = False
+            except Exception as e:
+                await queue.put(e)
+            await queue.put(None)
+
+        tasks = [asyncio.ensure_future(read_page(page)) for page in range(2, page_count + 1)]
+        try:
+            running = len(tasks)
+            while running:
+                item = await queue.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
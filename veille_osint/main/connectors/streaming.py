@@ -0,0 +1,87 @@
+import json
+
+try:
+    import ijson
+except ImportError:  # Optional: without it, JSON documents are read whole
+    ijson = None
+
+from .base import ConnectorError
+
+# Bytes read from a response or file at a time
+CHUNK_SIZE = 64 * 1024
+
+SCALAR_EVENTS = {'null', 'boolean', 'integer', 'double', 'number', 'string'}
+
+
+async def read_all(reader):
+    chunks = []
+    while chunk := await reader.read(CHUNK_SIZE):
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+class JSONStream:
+    """
+    The items of a JSON document, parsed incrementally from an async reader
+    so that only the item being read is held in memory.
+
+    `prefixes` are ijson paths of the items, such as 'articles.item' for the
+    elements of the top-level "articles" list, or 'item' for a bare list.
+    The top-level scalars named in `scalars` are stored in `values` as they
+    go by, and `found` tells whether one of the item lists was there at all.
+
+    Without ijson installed, the whole document is read and parsed at once.
+    """
+
+    def __init__(self, reader, prefixes, scalars=()):
+        self.reader = reader
+        self.prefixes = set(prefixes)
+        self.lists = {prefix.rpartition('.')[0] for prefix in self.prefixes}
+        self.scalars = set(scalars)
+        self.values = {}
+        self.found = False
+
+    async def items(self):
+        if ijson is None:
+            for item in self.parse(await read_all(self.reader)):
+                yield item
+            return
+
+        builder = None
+        try:
+            async for path, event, value in ijson.parse_async(self.reader, use_float=True):
+                if builder is not None:
+                    builder.event(event, value)
+                    if path in self.prefixes and event in ('end_map', 'end_array'):
+                        yield builder.value
+                        builder = None
+                elif path in self.prefixes:
+                    if event in ('start_map', 'start_array'):
+                        builder = ijson.ObjectBuilder()
+                        builder.event(event, value)
+                    else:
+                        yield value
+                elif event == 'start_array' and path in self.lists:
+                    self.found = True
+                elif event in SCALAR_EVENTS and path in self.scalars:
+                    self.values[path] = value
+        except ijson.JSONError as e:
+            raise ConnectorError(f"Invalid JSON: {str(e).splitlines()[0]}")
+
+    def parse(self, content):
+        """The items of a whole document, for when ijson is missing."""
+        try:
+            data = json.loads(content)
+        except ValueError as e:
+            raise ConnectorError(f"Invalid JSON: {e}")
+        if isinstance(data, dict):
+            self.values = {key: data[key] for key in self.scalars if key in data}
+
+        for prefix in self.prefixes:
+            items = data
+            for key in prefix.split('.')[:-1]:
+                items = items.get(key) if isinstance(items, dict) else None
+            if isinstance(items, list):
+                self.found = True
+                return items
+        return []
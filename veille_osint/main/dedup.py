@@ -0,0 +1,67 @@
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'ocid',
+    'cmpid', 'ref', 'ref_src', 'smid', 'sr_share', 'guccounter', 'ito',
+}
+
+# Shorter normalized texts (empty descriptions, placeholders) say nothing about
+# the article and would make unrelated results collide.
+MIN_CONTENT_LENGTH = 40
+
+PLACEHOLDERS = {'no description', 'no details available', 'no title'}
+
+
+def canonical_url(url):
+    """
+    Reduce a URL to the form shared by every link to the same article:
+    lowercase host without "www.", no default port, no fragment, no tracking
+    parameters, sorted query and no trailing slash.
+    Returns an empty string for values that aren't URLs.
+    """
+    if not url:
+        return ''
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or 'http'
+    host = (parts.hostname or '').lower()
+    if not host:
+        return ''
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip('/') or '/'
+
+    # http and https links to the same article are the same article
+    return urlunsplit(('https' if scheme == 'http' else scheme, host, path, urlencode(query), ''))
+
+
+def normalize_content(*texts):
+    """
+    Lowercase the texts, drop punctuation and collapse whitespace.
+    """
+    content = " ".join(text for text in texts if text and text.strip().lower() not in PLACEHOLDERS)
+    return " ".join(re.sub(r'[\W_]+', ' ', content.lower()).split())
+
+
+def url_fingerprint(url):
+    canonical = canonical_url(url)
+    if not canonical:
+        return None
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def content_fingerprint(titre, details):
+    content = normalize_content(titre, details)
+    if len(content) < MIN_CONTENT_LENGTH:
+        return None
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
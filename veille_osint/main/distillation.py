@@ -0,0 +1,209 @@
+import os
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .alerts import in_holdout, result_content
+from .classification_queue import load_results
+from .local_model import open_local_model
+from .models import Alert, ClassifierModel, TrainingExample
+from .training import fit, save_model, split, warm_start
+
+# Alerts backfilled per query
+BACKFILL_CHUNK = 500
+
+
+class DistillationError(Exception):
+    """The local model can't be distilled (no model to start from, too few examples)."""
+
+
+def distilled_labels():
+    """Labels of distilled models: the severities of AlertClassifier."""
+    return [settings.LOCAL_MODEL_NONE_LABEL, 'low', 'medium', 'high']
+
+
+def collect_examples():
+    """
+    Bring the examples up to date with what was labelled outside of
+    classification: alerts raised before examples were kept, and false
+    alerts, whose results are relabelled "none". Alerts with a severity the
+    distilled model doesn't have are left out. Returns (added, corrected).
+    """
+    alerts = Alert.objects.filter(
+        result__training_example__isnull=True, result__scan__replay_of__isnull=True
+    ).order_by('id').values_list('id', 'result_id', 'severity', 'model_version', 'false_alerts')
+    labels = distilled_labels()
+    added = 0
+    last_id = 0
+    while True:
+        # Skipped alerts keep matching the filter: page on the id
+        chunk = list(alerts.filter(id__gt=last_id)[:BACKFILL_CHUNK])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        results = load_results([result_id for _, result_id, _, _, _ in chunk])
+        examples = []
+        for _, result_id, severity, model_version, false_alert in chunk:
+            label = 'none' if false_alert else (severity or '').lower()
+            if label_name(label) not in labels:
+                continue
+            text = result_content(results[result_id])
+            examples.append(TrainingExample(
+                result_id=result_id,
+                text=text,
+                label=label,
+                source='false_alert' if false_alert else 'gemini',
+                model_version=model_version,
+                holdout=in_holdout(text),
+            ))
+        TrainingExample.objects.bulk_create(examples, ignore_conflicts=True)
+        added += len(examples)
+
+    corrected = TrainingExample.objects.filter(result__alert__false_alerts__isnull=False).exclude(
+        source='false_alert'
+    ).update(label='none', source='false_alert', updated_at=timezone.now())
+    return added, corrected
+
+
+def labelled(examples):
+    """(text, label) of TrainingExamples, leaving out labels the distilled model doesn't have."""
+    labels = distilled_labels()
+    pairs = ((text, label.lower()) for text, label in examples.values_list('text', 'label'))
+    return [(text, label) for text, label in pairs if label_name(label) in labels]
+
+
+def encode(model, examples, labels):
+    """Padded token ids and label ids of (text, label) examples, for `model`'s tokenizer."""
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+    label_ids = {label: index for index, label in enumerate(labels)}
+    sequences = pad_sequences(
+        model.encode([text for text, _ in examples]),
+        maxlen=model.max_sequence_length,
+        padding='post',
+        truncating='post',
+    ).astype(np.int32)
+    return sequences, np.array([label_ids[label_name(label)] for _, label in examples], dtype=np.int32)
+
+
+def label_name(label):
+    return settings.LOCAL_MODEL_NONE_LABEL if label == 'none' else label
+
+
+def evaluate(model, examples):
+    """
+    How `model` would screen the (text, label) holdout examples: the share
+    it rates irrelevant with LOCAL_MODEL_NONE_THRESHOLD confidence, so never
+    sent to Gemini ("local"), and the share of alerts among them lost
+    ("missed_alerts"). Models over the severities get an accuracy too.
+    """
+    probabilities = model.predict_proba([text for text, _ in examples])
+    screened = probabilities[:, model.labels.index(settings.LOCAL_MODEL_NONE_LABEL)] >= settings.LOCAL_MODEL_NONE_THRESHOLD
+    alerts = np.array([label != 'none' for _, label in examples])
+    metrics = {
+        'examples': len(examples),
+        'local': float(screened.mean()),
+        'missed_alerts': float((screened & alerts).sum() / max(alerts.sum(), 1)),
+    }
+    if model.labels == distilled_labels():
+        predicted = [model.labels[index] for index in probabilities.argmax(axis=1)]
+        metrics['accuracy'] = float(np.mean([p == label_name(label) for p, (_, label) in zip(predicted, examples)]))
+    return metrics
+
+
+def beats(candidate, current):
+    """
+    Whether a version screens the holdout better: it loses no more alerts
+    and keeps no less traffic from Gemini, and does better on one of them.
+    """
+    if candidate['missed_alerts'] > current['missed_alerts'] or candidate['local'] < current['local']:
+        return False
+    return candidate['missed_alerts'] < current['missed_alerts'] or candidate['local'] > current['local']
+
+
+def active_local_version():
+    """(version, config) of the local model being served, from the registry's table or the settings."""
+    active = ClassifierModel.objects.filter(kind='local', active=True).first()
+    if active:
+        return active.version, active.config
+    return os.path.basename(settings.LOCAL_MODEL_PATH), {'path': settings.LOCAL_MODEL_PATH}
+
+
+def distill(output=None, epochs=5, batch_size=32, patience=2, min_examples=None, promote=True, verbose=1):
+    """
+    Fine-tune the served local model on the examples labelled since it was
+    trained, starting from its weights, and register the result as a new
+    version. The new version is activated (every process swaps to it) only
+    if it beats the served one on the holdout. Returns the new
+    ClassifierModel and both evaluations.
+    """
+    if not output:
+        base = os.path.splitext(settings.LOCAL_MODEL_PATH)[0]
+        output = f"{base}-distilled-{timezone.now():%Y%m%d-%H%M%S}.h5"
+    if ClassifierModel.objects.filter(kind='local', version=os.path.basename(output)).exists():
+        raise DistillationError(f"Version {os.path.basename(output)} is already registered")
+
+    base_version, base_config = active_local_version()
+    current = open_local_model(base_config.get('path'))
+    if current is None:
+        raise DistillationError(f"Local model {base_version} can't be loaded")
+
+    added, corrected = collect_examples()
+    if added or corrected:
+        print(f"[Distillation] {added} alerts added as examples, {corrected} relabelled by false alerts")
+
+    # Examples changed from now on are left to the next run
+    until = timezone.now()
+    examples = TrainingExample.objects.filter(holdout=False, updated_at__lte=until)
+    trained_until = base_config.get('trained_until')
+    if trained_until:
+        examples = examples.filter(updated_at__gt=parse_datetime(trained_until))
+    examples = labelled(examples)
+    min_examples = settings.DISTILLATION_MIN_EXAMPLES if min_examples is None else min_examples
+    if len(examples) < max(min_examples, 2):
+        raise DistillationError(f"{len(examples)} new examples since {base_version}, {min_examples} needed")
+
+    labels = distilled_labels()
+    sequences, label_ids = encode(current, examples, labels)
+    train_rows, validation_rows, _ = split(label_ids, test_size=0)
+    model = warm_start(
+        current.model, len(labels), current.labels == labels, settings.DISTILLATION_LEARNING_RATE
+    )
+    epochs = fit(model, sequences, label_ids, train_rows, validation_rows, epochs, batch_size, patience, verbose=verbose)
+
+    save_model(model, output, current.tokenizer.to_json(), {
+        'labels': labels,
+        'max_sequence_length': current.max_sequence_length,
+        'stop_words': sorted(current.stop_words),
+        'base': base_version,
+        'examples': len(examples),
+        'epochs': epochs,
+    })
+    candidate = open_local_model(output)
+    if candidate is None:
+        raise DistillationError(f"The distilled model {output} can't be loaded")
+
+    holdout = labelled(TrainingExample.objects.filter(holdout=True))
+    evaluations = {'current': evaluate(current, holdout), 'candidate': evaluate(candidate, holdout)} if holdout else {}
+    promoted = (
+        promote
+        and len(holdout) >= max(settings.DISTILLATION_MIN_HOLDOUT, 1)
+        and beats(evaluations['candidate'], evaluations['current'])
+    )
+    version = ClassifierModel.objects.create(
+        kind='local',
+        version=os.path.basename(output),
+        config={
+            'path': output,
+            'base': base_version,
+            # Examples changed after this are new to the version
+            'trained_until': until.isoformat(),
+            'examples': len(examples),
+            'holdout': evaluations.get('candidate'),
+        },
+        active=promoted,
+    )
+    print(f"[Distillation] {version.version}: {len(examples)} examples, {epochs} epochs, {'promoted' if promoted else 'not promoted'}")
+    return version, evaluations
@@ -0,0 +1,154 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import multiprocessing
+import threading
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.utils.timezone import now
+
+from .connectors.streaming import CHUNK_SIZE
+from .dedup import url_fingerprint
+from .models import ArticleText
+from .rate_limits import PRIORITY_SCHEDULED
+from .text_extraction import extract_article
+from .upstreams import body_reader, get_upstream
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool():
+    """
+    Return the process-wide pool parsing article pages, creating it on first
+    use. Its processes are spawned rather than forked from this one, whose
+    threads may hold locks.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.ARTICLE_EXTRACTION_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def cached_texts(url_hashes):
+    """(title, text) of the pages extracted less than ARTICLE_TEXT_CACHE_TTL ago."""
+    fresh_since = now() - timedelta(seconds=settings.ARTICLE_TEXT_CACHE_TTL)
+    return {
+        url_hash: (title, text)
+        for url_hash, title, text in ArticleText.objects.filter(
+            url_hash__in=url_hashes, extracted_at__gte=fresh_since
+        ).values_list('url_hash', 'title', 'text')
+    }
+
+
+def store_texts(texts, urls):
+    """
+    Cache freshly extracted pages, replacing their expired entries and
+    dropping every other expired one.
+    """
+    ArticleText.objects.filter(
+        extracted_at__lt=now() - timedelta(seconds=settings.ARTICLE_TEXT_CACHE_TTL)
+    ).delete()
+    ArticleText.objects.bulk_create(
+        [
+            ArticleText(url_hash=url_hash, url=urls[url_hash], title=title[:300], text=text, extracted_at=now())
+            for url_hash, (title, text) in texts.items()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class ArticleEnricher:
+    """
+    Enrichment stage of an ingestion event loop: adds the title and main text
+    of their pages to fetched articles before they are stored.
+
+    Pages are downloaded through the AsyncClient, at most
+    ARTICLE_EXTRACTION_CONCURRENCY at a time, each host governed like the
+    'articles' upstream, and parsed in the extraction process pool. The cache
+    is read and written on the storage thread. An article whose page can't be
+    read is stored with its description only.
+    """
+
+    def __init__(self, client, storage):
+        self.client = client
+        self.storage = storage
+        self.semaphore = asyncio.Semaphore(settings.ARTICLE_EXTRACTION_CONCURRENCY)
+
+    async def enrich(self, articles, priority=PRIORITY_SCHEDULED):
+        urls = {}
+        for article in articles:
+            url_hash = url_fingerprint(article.source)
+            if url_hash:
+                urls[url_hash] = article.source
+        if not urls:
+            return articles
+
+        texts = await (await self.storage.submit(cached_texts, list(urls)))
+        missing = [url_hash for url_hash in urls if url_hash not in texts]
+        extracted = await asyncio.gather(*(self.extract(urls[url_hash], priority) for url_hash in missing))
+        fresh = {url_hash: text for url_hash, text in zip(missing, extracted) if text is not None}
+        if fresh:
+            await self.storage.submit(store_texts, fresh, urls)
+            texts.update(fresh)
+
+        enriched = []
+        for article in articles:
+            title, text = texts.get(url_fingerprint(article.source), ('', ''))
+            enriched.append(article._replace(page_title=title or None, full_text=text or None))
+        print(f"Full text of {sum(bool(article.full_text) for article in enriched)}/{len(articles)} articles, {len(fresh)} pages extracted")
+        return enriched
+
+    async def extract(self, url, priority):
+        """
+        (title, text) of the page at `url`, empty strings if it isn't an
+        article, or None if it couldn't be read this time.
+        """
+        async with self.semaphore:
+            try:
+                content = await self.download(url, priority)
+            except requests.RequestException as e:
+                print(f"[Enrichment] Could not download {url}: {e}")
+                return None
+        if content is None:
+            return '', ''
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                get_extraction_pool(), extract_article, content, settings.ARTICLE_TEXT_MAX_CHARS
+            )
+        except Exception as e:
+            print(f"[Enrichment] Could not extract the text of {url}: {e}")
+            return None
+
+    async def download(self, url, priority):
+        """
+        The first ARTICLE_MAX_BYTES of an HTML page, or None if `url` isn't
+        one (or is gone). Raises if the host couldn't answer.
+        """
+        if urlparse(url).scheme not in ('http', 'https'):
+            return None
+        upstream = get_upstream(urlparse(url).netloc, profile='articles')
+        response = await self.client.request(upstream, 'GET', url, priority=priority, stream=True)
+        try:
+            if response.status_code >= 500:
+                response.raise_for_status()
+            if response.status_code >= 400 or 'html' not in response.headers.get('Content-Type', 'text/html'):
+                return None
+            reader = body_reader(response)
+            chunks, size = [], 0
+            while size < settings.ARTICLE_MAX_BYTES:
+                chunk = await reader.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+            return b''.join(chunks)[:settings.ARTICLE_MAX_BYTES]
+        finally:
+            response.close()
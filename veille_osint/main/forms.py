@@ -19,7 +19,7 @@ class ScanForm(forms.ModelForm):
         widgets = {
             'sites': forms.SelectMultiple(attrs={'class': 'form-control'}),
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Nom du scan ex: Scan 1'}),
-            'keywords': forms.Textarea(attrs={'class': 'form-control', 'placeholder': 'Donnez les mots cles (optionel)', 'rows': 3}),
+            'keywords': forms.Textarea(attrs={'class': 'form-control', 'placeholder': 'Mots cles separes par des virgules, un article en contenant un seul suffit (optionel)', 'rows': 3}),
         }
 
     def save(self, commit=True):
@@ -0,0 +1,325 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from .connectors import get_connector, get_connector_class
+from .dedup import url_fingerprint
+from .enrichment import ArticleEnricher
+from .leases import WORKER_ID, claim_scans, claimable_scans, finish_scan
+from .models import Scan, Sites
+from .payload_archive import ArchivedConnector, record_payloads
+from .pipeline import JournalBatchWriter, StorageThread
+from .query_planner import ScanPlan, Source, plan_sources
+from .rate_limits import PRIORITY_SCHEDULED, get_governor
+from .upstreams import AsyncClient
+from .watermarks import WatermarkTracker
+
+_workers = []
+_workers_lock = threading.Lock()
+# Set when scans are submitted, so idle in-process workers take them at once
+_wake = threading.Event()
+
+
+def submit_scan(scan_id):
+    """
+    Hand a new scan over to the ingestion workers and return immediately.
+    """
+    if not settings.INGESTION_IN_PROCESS:
+        print(f"Scan {scan_id} left pending for the ingestion workers")
+        return
+    print(f"Queuing scan {scan_id} for ingestion")
+    start_workers()
+    _wake.set()
+
+
+def start_workers():
+    """
+    Start the INGESTION_WORKERS background workers of this process, at boot
+    or on the first scan it submits. Besides new scans, they take back
+    deferred and abandoned ones every INGESTION_POLL_INTERVAL seconds.
+    """
+    with _workers_lock:
+        if _workers:
+            return
+        for index in range(settings.INGESTION_WORKERS):
+            thread = threading.Thread(
+                target=run_worker,
+                args=(settings.INGESTION_PLAN_MAX_SCANS, settings.INGESTION_POLL_INTERVAL),
+                kwargs={'workers': settings.INGESTION_WORKERS},
+                name=f"ingestion-{index}",
+                daemon=True,
+            )
+            thread.start()
+            _workers.append(thread)
+
+
+def defer_scheduled_scans():
+    """
+    Whether NewsAPI's budget is only left for quick scans: scheduled ones
+    then stay pending until it recovers.
+    """
+    governor = get_governor('newsapi')
+    if governor.should_defer(PRIORITY_SCHEDULED):
+        print(f"[Ingestion] Deferring scheduled scans: {governor.usage()}")
+        return True
+    return False
+
+
+def process_scans(scans):
+    """
+    Fetch the articles of claimed scans from their sites and record each scan
+    as completed or failed, or put it back to pending when an upstream's
+    budget ran out (or its circuit opened) before it was fetched. Returns the
+    number of deferred scans.
+    """
+    plans = [ScanPlan(scan) for scan in scans]
+
+    try:
+        fetch_news_for_plans(plans)
+    except Exception as e:
+        for plan in plans:
+            plan.error = plan.error or e
+
+    for plan in plans:
+        if plan.error is None and plan.failures and not plan.fetched:
+            plan.error = plan.failures[0]
+        if plan.error is None:
+            try:
+                plan.writer.flush()
+                if not plan.deferred:
+                    plan.commit()
+            except Exception as e:
+                plan.error = e
+
+        if plan.error is not None:
+            print(f"[Ingestion] Scan {plan.scan.id} failed: {plan.error}")
+            finish_scan(plan.scan, 'failed')
+        elif plan.deferred:
+            print(f"[Ingestion] Scan {plan.scan.id} deferred until its sources are available again")
+            finish_scan(plan.scan, 'pending')
+        else:
+            finish_scan(plan.scan, 'completed')
+
+    return sum(plan.deferred and plan.error is None for plan in plans)
+
+
+def run_worker(batch_size, poll_interval, once=False, workers=1):
+    """
+    Worker loop: keep claiming batches of pending (or abandoned) scans and
+    process each batch as one plan, waiting up to `poll_interval` seconds
+    (less if scans are submitted in this process) when there are none or
+    they were all deferred. Several workers, in as many threads, processes
+    or hosts, can share one database; one of `workers` threads claims its
+    share of the pending scans (see claim_limit).
+    """
+    print(f"Ingestion worker {WORKER_ID} ({threading.current_thread().name}) started")
+    while True:
+        close_old_connections()
+        scans = []
+        try:
+            scans = claim_scans(claim_limit(batch_size, workers), quick_only=defer_scheduled_scans())
+            if scans:
+                print(f"Worker {WORKER_ID} claimed scans {[scan.id for scan in scans]}")
+                if process_scans(scans) < len(scans):
+                    continue
+        except Exception as e:
+            print(f"[Ingestion] Worker error: {e}")
+        if once and not scans:
+            return
+        _wake.wait(poll_interval)
+        _wake.clear()
+
+
+def claim_limit(batch_size, workers):
+    """
+    Scans one of `workers` threads claims at a time: an even share of the
+    pending ones, up to `batch_size`. Planning scans together saves requests,
+    but a backlog is spread over the threads rather than left to the first.
+    """
+    if workers <= 1:
+        return batch_size
+    return max(1, min(batch_size, -(-claimable_scans().count() // workers)))
+
+
+def fetch_news_for_plans(plans):
+    """
+    Fetch the sources planned for the scans (shared NewsAPI queries, one
+    fetch per feed) and route the articles to the scans they match.
+    Scheduled scans only fetch what is newer than their watermarks.
+    """
+    until = now()
+    for plan in plans:
+        plan.scan.scan_start_date = plan.since() or plan.scan.scan_start_date
+        plan.scan.scan_end_date = until
+
+    sources = plan_sources(plans)
+    print(f"Fetching news for scans {[plan.scan.id for plan in plans]} from {len(sources)} sources")
+    if sources:
+        asyncio.run(fetch_sources(sources, until))
+
+
+async def fetch_sources(sources, until):
+    """
+    Run every source's connector concurrently on one AsyncClient, with at
+    most Sites.max_concurrency requests in flight per site and
+    UPSTREAM_CONNECTIONS_PER_HOST connections per host. A scan takes about as
+    long as its slowest source. Articles are stored by batches on a single
+    storage thread, so the database never holds up the fetches, after the
+    text of their pages was extracted if ARTICLE_EXTRACTION_ENABLED.
+    """
+    semaphores = {}
+    storage = StorageThread()
+    try:
+        async with AsyncClient() as client:
+            enricher = ArticleEnricher(client, storage) if settings.ARTICLE_EXTRACTION_ENABLED else None
+            await asyncio.gather(*(
+                fetch_source(
+                    source,
+                    get_connector(
+                        source.site,
+                        semaphores.setdefault(source.site.id, asyncio.Semaphore(source.site.max_concurrency)),
+                        until,
+                        client,
+                    ),
+                    storage,
+                    enricher,
+                )
+                for source in sources
+            ))
+    finally:
+        await storage.close()
+
+
+async def fetch_source(source, connector, storage, enricher=None):
+    connector.priority = source.priority
+    batch = []
+    stored = []
+
+    async def store(batch):
+        if enricher is not None:
+            batch = await enricher.enrich(batch, source.priority)
+        stored.append(await storage.submit(store_articles, source, batch))
+
+    try:
+        try:
+            async for article in connector.fetch(source.since, source.terms):
+                batch.append(article)
+                if len(batch) >= settings.INGESTION_BATCH_SIZE:
+                    await store(batch)
+                    batch = []
+            if batch:
+                await store(batch)
+        finally:
+            # Batches handed over are stored even if the fetch failed later
+            await asyncio.gather(*stored)
+    except Exception as e:
+        print(f"[Ingestion] Could not fetch {source.site} for {source.terms}: {e}")
+        source.fail(e)
+        split = False
+    else:
+        # Terms packed into a capped query are fetched again in smaller queries.
+        # A single term can't be: its watermark moves past what was left unread,
+        # or every later scan would read the same newest articles again
+        split = connector.truncated and len(source.terms) > 1
+        if connector.truncated and not split:
+            print(f"[Ingestion] Older matches of {source.terms} on {source.site} were skipped, see above")
+        source.done(connector.complete)
+    if connector.archived:
+        await (await storage.submit(record_payloads, connector.archived, [plan.scan for plan in source.plans]))
+    if split:
+        print(f"[Ingestion] Results of {source.terms} were capped, splitting the query")
+        await asyncio.gather(*(fetch_source(half, connector.fork(), storage, enricher) for half in source.split()))
+
+
+def replay_scan(scan, keywords=None, classify=True):
+    """
+    Run the payloads archived for `scan` through today's parsers, storage and
+    classifier into a new scan, its replay, without any request upstream.
+    With other `keywords`, query results are only kept if they show one of
+    them, like feed articles. Returns the replay, completed or failed.
+    """
+    payloads = list(scan.payloads.select_related('site').order_by('fetched_at'))
+    replay = Scan.objects.create(
+        name=f"Rejeu de {scan.name or f'scan {scan.id}'}"[:100],
+        keywords=keywords or scan.keywords,
+        status='running',
+        replay_of=scan,
+    )
+    replay.sites.set({payload.site for payload in payloads if payload.site})
+
+    plan = ScanPlan(replay)
+    plan.writer = JournalBatchWriter(replay, classify=classify)
+    groups = {}
+    for payload in payloads:
+        groups.setdefault((payload.site_id, payload.connector), []).append(payload)
+
+    sources = []
+    for (site_id, connector_name), site_payloads in groups.items():
+        site = site_payloads[0].site or Sites(name=connector_name, connector=connector_name)
+        plan.trackers.setdefault(site.id, WatermarkTracker(None, plan.terms, site))
+        connector = get_connector_class(connector_name)(site)
+        query_based = connector.query_based and not keywords
+        sources.append((Source(site, plan.terms, [plan], None, query_based), ArchivedConnector(connector, site_payloads)))
+
+    print(f"Replaying {len(payloads)} payloads of scan {scan.id} as scan {replay.id}")
+    try:
+        asyncio.run(replay_sources(sources))
+        if plan.error is None and plan.failures and not plan.fetched:
+            plan.error = plan.failures[0]
+        if plan.error is None:
+            plan.writer.flush()
+    except Exception as e:
+        plan.error = plan.error or e
+
+    if plan.error is not None:
+        print(f"[Ingestion] Replay {replay.id} of scan {scan.id} failed: {plan.error}")
+    replay.status = 'failed' if plan.error is not None else 'completed'
+    replay.scan_start_date = scan.scan_start_date
+    replay.scan_end_date = scan.scan_end_date
+    replay.save(update_fields=['status', 'scan_start_date', 'scan_end_date'])
+    return replay
+
+
+async def replay_sources(sources):
+    storage = StorageThread()
+    try:
+        await asyncio.gather(*(fetch_source(source, connector, storage) for source, connector in sources))
+    finally:
+        await storage.close()
+
+
+def store_articles(source, articles):
+    """
+    Queue fetched articles on the batch writer of each scan they match,
+    unless they aren't newer than that scan's watermarks for the site. Runs
+    on the storage thread, the only one touching the plans' watermarks.
+    """
+    print(f"Storing {len(articles)} articles from {source.site}")
+
+    for article in articles:
+        url_hash = url_fingerprint(article.source)
+        for plan, terms in source.route(article.titre, article.details):
+            tracker = source.tracker(plan)
+            # Another source of the plan may have returned it already
+            if plan.error is not None or (url_hash or article.source) in plan.seen:
+                continue
+            if not tracker.is_new(terms, article.date_posted, url_hash):
+                continue
+            plan.seen.add(url_hash or article.source)
+            tracker.record(terms, article.date_posted, url_hash)
+
+            try:
+                plan.writer.add(
+                    source=article.source,
+                    details=article.details,
+                    date_posted=article.date_posted,
+                    titre=article.titre,
+                    auteur=article.auteur,
+                    page_title=article.page_title,
+                    full_text=article.full_text,
+                )
+            except Exception as e:
+                plan.error = e
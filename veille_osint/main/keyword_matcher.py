@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import ThreatKeyword
+
+Match = namedtuple('Match', ['term', 'severity', 'weight', 'start', 'end'])
+
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton matching every term in a single pass over a text.
+
+    Terms are matched case-insensitively and only as whole words, so "leak"
+    doesn't match inside "bleak". Adding a term only extends the trie and
+    relinks it before the next match; removing or reweighting one only touches `terms`, whose
+    entries decide which trie outputs are reported.
+    """
+
+    def __init__(self):
+        # Node i: goto[i] maps a character to a child, fail[i] is the fallback
+        # node and outputs[i] the terms ending at i (through fail links too)
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [set()]
+        self.terms = {}
+        self.linked = True
+
+    def add(self, term, severity, weight):
+        term = term.lower()
+        if term not in self.terms:
+            node = 0
+            for char in term:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(set())
+                    self.goto[node][char] = child
+                node = child
+            self.outputs[node].add(term)
+            self.linked = False
+        self.terms[term] = (severity, weight)
+
+    def remove(self, term):
+        self.terms.pop(term.lower(), None)
+
+    def _link(self):
+        """Recompute the failure links and outputs breadth-first."""
+        queue = deque()
+        for child in self.goto[0].values():
+            self.fail[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.outputs[child] |= self.outputs[self.fail[child]]
+                queue.append(child)
+        self.linked = True
+
+    def find(self, text):
+        """Return the whole-word matches of the active terms in `text`."""
+        if not self.linked:
+            self._link()
+        text = text.lower()
+        matches = []
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+
+            for term in self.outputs[node]:
+                payload = self.terms.get(term)
+                if payload is None:
+                    continue
+                start, end = index - len(term) + 1, index + 1
+                if start > 0 and is_word_char(text[start - 1]) and is_word_char(term[0]):
+                    continue
+                if end < len(text) and is_word_char(text[end]) and is_word_char(term[-1]):
+                    continue
+                matches.append(Match(term, payload[0], payload[1], start, end))
+        return matches
+
+    def find_many(self, texts):
+        return [self.find(text) for text in texts]
+
+
+class ThreatKeywordMatcher:
+    """
+    KeywordAutomaton kept in sync with the active ThreatKeyword rows.
+
+    The table's row count and last update time are checked at most every
+    THREAT_KEYWORDS_REFRESH_SECONDS (immediately after a local change), and
+    only the terms that changed are applied to the automaton.
+    """
+
+    def __init__(self):
+        self.automaton = KeywordAutomaton()
+        self.signature = None
+        self.checked_at = 0
+        self.lock = threading.RLock()
+
+    def invalidate(self):
+        self.checked_at = 0
+
+    def refresh(self):
+        with self.lock:
+            if time.monotonic() - self.checked_at < settings.THREAT_KEYWORDS_REFRESH_SECONDS:
+                return
+            self.checked_at = time.monotonic()
+
+            signature = ThreatKeyword.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+            if signature == self.signature:
+                return
+
+            terms = {
+                term.lower(): (severity, weight)
+                for term, severity, weight in ThreatKeyword.objects.filter(active=True).values_list('term', 'severity', 'weight')
+            }
+            automaton = self.automaton
+            for term in set(automaton.terms) - set(terms):
+                automaton.remove(term)
+            for term, (severity, weight) in terms.items():
+                if automaton.terms.get(term) != (severity, weight):
+                    automaton.add(term, severity, weight)
+
+            self.signature = signature
+            print(f"Threat keyword matcher refreshed: {len(terms)} active terms")
+
+    def find(self, text):
+        with self.lock:
+            self.refresh()
+            return self.automaton.find(text)
+
+    def find_many(self, texts):
+        with self.lock:
+            self.refresh()
+            return self.automaton.find_many(texts)
+
+
+matcher = ThreatKeywordMatcher()
+
+
+def threat_score(matches):
+    """Sum of the weights of the distinct terms matched."""
+    return sum({match.term: match.weight for match in matches}.values())
@@ -0,0 +1,160 @@
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .models import Scan
+
+# Identifies this process in Scan.claimed_by
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_held = set()
+_held_lock = threading.Lock()
+_heartbeat = None
+
+
+def claimable_scans():
+    """
+    Scans waiting for a worker: pending ones, and running ones whose worker
+    stopped renewing its lease.
+    """
+    return Scan.objects.filter(
+        Q(status='pending') | Q(status='running', lease_expires_at__lt=now())
+    ).exclude(keywords__isnull=True).exclude(keywords='')
+
+
+def claim_scans(limit, scan_ids=None, quick_only=False):
+    """
+    Claim up to `limit` scans for this process (only among `scan_ids` if given,
+    and only scans without a schedule if `quick_only`) and mark them running
+    under a lease of INGESTION_LEASE_SECONDS.
+
+    Candidates are locked with SELECT ... FOR UPDATE SKIP LOCKED where the
+    database supports it, so concurrent workers pick different rows. Each row
+    is then taken with a conditional UPDATE, which is what guarantees a scan
+    has a single owner on backends without SKIP LOCKED (SQLite).
+    """
+    give_up_expired_scans()
+    complete_empty_scans()
+
+    candidates = claimable_scans()
+    if scan_ids is not None:
+        candidates = candidates.filter(id__in=scan_ids)
+    if quick_only:
+        candidates = candidates.filter(schedule__isnull=True)
+
+    candidates = candidates.order_by('time_run').values_list('id', flat=True)
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            claimed = take_scans(list(candidates.select_for_update(skip_locked=True)[:limit]))
+    else:
+        # SQLite can't upgrade a read transaction to a write one while another
+        # process writes, so each conditional UPDATE commits on its own
+        claimed = take_scans(list(candidates[:limit]))
+
+    if claimed:
+        hold(claimed)
+    return list(Scan.objects.filter(id__in=claimed))
+
+
+def take_scans(scan_ids):
+    """
+    Mark each scan as running under this process's lease, unless another
+    worker took it first. Returns the ids actually taken.
+    """
+    taken = []
+    for scan_id in scan_ids:
+        updated = claimable_scans().filter(id=scan_id).update(
+            status='running',
+            claimed_by=WORKER_ID,
+            lease_expires_at=now() + timedelta(seconds=settings.INGESTION_LEASE_SECONDS),
+            attempts=F('attempts') + 1,
+        )
+        if updated:
+            taken.append(scan_id)
+    return taken
+
+
+def give_up_expired_scans():
+    """
+    Fail the scans whose lease expired after INGESTION_MAX_ATTEMPTS claims:
+    they keep killing or stalling their workers.
+    """
+    failed = Scan.objects.filter(
+        status='running',
+        lease_expires_at__lt=now(),
+        attempts__gte=settings.INGESTION_MAX_ATTEMPTS,
+    ).update(status='failed', claimed_by=None, lease_expires_at=None)
+    if failed:
+        print(f"[Ingestion] Gave up on {failed} scan(s) after {settings.INGESTION_MAX_ATTEMPTS} attempts")
+
+
+def complete_empty_scans(scan_ids=None):
+    """
+    Complete the pending scans without keywords (only among `scan_ids` if
+    given): there is nothing to fetch for them, and no worker claims them.
+    """
+    empty = Scan.objects.filter(status='pending').filter(Q(keywords__isnull=True) | Q(keywords=''))
+    if scan_ids is not None:
+        empty = empty.filter(id__in=scan_ids)
+    return empty.update(status='completed', scan_end_date=now())
+
+
+def finish_scan(scan, status):
+    """
+    Record the outcome of a claimed scan and release its lease. Returns False
+    if the lease was lost (another worker reclaimed the scan) meanwhile.
+    """
+    release([scan.id])
+    finished = Scan.objects.filter(id=scan.id, claimed_by=WORKER_ID, status='running').update(
+        status=status,
+        claimed_by=None,
+        lease_expires_at=None,
+        scan_start_date=scan.scan_start_date,
+        scan_end_date=scan.scan_end_date,
+    )
+    if not finished:
+        print(f"[Ingestion] Lost the lease on scan {scan.id}, its outcome ({status}) was not recorded")
+    return bool(finished)
+
+
+def hold(scan_ids):
+    """Keep renewing the leases of these scans until they are released."""
+    global _heartbeat
+    with _held_lock:
+        _held.update(scan_ids)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=heartbeat_loop, name="ingestion-heartbeat", daemon=True)
+            _heartbeat.start()
+
+
+def release(scan_ids):
+    with _held_lock:
+        _held.difference_update(scan_ids)
+
+
+def heartbeat_loop():
+    """
+    Extend the leases of every scan this process is working on, every
+    INGESTION_HEARTBEAT_SECONDS.
+    """
+    while True:
+        time.sleep(settings.INGESTION_HEARTBEAT_SECONDS)
+        with _held_lock:
+            scan_ids = list(_held)
+        if not scan_ids:
+            continue
+
+        close_old_connections()
+        try:
+            Scan.objects.filter(id__in=scan_ids, claimed_by=WORKER_ID, status='running').update(
+                lease_expires_at=now() + timedelta(seconds=settings.INGESTION_LEASE_SECONDS)
+            )
+        except DatabaseError as e:
+            print(f"[Ingestion] Heartbeat failed: {e}")
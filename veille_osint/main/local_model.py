@@ -0,0 +1,229 @@
+from concurrent.futures import Future
+import json
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+from .model_registry import registry
+from .training import clean_text
+
+# TensorFlow is only needed when the local model is enabled
+try:
+    import numpy as np
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+    from tensorflow.keras.preprocessing.text import tokenizer_from_json
+except ImportError:
+    load_model = None
+
+
+class LocalAlertModel:
+    """
+    The BiLSTM trained by the train_local_model command, with the tokenizer and label
+    metadata saved next to it, scoring texts on CPU in batches.
+    """
+
+    def __init__(self, model_path, tokenizer_path, meta_path):
+        self.model = load_model(model_path)
+        with open(tokenizer_path) as f:
+            self.tokenizer = tokenizer_from_json(f.read())
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.labels = meta["labels"]
+        self.max_sequence_length = meta["max_sequence_length"]
+        self.stop_words = set(meta.get("stop_words", []))
+
+    def preprocess(self, text):
+        """Same cleaning as in training."""
+        return clean_text(text, self.stop_words)
+
+    def encode(self, texts):
+        """Token ids of each text, as the tokenizer saw them in training."""
+        return self.tokenizer.texts_to_sequences([self.preprocess(text) for text in texts])
+
+    def predict_sequences(self, sequences):
+        """
+        Class probabilities of encoded texts, padded to the model's input
+        length. A batch that fits in LOCAL_MODEL_BATCH_SIZE runs as a single
+        graph call, without the overhead of Model.predict.
+        """
+        padded = pad_sequences(sequences, maxlen=self.max_sequence_length, padding='post', truncating='post')
+        if len(padded) <= settings.LOCAL_MODEL_BATCH_SIZE:
+            return np.asarray(self.model.predict_on_batch(padded))
+        return self.model.predict(padded, batch_size=settings.LOCAL_MODEL_BATCH_SIZE, verbose=0)
+
+    def predict_proba(self, texts):
+        """Class probabilities for each text, columns ordered as self.labels."""
+        return self.predict_sequences(self.encode(texts))
+
+    def none_probabilities(self, texts):
+        """Probability that each text is irrelevant (the "none" label)."""
+        if not texts:
+            return []
+        column = self.labels.index(settings.LOCAL_MODEL_NONE_LABEL)
+        return [float(p) for p in self.predict_proba(texts)[:, column]]
+
+
+class InferenceServer:
+    """
+    Dynamic batching in front of a LocalAlertModel, shared by every thread of
+    the process.
+
+    Callers encode their texts and submit them; the inference thread gathers
+    what is submitted for up to `max_wait` seconds after the first text
+    (LOCAL_MODEL_BATCH_WAIT_MS), or until `max_batch` texts
+    (LOCAL_MODEL_BATCH_SIZE) are waiting, and scores them in one padded
+    predict. Each text gets a Future of its class probabilities. A longer
+    wait fills batches better under load, a shorter one answers sooner.
+    Once closed (swapped out by the registry), submitting raises, so callers
+    fall back to Gemini rather than wait on a stopped thread.
+    """
+
+    def __init__(self, model, max_batch=None, max_wait=None):
+        self.model = model
+        self.labels = model.labels
+        self.max_batch = max_batch or settings.LOCAL_MODEL_BATCH_SIZE
+        self.max_wait = settings.LOCAL_MODEL_BATCH_WAIT_MS / 1000 if max_wait is None else max_wait
+        self.requests = queue.Queue()
+        # Guards `closed`, so nothing is queued behind the request stopping the thread
+        self.lock = threading.Lock()
+        self.closed = False
+        self.batches = 0
+        self.items = 0
+        self.thread = threading.Thread(target=self.run, name="local-model-inference", daemon=True)
+        self.thread.start()
+
+    def submit(self, texts):
+        """Futures of the class probabilities of each text."""
+        sequences = self.model.encode(texts)
+        futures = []
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("The local model's inference server is closed")
+            for sequence in sequences:
+                future = Future()
+                self.requests.put((sequence, future))
+                futures.append(future)
+        return futures
+
+    def predict_proba(self, texts):
+        return np.array([future.result() for future in self.submit(texts)])
+
+    def none_probabilities(self, texts):
+        if not texts:
+            return []
+        column = self.labels.index(settings.LOCAL_MODEL_NONE_LABEL)
+        return [float(p) for p in self.predict_proba(texts)[:, column]]
+
+    def run(self):
+        try:
+            self.serve()
+        finally:
+            # Whatever stopped the thread, nobody is left to score these
+            with self.lock:
+                self.closed = True
+            self.fail_pending(RuntimeError("The local model's inference server stopped"))
+
+    def serve(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.max_wait
+            closing = False
+            while len(batch) < self.max_batch:
+                try:
+                    request = self.requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+            self.predict(batch)
+            if closing:
+                return
+
+    def predict(self, batch):
+        batch = [(sequence, future) for sequence, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            probabilities = self.model.predict_sequences([sequence for sequence, _ in batch])
+        except BaseException as e:
+            # Callers fall back on an Exception; anything else also stops the thread
+            error = e if isinstance(e, Exception) else RuntimeError("The local model's inference server stopped")
+            for _, future in batch:
+                future.set_exception(error)
+            if error is not e:
+                raise
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), row in zip(batch, probabilities):
+            future.set_result(row)
+
+    def fail_pending(self, error):
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None and request[1].set_running_or_notify_cancel():
+                request[1].set_exception(error)
+
+    def close(self):
+        """Stop the inference thread once the texts already submitted are scored."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.requests.put(None)
+
+
+def open_local_model(path=None):
+    """
+    The local model at `path` (LOCAL_MODEL_PATH by default), or None when it
+    is disabled, TensorFlow is missing or the model files can't be loaded, in
+    which case every text goes to Gemini.
+    """
+    if not settings.LOCAL_MODEL_ENABLED:
+        return None
+    if load_model is None:
+        print("Local model disabled: TensorFlow is not installed.")
+        return None
+
+    path = path or settings.LOCAL_MODEL_PATH
+    base = os.path.splitext(path)[0]
+    try:
+        model = LocalAlertModel(path, f"{base}.tokenizer.json", f"{base}.meta.json")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Local model disabled: could not load {path}: {e}")
+        return None
+
+    if settings.LOCAL_MODEL_NONE_LABEL not in model.labels:
+        print(f"Local model disabled: label {settings.LOCAL_MODEL_NONE_LABEL!r} not in {model.labels}")
+        return None
+    return model
+
+
+def load_local_model(version, config):
+    """Registry loader: the model at config["path"], behind an InferenceServer."""
+    model = open_local_model(config.get("path"))
+    return InferenceServer(model) if model is not None else None
+
+
+def default_local_model():
+    return os.path.basename(settings.LOCAL_MODEL_PATH), {"path": settings.LOCAL_MODEL_PATH}
+
+
+registry.register("local", load_local_model, default_local_model)
+
+
+def get_local_model():
+    """The local model of the process, or None if it can't be used."""
+    return registry.get("local")
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.alerts import result_content
+from main.local_model import InferenceServer, open_local_model
+from main.models import Journal
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Score stored results with the local model from concurrent threads, one text per call, "
+        "unbatched and through the dynamic-batching InferenceServer, and report throughput and latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--texts', type=int, default=2000, help="Number of texts scored (the latest results, repeated if needed)")
+        parser.add_argument('--concurrency', type=int, default=8, help="Threads submitting texts")
+        parser.add_argument('--batch-size', type=int, default=settings.LOCAL_MODEL_BATCH_SIZE, help="Largest batch of the server")
+        parser.add_argument('--wait-ms', type=float, default=settings.LOCAL_MODEL_BATCH_WAIT_MS, help="Longest wait of the server for a batch to fill")
+        parser.add_argument('--model', help="Model file (LOCAL_MODEL_PATH by default)")
+        parser.add_argument('--skip-unbatched', action='store_true', help="Only measure the server")
+
+    def handle(self, *args, **options):
+        model = open_local_model(options['model'])
+        if model is None:
+            raise CommandError("The local model can't be loaded")
+
+        contents = [result_content(journal) for journal in Journal.objects.order_by('-id')[:options['texts']]]
+        if not contents:
+            raise CommandError("No stored results to score")
+        texts = (contents * (options['texts'] // len(contents) + 1))[:options['texts']]
+        # Warm-up: the first calls build the graph
+        model.predict_proba(texts[:options['batch_size']])
+
+        if not options['skip_unbatched']:
+            self.report("Unbatched", self.run(lambda text: model.predict_proba([text]), texts, options['concurrency']))
+
+        server = InferenceServer(model, options['batch_size'], options['wait_ms'] / 1000)
+        try:
+            elapsed, latencies = self.run(lambda text: server.predict_proba([text]), texts, options['concurrency'])
+        finally:
+            server.close()
+        self.report(f"Batched (<= {options['batch_size']} texts, {options['wait_ms']:g} ms)", (elapsed, latencies))
+        self.stdout.write(f"  {server.batches} batches, {server.items / max(server.batches, 1):.1f} texts per batch")
+
+    def run(self, score, texts, concurrency):
+        """Score `texts` from `concurrency` threads; (elapsed seconds, latency of each call)."""
+        latencies = []
+        lock = threading.Lock()
+        shares = [texts[index::concurrency] for index in range(concurrency)]
+
+        def worker(share):
+            for text in share:
+                start = time.monotonic()
+                score(text)
+                latency = time.monotonic() - start
+                with lock:
+                    latencies.append(latency)
+
+        threads = [threading.Thread(target=worker, args=(share,)) for share in shares]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - start, latencies
+
+    def report(self, label, measure):
+        elapsed, latencies = measure
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {len(latencies) / elapsed:.0f} texts/s, latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+            f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms"
+        ))
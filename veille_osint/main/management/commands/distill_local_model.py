@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.distillation import DistillationError, distill
+
+
+class Command(BaseCommand):
+    help = (
+        "Fine-tune the served local model on the Gemini verdicts and false alerts recorded since it was "
+        "trained, and serve the new version if it screens the holdout better. Meant to run periodically (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Model file (next to LOCAL_MODEL_PATH, named after the date, by default)")
+        parser.add_argument('--epochs', type=int, default=5, help="Most epochs, fewer if validation stops improving")
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--patience', type=int, default=2, help="Epochs without validation improvement before stopping")
+        parser.add_argument('--min-examples', type=int, default=settings.DISTILLATION_MIN_EXAMPLES, help="New examples needed to run")
+        parser.add_argument('--no-promote', action='store_true', help="Register the new version without serving it")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        try:
+            version, evaluations = distill(
+                output=options['output'],
+                epochs=options['epochs'],
+                batch_size=options['batch_size'],
+                patience=options['patience'],
+                min_examples=options['min_examples'],
+                promote=not options['no_promote'],
+                verbose=1 if options['verbosity'] > 1 else 2,
+            )
+        except DistillationError as e:
+            raise CommandError(str(e))
+
+        for name, metrics in evaluations.items():
+            accuracy = f", accuracy {metrics['accuracy']:.3f}" if 'accuracy' in metrics else ""
+            self.stdout.write(
+                f"  {name}: {metrics['local']:.1%} of {metrics['examples']} holdout texts kept from Gemini, "
+                f"{metrics['missed_alerts']:.1%} of alerts lost{accuracy}"
+            )
+        style = self.style.SUCCESS if version.active else self.style.WARNING
+        state = "now served" if version.active else "not promoted"
+        self.stdout.write(style(f"Local model {version.version} ({state}) in {time.monotonic() - start:.0f}s"))
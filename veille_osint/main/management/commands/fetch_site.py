@@ -0,0 +1,45 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.connectors import ConnectorError, get_connector
+from main.connectors.base import parse_date
+from main.models import Sites
+from main.upstreams import AsyncClient
+from main.watermarks import keyword_terms
+
+
+class Command(BaseCommand):
+    help = "Fetch a site through its connector and print its articles, without storing them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('site_id', nargs='?', type=int, help="Sites row to fetch")
+        parser.add_argument('--connector', help="Connector to use with --url instead of a Sites row")
+        parser.add_argument('--url', help="Feed URL, or path of a local fixture")
+        parser.add_argument('--keywords', default='', help="Comma-separated keywords (query-based connectors)")
+        parser.add_argument('--since', help="Only articles published after this date")
+
+    def handle(self, *args, **options):
+        if options['site_id']:
+            site = Sites.objects.filter(id=options['site_id']).first()
+            if site is None:
+                raise CommandError(f"No site {options['site_id']}")
+        elif options['connector'] and options['url']:
+            site = Sites(name=options['url'], url=options['url'], connector=options['connector'])
+        else:
+            raise CommandError("Give a site id, or --connector and --url")
+
+        since = parse_date(options['since']) if options['since'] else None
+        try:
+            articles = asyncio.run(self.fetch(site, since, keyword_terms(options['keywords'])))
+        except ConnectorError as e:
+            raise CommandError(str(e))
+
+        for article in articles:
+            self.stdout.write(f"{article.date_posted:%Y-%m-%d %H:%M} {article.titre} <{article.source}>")
+        self.stdout.write(self.style.SUCCESS(f"{len(articles)} articles from {site}"))
+
+    async def fetch(self, site, since, terms):
+        async with AsyncClient() as client:
+            connector = get_connector(site, client=client)
+            return [article async for article in connector.fetch(since, terms)]
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.payload_archive import prune_payloads
+
+
+class Command(BaseCommand):
+    help = "Delete the archived upstream payloads older than PAYLOAD_ARCHIVE_RETENTION_DAYS that no recent scan used."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.PAYLOAD_ARCHIVE_RETENTION_DAYS,
+                            help="Keep the payloads of the last DAYS days")
+
+    def handle(self, *args, **options):
+        deleted = prune_payloads(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} archived payloads deleted"))
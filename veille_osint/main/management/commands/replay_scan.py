@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.connectors.base import parse_date
+from main.ingestion import replay_scan
+from main.models import Scan
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the archived upstream payloads of scans through the current parsers, storage and "
+        "classification queue, each into a new scan marked as its replay (alerts of replays aren't emailed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scan_ids', nargs='*', type=int, help="Scans to replay")
+        parser.add_argument('--since', help="Replay every scan with payloads fetched after this date")
+        parser.add_argument('--until', help="... and before this date")
+        parser.add_argument('--keywords', help="Comma-separated keywords to use instead of the scans' own")
+        parser.add_argument('--no-classify', action='store_true', help="Store the results without queuing them for classification")
+
+    def handle(self, *args, **options):
+        scans = Scan.objects.filter(replay_of__isnull=True)
+        if options['scan_ids']:
+            scans = scans.filter(id__in=options['scan_ids'])
+        elif options['since']:
+            since = parse_date(options['since'])
+            until = parse_date(options['until']) if options['until'] else None
+            if since is None or (options['until'] and until is None):
+                raise CommandError("Invalid --since or --until date")
+            scans = scans.filter(payloads__fetched_at__gte=since)
+            if until:
+                scans = scans.filter(payloads__fetched_at__lt=until)
+        else:
+            raise CommandError("Give scan ids or --since")
+
+        scans = list(scans.filter(payloads__isnull=False).distinct().order_by('id'))
+        if not scans:
+            raise CommandError("No archived payloads for these scans")
+
+        for scan in scans:
+            start = time.monotonic()
+            replay = replay_scan(scan, keywords=options['keywords'], classify=not options['no_classify'])
+            elapsed = time.monotonic() - start
+            results = replay.results.count()
+            queued = replay.results.filter(classification_task__isnull=False).count()
+            style = self.style.SUCCESS if replay.status == 'completed' else self.style.ERROR
+            self.stdout.write(style(
+                f"Scan {scan.id} -> replay {replay.id} ({replay.status}): {results} results in {elapsed:.1f}s "
+                f"({results / elapsed if elapsed else 0:.0f} results/s), {queued} queued for classification"
+            ))
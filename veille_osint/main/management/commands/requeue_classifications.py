@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.classification_queue import requeue
+from main.models import ClassificationDeadLetter
+
+
+class Command(BaseCommand):
+    help = "List the dead-lettered results of the classification queue, or queue them again."
+
+    def add_arguments(self, parser):
+        parser.add_argument('result_ids', nargs='*', type=int, help="Results to requeue")
+        parser.add_argument('--all', action='store_true', help="Requeue every dead-lettered result")
+
+    def handle(self, *args, **options):
+        dead_letters = ClassificationDeadLetter.objects.order_by('-urgent', '-priority', 'failed_at')
+        if options['result_ids']:
+            dead_letters = dead_letters.filter(result_id__in=options['result_ids'])
+        elif not options['all']:
+            for dead in dead_letters:
+                self.stdout.write(f"{dead.result_id} {dead.failed_at:%Y-%m-%d %H:%M} ({dead.attempts} attempts) {dead.error}")
+            self.stdout.write(f"{dead_letters.count()} dead-lettered results, requeue them with their ids or --all")
+            return
+        if not dead_letters.exists():
+            raise CommandError("No such dead-lettered results")
+        self.stdout.write(self.style.SUCCESS(f"{requeue(dead_letters)} results requeued"))
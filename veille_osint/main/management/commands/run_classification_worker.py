@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.classification_queue import run_classification_workers
+from main.model_registry import registry
+
+
+class Command(BaseCommand):
+    help = "Classify the stored results waiting in the classification queue. Run as many workers as needed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.CLASSIFICATION_WORKERS, help="Worker threads")
+        parser.add_argument('--batch-size', type=int, default=settings.CLASSIFICATION_BATCH_SIZE, help="Results claimed, and classified together, at a time")
+        parser.add_argument('--poll-interval', type=float, default=settings.CLASSIFICATION_POLL_INTERVAL, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        registry.warm()
+        run_classification_workers(options['concurrency'], options['batch_size'], options['poll_interval'], once=options['once'])
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.ingestion import run_worker
+from main.model_registry import registry
+
+
+class Command(BaseCommand):
+    help = "Claim pending scans from the database and ingest them. Run as many workers as needed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.INGESTION_PLAN_MAX_SCANS, help="Scans claimed, and planned together, at a time")
+        parser.add_argument('--poll-interval', type=float, default=settings.INGESTION_POLL_INTERVAL, help="Seconds to wait when no scan is pending")
+        parser.add_argument('--once', action='store_true', help="Exit once no scan is pending")
+
+    def handle(self, *args, **options):
+        # Classifiers are loaded before the first scan rather than during it
+        registry.warm()
+        run_worker(options['batch_size'], options['poll_interval'], once=options['once'])
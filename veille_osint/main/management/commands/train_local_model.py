@@ -0,0 +1,65 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main.models import ClassifierModel
+from main.training import build_dataset, save_model, train
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the local alert classifier on a (text, label) CSV and register it as a new version of the "
+        "local model. The encoded corpus is cached, so retraining on the same data skips preprocessing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv', help="Labelled corpus, e.g. CyberBert.csv")
+        parser.add_argument('--output', help="Model file (next to LOCAL_MODEL_PATH, named after the date, by default)")
+        parser.add_argument('--epochs', type=int, default=10, help="Most epochs, fewer if validation stops improving")
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--patience', type=int, default=2, help="Epochs without validation improvement before stopping")
+        parser.add_argument('--max-vocab', type=int, default=10000)
+        parser.add_argument('--max-length', type=int, default=100, help="Tokens per text")
+        parser.add_argument('--processes', type=int, help="Preprocessing processes (one per core by default)")
+        parser.add_argument('--rebuild', action='store_true', help="Encode the corpus again even if it is cached")
+        parser.add_argument('--activate', action='store_true', help="Serve the new version once trained")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['csv']):
+            raise CommandError(f"No such file: {options['csv']}")
+        output = options['output']
+        if not output:
+            base = os.path.splitext(settings.LOCAL_MODEL_PATH)[0]
+            output = f"{base}-{timezone.now():%Y%m%d-%H%M%S}.h5"
+        version = os.path.basename(output)
+        if ClassifierModel.objects.filter(kind='local', version=version).exists():
+            raise CommandError(f"Version {version} is already registered")
+
+        start = time.monotonic()
+        dataset = build_dataset(
+            options['csv'],
+            settings.LOCAL_MODEL_TRAINING_CACHE_DIR,
+            max_vocab=options['max_vocab'],
+            max_length=options['max_length'],
+            processes=options['processes'],
+            rebuild=options['rebuild'],
+        )
+        self.stdout.write(
+            f"Dataset {dataset.key}: {len(dataset)} texts, {len(dataset.label_names)} labels "
+            f"({time.monotonic() - start:.1f}s)"
+        )
+
+        start = time.monotonic()
+        model, metrics = train(dataset, epochs=options['epochs'], batch_size=options['batch_size'], patience=options['patience'])
+        save_model(model, output, dataset.tokenizer_json, {**dataset.model_meta(), 'metrics': metrics})
+        self.stdout.write(
+            f"Trained in {time.monotonic() - start:.0f}s ({metrics['epochs']} epochs): "
+            f"test loss {metrics['loss']:.4f}, accuracy {metrics['accuracy']:.4f}"
+        )
+
+        ClassifierModel.objects.create(kind='local', version=version, config={'path': output}, active=options['activate'])
+        state = "active" if options['activate'] else "registered, not active"
+        self.stdout.write(self.style.SUCCESS(f"Local model {version} saved to {output} ({state})"))
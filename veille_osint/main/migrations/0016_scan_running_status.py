@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0015_delete_none_alerts"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="scan",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("completed", "Completed"),
+                    ("failed", "Failed"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="scanschedule",
+            name="frequency",
+            field=models.CharField(
+                choices=[
+                    ("hourly", "Par Heure"),
+                    ("daily", "Journalier"),
+                    ("weekly", "Hebdomadaire"),
+                    ("monthly", "Mensuel"),
+                ],
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:43
+
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.db import migrations, models
+
+# Copy of main.dedup as of this migration, so that later changes to the
+# fingerprints don't change what this migration computed
+
+TRACKING_PARAMS = {
+    "fbclid",
+    "gclid",
+    "dclid",
+    "msclkid",
+    "mc_cid",
+    "mc_eid",
+    "ocid",
+    "cmpid",
+    "ref",
+    "ref_src",
+    "smid",
+    "sr_share",
+    "guccounter",
+    "ito",
+}
+
+MIN_CONTENT_LENGTH = 40
+
+PLACEHOLDERS = {"no description", "no details available", "no title"}
+
+
+def canonical_url(url):
+    if not url:
+        return ""
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    if not host:
+        return ""
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(
+        ("https" if scheme == "http" else scheme, host, path, urlencode(query), "")
+    )
+
+
+def normalize_content(*texts):
+    content = " ".join(
+        text for text in texts if text and text.strip().lower() not in PLACEHOLDERS
+    )
+    return " ".join(re.sub(r"[\W_]+", " ", content.lower()).split())
+
+
+def url_fingerprint(url):
+    canonical = canonical_url(url)
+    if not canonical:
+        return None
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def content_fingerprint(titre, details):
+    content = normalize_content(titre, details)
+    if len(content) < MIN_CONTENT_LENGTH:
+        return None
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def fingerprint_existing_results(apps, schema_editor):
+    ScanResult = apps.get_model("main", "ScanResult")
+    Journal = apps.get_model("main", "Journal")
+    titles = dict(Journal.objects.values_list("scanresult_ptr_id", "titre"))
+
+    results = list(ScanResult.objects.only("id", "source", "details"))
+    for result in results:
+        result.url_hash = url_fingerprint(result.source)
+        result.content_hash = content_fingerprint(
+            titles.get(result.id, ""), result.details
+        )
+    ScanResult.objects.bulk_update(
+        results, ["url_hash", "content_hash"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0016_scan_running_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scanresult",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanresult",
+            name="linked_scans",
+            field=models.ManyToManyField(
+                blank=True, related_name="linked_results", to="main.scan"
+            ),
+        ),
+        migrations.AddField(
+            model_name="scanresult",
+            name="url_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(fingerprint_existing_results, migrations.RunPython.noop),
+    ]
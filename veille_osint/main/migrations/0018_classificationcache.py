@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0017_scanresult_fingerprints"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClassificationCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("model_name", models.CharField(max_length=100)),
+                ("prompt_version", models.CharField(max_length=20)),
+                ("severity", models.CharField(max_length=10)),
+                ("recommendations", models.JSONField(blank=True, default=list)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "last_used_at",
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+                ("hits", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+# The dictionary previously hardcoded in signals.THREAT_KEYWORDS, weighted by
+# its THREAT_LEVEL
+DEFAULT_THREAT_KEYWORDS = {
+    "high": ["ransomware", "breach", "leak", "hacked"],
+    "medium": ["phishing", "compromise", "exposed"],
+    "low": ["vulnerability", "downtime", "incident"],
+}
+
+DEFAULT_WEIGHTS = {"high": 3, "medium": 2, "low": 1}
+
+
+def create_default_threat_keywords(apps, schema_editor):
+    ThreatKeyword = apps.get_model("main", "ThreatKeyword")
+    for severity, terms in DEFAULT_THREAT_KEYWORDS.items():
+        for term in terms:
+            ThreatKeyword.objects.get_or_create(
+                term=term,
+                defaults={"severity": severity, "weight": DEFAULT_WEIGHTS[severity]},
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0018_classificationcache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ThreatKeyword",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=100, unique=True)),
+                (
+                    "severity",
+                    models.CharField(
+                        choices=[
+                            ("low", "Low"),
+                            ("medium", "Medium"),
+                            ("high", "High"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("weight", models.FloatField(default=1.0)),
+                ("active", models.BooleanField(default=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_default_threat_keywords, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0019_threatkeyword"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SchedulerLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("owner", models.CharField(max_length=100)),
+                ("expires_at", models.DateTimeField()),
+            ],
+        ),
+    ]
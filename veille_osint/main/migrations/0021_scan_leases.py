@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0020_schedulerlease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scan",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="scan",
+            name="claimed_by",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name="scan",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0021_scan_leases"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestionWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("keyword", models.CharField(max_length=200)),
+                ("published_at", models.DateTimeField()),
+                ("cursor", models.CharField(blank=True, default="", max_length=64)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "schedule",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="watermarks",
+                        to="main.scanschedule",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("schedule", "keyword")},
+            },
+        ),
+    ]
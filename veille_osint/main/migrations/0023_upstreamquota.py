@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0022_ingestionwatermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UpstreamQuota",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("upstream", models.CharField(max_length=50, unique=True)),
+                ("day", models.DateField(blank=True, null=True)),
+                ("used", models.PositiveIntegerField(default=0)),
+                ("blocked_until", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_watermarks_to_newsapi(apps, schema_editor):
+    """
+    Watermarks so far were all NewsAPI's: give them the schedule's NewsAPI site.
+    """
+    IngestionWatermark = apps.get_model("main", "IngestionWatermark")
+    for watermark in IngestionWatermark.objects.select_related("schedule"):
+        site = watermark.schedule.sites.filter(connector="newsapi").first()
+        if site is not None:
+            watermark.site = site
+            watermark.save(update_fields=["site"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0023_upstreamquota"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="ingestionwatermark",
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name="ingestionwatermark",
+            name="site",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="watermarks",
+                to="main.sites",
+            ),
+        ),
+        migrations.AddField(
+            model_name="sites",
+            name="connector",
+            field=models.CharField(
+                choices=[
+                    ("newsapi", "NewsAPI"),
+                    ("rss", "RSS / Atom"),
+                    ("json_feed", "JSON Feed"),
+                ],
+                default="newsapi",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="sites",
+            name="max_concurrency",
+            field=models.PositiveSmallIntegerField(default=4),
+        ),
+        migrations.RunPython(assign_watermarks_to_newsapi, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="ingestionwatermark",
+            unique_together={("schedule", "site", "keyword")},
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0024_site_connectors"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArticleText",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("url_hash", models.CharField(max_length=64, unique=True)),
+                ("url", models.TextField()),
+                ("title", models.CharField(blank=True, max_length=300)),
+                ("text", models.TextField(blank=True)),
+                ("extracted_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="scanresult",
+            name="full_text",
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="scanresult",
+            name="page_title",
+            field=models.CharField(blank=True, max_length=300, null=True),
+        ),
+    ]
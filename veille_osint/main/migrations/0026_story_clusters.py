@@ -0,0 +1,77 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0025_article_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoryCluster",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("signature", models.JSONField()),
+                ("severity", models.CharField(blank=True, max_length=10, null=True)),
+                ("size", models.PositiveIntegerField(default=1)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("last_seen_at", models.DateTimeField(db_index=True)),
+                (
+                    "representative",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="main.scanresult",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="StoryBand",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(db_index=True, max_length=40)),
+                (
+                    "cluster",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="bands",
+                        to="main.storycluster",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="scanresult",
+            name="cluster",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="members",
+                to="main.storycluster",
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0026_story_clusters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scan",
+            name="replay_of",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="replays",
+                to="main.scan",
+            ),
+        ),
+        migrations.CreateModel(
+            name="RawPayload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sha256", models.CharField(max_length=64, unique=True)),
+                ("connector", models.CharField(max_length=20)),
+                ("url", models.TextField()),
+                ("size", models.PositiveBigIntegerField()),
+                ("compressed_size", models.PositiveBigIntegerField()),
+                ("fetched_at", models.DateTimeField(db_index=True)),
+                (
+                    "scans",
+                    models.ManyToManyField(
+                        blank=True, related_name="payloads", to="main.scan"
+                    ),
+                ),
+                (
+                    "site",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="payloads",
+                        to="main.sites",
+                    ),
+                ),
+            ],
+        ),
+    ]
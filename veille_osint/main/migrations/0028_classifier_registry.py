@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0027_payload_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alert",
+            name="model_version",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.CreateModel(
+            name="ClassifierModel",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("gemini", "Gemini"), ("local", "Modèle local")],
+                        max_length=20,
+                    ),
+                ),
+                ("version", models.CharField(max_length=100)),
+                ("config", models.JSONField(blank=True, default=dict)),
+                ("active", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("kind", "version")},
+            },
+        ),
+    ]
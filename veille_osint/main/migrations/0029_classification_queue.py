@@ -0,0 +1,83 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0028_classifier_registry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClassificationDeadLetter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("urgent", models.BooleanField(default=False)),
+                ("priority", models.FloatField(default=0)),
+                ("attempts", models.PositiveIntegerField()),
+                ("error", models.TextField()),
+                ("failed_at", models.DateTimeField(auto_now=True)),
+                (
+                    "result",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="classification_dead_letter",
+                        to="main.scanresult",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ClassificationTask",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("urgent", models.BooleanField(default=False)),
+                ("priority", models.FloatField(default=0)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("pending", "Pending"), ("running", "Running")],
+                        db_index=True,
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("available_at", models.DateTimeField(db_index=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("claimed_by", models.CharField(blank=True, max_length=100, null=True)),
+                (
+                    "lease_expires_at",
+                    models.DateTimeField(blank=True, db_index=True, null=True),
+                ),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "result",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="classification_task",
+                        to="main.scanresult",
+                    ),
+                ),
+            ],
+        ),
+    ]
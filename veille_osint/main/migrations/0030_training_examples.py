@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0029_classification_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrainingExample",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("text", models.TextField()),
+                ("label", models.CharField(max_length=10)),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("gemini", "Gemini"),
+                            ("false_alert", "Fausse alerte"),
+                        ],
+                        default="gemini",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "model_version",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+                ("holdout", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, db_index=True)),
+                (
+                    "result",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="training_example",
+                        to="main.scanresult",
+                    ),
+                ),
+            ],
+        ),
+    ]
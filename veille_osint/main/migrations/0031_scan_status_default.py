@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0030_training_examples"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="scan",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("completed", "Completed"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+    ]
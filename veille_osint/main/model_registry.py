@@ -0,0 +1,136 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import ClassifierModel
+
+
+class ModelRegistry:
+    """
+    The classifiers of the process, each loaded once and shared by every
+    thread, at the version active in the ClassifierModel table.
+
+    Each kind registers a loader, called with a version and its config, and
+    the version to use when the table has no active row for it. The table is
+    checked at most every MODEL_REGISTRY_REFRESH_SECONDS (immediately after a
+    local change). A kind is loaded on first use; a newly activated version is
+    then loaded in the background while the current one keeps serving, and
+    swapped in once ready. A version that fails to load is not retried until
+    another one is activated.
+    """
+
+    def __init__(self):
+        self.loaders = {}
+        self.defaults = {}
+        self.models = {}
+        self.active = {}
+        self.loading = set()
+        self.failed = {}
+        self.signature = None
+        self.checked_at = 0
+        self.lock = threading.RLock()
+        self.loaded = threading.Condition(self.lock)
+
+    def register(self, kind, loader, default):
+        """
+        `loader(version, config)` returns the model (None when it can't be
+        used); `default()` returns the (version, config) from the settings.
+        """
+        self.loaders[kind] = loader
+        self.defaults[kind] = default
+
+    def invalidate(self):
+        self.checked_at = 0
+
+    def refresh(self):
+        with self.lock:
+            if time.monotonic() - self.checked_at < settings.MODEL_REGISTRY_REFRESH_SECONDS:
+                return
+            self.checked_at = time.monotonic()
+
+            signature = ClassifierModel.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+            if signature == self.signature:
+                return
+            self.active = {
+                kind: (version, config)
+                for kind, version, config in ClassifierModel.objects.filter(active=True).values_list('kind', 'version', 'config')
+            }
+            self.signature = signature
+
+    def wanted(self, kind):
+        return self.active.get(kind) or self.defaults[kind]()
+
+    def get(self, kind):
+        """The shared model of `kind`, loading it on first use."""
+        with self.lock:
+            self.refresh()
+            version, config = self.wanted(kind)
+            # Another thread is loading it: wait for that rather than load it twice
+            while kind not in self.models and kind in self.loading:
+                self.loaded.wait()
+            current = self.models.get(kind)
+            if current is not None:
+                if current[0] != version and kind not in self.loading and self.failed.get(kind) != version:
+                    self.loading.add(kind)
+                    threading.Thread(
+                        target=self.swap, args=(kind, version, config), name=f"model-{kind}", daemon=True
+                    ).start()
+                return current[1]
+            self.loading.add(kind)
+
+        # Loaded without the lock, which the other kinds are served under
+        try:
+            model = self.load(kind, version, config)
+            with self.lock:
+                self.models[kind] = (version, model)
+        finally:
+            with self.lock:
+                self.loading.discard(kind)
+                self.loaded.notify_all()
+        return model
+
+    def version(self, kind):
+        """Version of the model of `kind` currently served, None before it was loaded."""
+        with self.lock:
+            current = self.models.get(kind)
+            return current[0] if current else None
+
+    def load(self, kind, version, config):
+        start = time.monotonic()
+        model = self.loaders[kind](version, config or {})
+        if model is not None:
+            print(f"[Models] {kind} {version} loaded in {time.monotonic() - start:.1f}s")
+        return model
+
+    def swap(self, kind, version, config):
+        try:
+            model = self.load(kind, version, config)
+            if model is None:
+                raise ValueError("the loader returned no model")
+        except Exception as e:
+            print(f"[Models] Could not load {kind} {version}, keeping {self.version(kind)}: {e}")
+            with self.lock:
+                self.failed[kind] = version
+                self.loading.discard(kind)
+            return
+        with self.lock:
+            previous = self.models.get(kind)
+            self.models[kind] = (version, model)
+            self.loading.discard(kind)
+        print(f"[Models] Now serving {kind} {version}")
+        # Models with a thread of their own stop once done with their requests
+        if previous and hasattr(previous[1], 'close'):
+            previous[1].close()
+
+    def warm(self):
+        """Load every registered kind now rather than on first use."""
+        for kind in list(self.loaders):
+            try:
+                self.get(kind)
+            except Exception as e:
+                print(f"[Models] Could not load {kind}: {e}")
+
+
+registry = ModelRegistry()
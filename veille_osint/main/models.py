@@ -1,15 +1,29 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
-from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timedelta
 
-scheduler = BackgroundScheduler()
-scheduler.start()
+FREQUENCY_INTERVALS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+    'monthly': timedelta(days=30),
+}
+
+# Connector fetching each kind of site, see main.connectors
+CONNECTOR_CHOICES = [
+    ('newsapi', 'NewsAPI'),
+    ('rss', 'RSS / Atom'),
+    ('json_feed', 'JSON Feed'),
+]
 
 class Sites(models.Model):
     name = models.CharField(max_length=100)
     url = models.URLField(null=True)
+    connector = models.CharField(max_length=20, choices=CONNECTOR_CHOICES, default='newsapi')
+    # Requests in flight at once to the site, across all the scans fetching it
+    max_concurrency = models.PositiveSmallIntegerField(default=4)
 
     def __str__(self):
         return self.name
@@ -32,25 +46,19 @@ class ScanSchedule(models.Model):
         Create a new Scan instance based on this schedule.
         """
         print(f"Creating scan for schedule: {self.id} at {datetime.now()}")
-        scan = Scan.objects.create(
-            name=f"{self.name} {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            schedule=self,
-            scan_start_date=self.schedule_time,
-            status='pending',
-            keywords=self.keywords
-        )
-        scan.sites.set(self.sites.all())
+        # Queued for ingestion on commit, once its sites are set
+        with transaction.atomic():
+            scan = Scan.objects.create(
+                name=f"{self.name} {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                schedule=self,
+                scan_start_date=self.schedule_time,
+                status='pending',
+                keywords=self.keywords
+            )
+            scan.sites.set(self.sites.all())
         self.last_scan = scan
 
-        delta = None
-        if self.frequency == 'hourly':
-            delta = timedelta(hours=1)
-        if self.frequency == 'daily':
-            delta = timedelta(days=1)
-        elif self.frequency == 'weekly': 
-            delta = timedelta(weeks=1)
-        elif self.frequency == 'monthly':
-            delta = timedelta(days=30)
+        delta = FREQUENCY_INTERVALS.get(self.frequency)
 
         self.next_scan_time = datetime.now() + delta if delta else None
 
@@ -65,23 +73,66 @@ class Scan(models.Model):
     schedule = models.ForeignKey(ScanSchedule, related_name='scans', on_delete=models.SET_NULL, null=True, blank=True)
     scan_start_date = models.DateTimeField(auto_now_add=True)
     scan_end_date = models.DateTimeField(null=True, blank=True)
-    status = models.CharField(max_length=20, choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed')])
+    status = models.CharField(max_length=20, choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending')
     keywords = models.TextField(null=True, blank=True)
+    # Ingestion worker holding the scan while it runs, until its lease expires
+    claimed_by = models.CharField(max_length=100, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Scan whose archived payloads this one ran through the pipeline again
+    # (replay_scan command): never fetched, and its alerts aren't emailed
+    replay_of = models.ForeignKey('self', related_name='replays', on_delete=models.SET_NULL, null=True, blank=True)
 
     def __str__(self):
         sites_str = ", ".join([site.name for site in self.sites.all()])
         return f"Scan for {sites_str} on {self.scan_start_date.strftime('%Y-%m-%d %H:%M:%S')}"
 
+    @property
+    def result_count(self):
+        """Results of the scan, counting the articles an earlier scan stored (linked_results)."""
+        return self.results.count() + self.linked_results.count()
+
     
 class ScanResult(models.Model):
     scan = models.ForeignKey(Scan, related_name='results', on_delete=models.CASCADE)
     date_posted = models.DateTimeField()
     source = models.TextField()
     details = models.TextField()
+    # Fingerprints of the canonical URL and of the normalized title + details,
+    # used to recognise an article already stored by another scan
+    url_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # Later scans that found this same article
+    linked_scans = models.ManyToManyField(Scan, related_name='linked_results', blank=True)
+    # Title and main text of the article page, when ARTICLE_EXTRACTION_ENABLED
+    page_title = models.CharField(max_length=300, null=True, blank=True)
+    full_text = models.TextField(null=True, blank=True)
+    # Near-duplicates of the same story, see main.story_clusters
+    cluster = models.ForeignKey('StoryCluster', related_name='members', on_delete=models.SET_NULL, null=True, blank=True)
 
     def __str__(self):
         return f"Result for {self.source.name}"
     
+class IngestionWatermark(models.Model):
+    """
+    Publication time of the newest article ingested from a site for a keyword
+    of a schedule, and the URL fingerprint of that article (the cursor). The
+    next scan of the schedule only keeps strictly newer articles. `site` is
+    empty for scans without sites, which fetch NewsAPI.
+    """
+    schedule = models.ForeignKey(ScanSchedule, related_name='watermarks', on_delete=models.CASCADE)
+    site = models.ForeignKey(Sites, related_name='watermarks', on_delete=models.CASCADE, null=True, blank=True)
+    keyword = models.CharField(max_length=200)
+    published_at = models.DateTimeField()
+    cursor = models.CharField(max_length=64, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('schedule', 'site', 'keyword')
+
+    def __str__(self):
+        return f"{self.keyword} @ {self.published_at.strftime('%Y-%m-%d %H:%M:%S')}"
+    
 class ReseauSocial(ScanResult):
     auteur = models.CharField(max_length=100)
     nombre_commentaires = models.IntegerField()
@@ -99,6 +150,8 @@ class Alert(models.Model):
     message = models.TextField(null=True, blank=True)
     resolved = models.BooleanField(default=False)
     recommendations = models.TextField(null=True, blank=True)
+    # ClassifierModel version (and prompt) that gave the verdict
+    model_version = models.CharField(max_length=100, null=True, blank=True)
 
     def __str__(self):
         return f"Alert on {self.alert_date.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -121,6 +174,218 @@ class Alert(models.Model):
             else:
                 return self.recommendations
 
+class SchedulerLease(models.Model):
+    """
+    A named lock held by one process until `expires_at`, renewed while the
+    process is alive (see main.scheduler.acquire_lease).
+    """
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} lease held by {self.owner} until {self.expires_at.strftime('%Y-%m-%d %H:%M:%S')}"
+
+class UpstreamQuota(models.Model):
+    """
+    Requests made today to an external API by all processes, and the time
+    until which it asked us to stop calling it (see main.rate_limits).
+    """
+    upstream = models.CharField(max_length=50, unique=True)
+    day = models.DateField(null=True, blank=True)
+    used = models.PositiveIntegerField(default=0)
+    blocked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.upstream}: {self.used} requests on {self.day}"
+
+class ThreatKeyword(models.Model):
+    """
+    A term reported in alert messages when found in a result, with the
+    severity it suggests and its weight in the result's threat score.
+    """
+    term = models.CharField(max_length=100, unique=True)
+    severity = models.CharField(max_length=10, choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High')])
+    weight = models.FloatField(default=1.0)
+    active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.term} ({self.severity})"
+
+class ClassificationCache(models.Model):
+    """
+    Verdicts of the alert classifier, keyed by a hash of the normalized text,
+    the prompt version and the model name.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=100)
+    prompt_version = models.CharField(max_length=20)
+    severity = models.CharField(max_length=10)
+    recommendations = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.severity} verdict from {self.model_name} (prompt v{self.prompt_version})"
+
+class ClassificationTask(models.Model):
+    """
+    A stored result waiting for the classifier (main.classification_queue).
+    Results matching a high-severity term are taken first, then by threat
+    score. A failed attempt is retried after an exponential backoff, and a
+    task still failing after CLASSIFICATION_MAX_ATTEMPTS becomes a
+    ClassificationDeadLetter. Classified tasks are deleted.
+    """
+    result = models.OneToOneField(ScanResult, related_name='classification_task', on_delete=models.CASCADE)
+    urgent = models.BooleanField(default=False)
+    priority = models.FloatField(default=0)
+    status = models.CharField(max_length=20, choices=[('pending', 'Pending'), ('running', 'Running')], default='pending', db_index=True)
+    # Not taken again before then (backoff after a failure)
+    available_at = models.DateTimeField(db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Worker classifying it, until its lease expires
+    claimed_by = models.CharField(max_length=100, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Classification of result {self.result_id} ({self.status}, {self.attempts} attempts)"
+
+class ClassificationDeadLetter(models.Model):
+    """
+    A result that couldn't be classified in CLASSIFICATION_MAX_ATTEMPTS
+    attempts, kept with its last error until an operator requeues it (admin
+    or requeue_classifications command).
+    """
+    result = models.OneToOneField(ScanResult, related_name='classification_dead_letter', on_delete=models.CASCADE)
+    urgent = models.BooleanField(default=False)
+    priority = models.FloatField(default=0)
+    attempts = models.PositiveIntegerField()
+    error = models.TextField()
+    failed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Unclassified result {self.result_id}: {self.error[:80]}"
+
+class TrainingExample(models.Model):
+    """
+    A result labelled by Gemini, or relabelled "none" by a FalseAlert, with
+    the text it was judged on, for distilling the verdicts into the local
+    model (distill_local_model command). Holdout examples are never trained
+    on: local model versions are compared on them.
+    """
+    SOURCE_CHOICES = [('gemini', 'Gemini'), ('false_alert', 'Fausse alerte')]
+
+    result = models.OneToOneField(ScanResult, related_name='training_example', on_delete=models.CASCADE)
+    text = models.TextField()
+    label = models.CharField(max_length=10)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='gemini')
+    # ClassifierModel version (and prompt) that gave the label
+    model_version = models.CharField(max_length=100, null=True, blank=True)
+    holdout = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Distillation runs train on the examples changed since the last one
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.label} ({self.source}) for result {self.result_id}"
+
+class ClassifierModel(models.Model):
+    """
+    A version of one of the classifiers loaded by main.model_registry, with
+    the settings of its loader. Every process uses the active version of each
+    kind, and swaps to another within MODEL_REGISTRY_REFRESH_SECONDS of its
+    activation. Without an active row, the version in the settings is used.
+    """
+    KIND_CHOICES = [('gemini', 'Gemini'), ('local', 'Modèle local')]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    version = models.CharField(max_length=100)
+    # Gemini: {"model_name": ...}; local model: {"path": ".../model.h5"}
+    config = models.JSONField(default=dict, blank=True)
+    active = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'version')
+
+    def save(self, *args, **kwargs):
+        # One active version per kind
+        with transaction.atomic():
+            if self.active:
+                ClassifierModel.objects.filter(kind=self.kind, active=True).exclude(pk=self.pk).update(
+                    active=False, updated_at=now()
+                )
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.kind} {self.version}{' (active)' if self.active else ''}"
+
+class ArticleText(models.Model):
+    """
+    Title and main text extracted from an article page, keyed by the
+    fingerprint of its canonical URL, so that an article found again isn't
+    downloaded twice. Pages without article text are kept too, empty.
+    """
+    url_hash = models.CharField(max_length=64, unique=True)
+    url = models.TextField()
+    title = models.CharField(max_length=300, blank=True)
+    text = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Text of {self.url}"
+
+class StoryCluster(models.Model):
+    """
+    Results telling the same story under different URLs (syndicated wire
+    copies), grouped by MinHash LSH over their title and description. Only
+    the representative is classified; its verdict holds for every member.
+    """
+    representative = models.ForeignKey(ScanResult, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    # MinHash signature of the representative
+    signature = models.JSONField()
+    # Severity the classifier gave the representative, once it was classified
+    severity = models.CharField(max_length=10, null=True, blank=True)
+    size = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_seen_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Story of {self.size} results ({self.severity or 'not classified'})"
+
+class StoryBand(models.Model):
+    """
+    One LSH bucket of a cluster's signature: a new result sharing a bucket
+    with a cluster is compared with it.
+    """
+    key = models.CharField(max_length=40, db_index=True)
+    cluster = models.ForeignKey(StoryCluster, related_name='bands', on_delete=models.CASCADE)
+
+class RawPayload(models.Model):
+    """
+    A response body as an upstream sent it, stored gzipped under
+    PAYLOAD_ARCHIVE_DIR by the SHA-256 of its content, and the scans it was
+    fetched for. The replay_scan command parses it again offline.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    site = models.ForeignKey(Sites, related_name='payloads', on_delete=models.SET_NULL, null=True, blank=True)
+    # Sites.connector that parses it
+    connector = models.CharField(max_length=20)
+    # Request URL, without credentials
+    url = models.TextField()
+    size = models.PositiveBigIntegerField()
+    compressed_size = models.PositiveBigIntegerField()
+    fetched_at = models.DateTimeField(db_index=True)
+    scans = models.ManyToManyField(Scan, related_name='payloads', blank=True)
+
+    def __str__(self):
+        return f"Payload {self.sha256[:12]} from {self.url}"
+
 class FalseAlert(models.Model):
     alert = models.OneToOneField(Alert, related_name='false_alerts', on_delete=models.CASCADE)
     date_flagged = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,181 @@
+import asyncio
+from collections import namedtuple
+from datetime import timedelta
+import gzip
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from django.conf import settings
+from django.utils.timezone import now
+
+from .models import RawPayload
+from .upstreams import BlockingReader
+
+# Query parameters never written to the archive
+SECRET_PARAMS = {'apikey', 'api_key', 'key', 'token', 'access_token'}
+
+# A body archived by a connector, recorded once its source is done
+Payload = namedtuple('Payload', ['sha256', 'size', 'compressed_size', 'url', 'connector', 'site', 'fetched_at'])
+
+
+def payload_path(sha256):
+    return Path(settings.PAYLOAD_ARCHIVE_DIR) / sha256[:2] / sha256[2:4] / f"{sha256}.gz"
+
+
+def public_url(url):
+    """`url` without the credentials in its query string."""
+    parts = urlparse(str(url))
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key.lower() not in SECRET_PARAMS]
+    return parts._replace(query=urlencode(query)).geturl()
+
+
+class ArchivingReader:
+    """
+    Async reader passing through the body of a response while writing it,
+    gzipped, to a temporary file and hashing it. Once the body was read to
+    the end, the file is moved to the archive under its SHA-256 and `payload`
+    describes it; a body left half-read is discarded by `aclose`.
+
+    Compression, hashing and file operations run in worker threads, off the
+    event loop.
+    """
+
+    def __init__(self, reader, connector, url):
+        self.reader = reader
+        self.connector = connector
+        self.url = public_url(url)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.payload = None
+        self.file = None
+        self.gzip = None
+        self.done = False
+
+    async def read(self, size=-1):
+        chunk = await self.reader.read(size)
+        if self.done:
+            return chunk
+        if chunk:
+            await asyncio.to_thread(self.write, chunk)
+        elif size != 0:  # ijson reads nothing first to check the type
+            await asyncio.to_thread(self.finish)
+        return chunk
+
+    def write(self, chunk):
+        if self.gzip is None:
+            os.makedirs(settings.PAYLOAD_ARCHIVE_DIR, exist_ok=True)
+            self.file = tempfile.NamedTemporaryFile(dir=settings.PAYLOAD_ARCHIVE_DIR, suffix='.part', delete=False)
+            self.gzip = gzip.GzipFile(fileobj=self.file, mode='wb')
+        self.digest.update(chunk)
+        self.gzip.write(chunk)
+        self.size += len(chunk)
+
+    def finish(self):
+        self.done = True
+        if self.gzip is None:  # Empty body, nothing worth replaying
+            return
+        self.gzip.close()
+        self.file.close()
+        self.gzip = None
+        sha256 = self.digest.hexdigest()
+        path = payload_path(sha256)
+        compressed_size = os.path.getsize(self.file.name)
+        if path.exists():
+            os.remove(self.file.name)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.file.name, path)
+        self.payload = Payload(
+            sha256, self.size, compressed_size, self.url, self.connector.name, self.connector.site, now()
+        )
+
+    async def aclose(self):
+        self.done = True
+        if self.gzip is not None:
+            await asyncio.to_thread(self.discard)
+
+    def discard(self):
+        self.gzip.close()
+        self.file.close()
+        self.gzip = None
+        os.remove(self.file.name)
+
+
+def record_payloads(payloads, scans):
+    """
+    Register archived payloads and link them to the scans they were fetched
+    for. Runs on the storage thread; a failure only costs the replay.
+    """
+    try:
+        for payload in payloads:
+            raw_payload, _ = RawPayload.objects.get_or_create(
+                sha256=payload.sha256,
+                defaults={
+                    'site': payload.site if payload.site.pk else None,
+                    'connector': payload.connector,
+                    'url': payload.url,
+                    'size': payload.size,
+                    'compressed_size': payload.compressed_size,
+                    'fetched_at': payload.fetched_at,
+                },
+            )
+            raw_payload.scans.add(*scans)
+    except Exception as e:
+        print(f"[Archive] Could not record {len(payloads)} payloads: {e}")
+
+
+def prune_payloads(days):
+    """
+    Delete the archived payloads fetched more than `days` days ago that no
+    scan of that period used, and the temporary files interrupted fetches
+    left behind. Returns the number of payloads deleted.
+    """
+    cutoff = now() - timedelta(days=days)
+    stale = RawPayload.objects.filter(fetched_at__lt=cutoff).exclude(scans__scan_start_date__gte=cutoff)
+    deleted = []
+    for payload in stale.only('id', 'sha256').iterator():
+        try:
+            os.remove(payload_path(payload.sha256))
+        except FileNotFoundError:
+            pass
+        deleted.append(payload.id)
+    for start in range(0, len(deleted), 500):
+        RawPayload.objects.filter(id__in=deleted[start:start + 500]).delete()
+
+    for part in Path(settings.PAYLOAD_ARCHIVE_DIR).glob('*.part'):
+        if part.stat().st_mtime < cutoff.timestamp():
+            part.unlink(missing_ok=True)
+    return len(deleted)
+
+
+class ArchivedConnector:
+    """
+    Stands in for a site's connector during a replay: yields the articles
+    its parser reads from archived payloads instead of fetching anything.
+    """
+
+    def __init__(self, connector, payloads):
+        self.connector = connector
+        self.payloads = payloads
+        self.priority = connector.priority
+        self.complete = True
+        self.truncated = False
+        self.archived = []
+
+    async def fetch(self, since, terms):
+        for payload in self.payloads:
+            try:
+                file = await asyncio.to_thread(gzip.open, payload_path(payload.sha256), 'rb')
+            except OSError as e:
+                print(f"[Archive] Payload {payload.sha256} is gone: {e}")
+                self.complete = False
+                continue
+            try:
+                async for article in self.connector.parse(BlockingReader(file)):
+                    if since is None or article.date_posted > since:
+                        yield article
+            finally:
+                file.close()
@@ -0,0 +1,229 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+
+from .models import ScanResult, Journal
+from .classification_queue import enqueue_classification
+from .story_clusters import assign_clusters
+from .dedup import url_fingerprint, content_fingerprint
+
+
+class StorageThread:
+    """
+    The thread storing what an ingestion event loop fetches, so fetches never
+    wait on the database. Up to INGESTION_STORAGE_QUEUE batches are queued
+    without blocking; past that, whoever hands over one more waits for the
+    thread to catch up, which bounds the articles held in memory.
+    """
+
+    def __init__(self, max_pending=None):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestion-storage")
+        self.slots = asyncio.Semaphore(max_pending or settings.INGESTION_STORAGE_QUEUE)
+
+    async def submit(self, function, *args):
+        """
+        Queue `function(*args)` and return the future of its result.
+        """
+        await self.slots.acquire()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self.executor, close_old_connections)
+        self.executor.shutdown()
+
+
+class JournalBatchWriter:
+    """
+    Buffer the articles of a scan in memory and write them as Journal rows in
+    chunks of `batch_size`.
+
+    Each chunk costs one transaction: one multi-row INSERT for the ScanResult
+    parents, one for the Journal children (plus one SELECT to read the new ids
+    back on backends such as MySQL that don't return them). The chunk is then
+    queued for classification, instead of classified through a post_save per
+    row.
+
+    Articles whose URL or content fingerprint is already stored are not
+    written again: the existing result is linked to the scan instead, and
+    isn't classified a second time. Near-duplicates of a story already
+    stored are written, but join its cluster and share its verdict.
+
+    The results of a replay (a scan with replay_of) are all written again,
+    without clustering, and classified unless `classify` is False. Other
+    scans never take them for the stored copy of an article.
+
+    The writer is thread-safe: articles may be added from several threads,
+    each chunk being written by whichever one fills it.
+    """
+
+    def __init__(self, scan, batch_size=None, classify=True):
+        self.scan = scan
+        self.batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+        self.classify = classify
+        self.pending = []
+        self.written = 0
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, source, details, date_posted, titre, auteur, page_title=None, full_text=None):
+        journal = Journal(
+            scan=self.scan,
+            source=source,
+            details=details,
+            date_posted=date_posted,
+            titre=titre[:200],
+            auteur=auteur[:100],
+            page_title=page_title[:300] if page_title else None,
+            full_text=full_text,
+            url_hash=url_fingerprint(source),
+            content_hash=content_fingerprint(titre, details),
+        )
+        with self.lock:
+            self.pending.append(journal)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows, then queue them for classification.
+        """
+        with self.lock:
+            if not self.pending:
+                return []
+
+            batch, self.pending = self.pending, []
+            with transaction.atomic():
+                journals = self._skip_seen(batch)
+                if journals:
+                    self._insert(journals)
+            self.written += len(journals)
+
+        print(f"Wrote {len(journals)} results for scan {self.scan.id}, skipped {len(batch) - len(journals)} already seen")
+        if journals and settings.STORY_CLUSTERING_ENABLED and not self.scan.replay_of_id:
+            try:
+                assign_clusters(journals)
+            except Exception as e:
+                # Unclustered results are each classified
+                print(f"Error clustering the results of scan {self.scan.id}: {e}")
+        if self.classify:
+            enqueue_classification(journals)
+        return journals
+
+    def _skip_seen(self, journals):
+        """
+        Drop the articles already stored (by this or an earlier scan) or
+        repeated within the batch, linking earlier scans' results to this one.
+        """
+        url_hashes = {journal.url_hash for journal in journals if journal.url_hash}
+        content_hashes = {journal.content_hash for journal in journals if journal.content_hash}
+
+        seen = {}
+        if url_hashes or content_hashes:
+            existing = (
+                ScanResult.objects
+                .filter(Q(url_hash__in=url_hashes) | Q(content_hash__in=content_hashes))
+                .values_list('id', 'scan_id', 'url_hash', 'content_hash')
+            )
+            if self.scan.replay_of_id:
+                existing = existing.filter(scan=self.scan)
+            else:
+                existing = existing.filter(scan__replay_of__isnull=True)
+            for pk, scan_id, url_hash, content_hash in existing:
+                for fingerprint in (url_hash, content_hash):
+                    if fingerprint:
+                        seen.setdefault(fingerprint, (pk, scan_id))
+
+        new_journals = []
+        linked_ids = set()
+        for journal in journals:
+            match = seen.get(journal.url_hash) or seen.get(journal.content_hash)
+            if match is None:
+                new_journals.append(journal)
+                for fingerprint in (journal.url_hash, journal.content_hash):
+                    if fingerprint:
+                        seen[fingerprint] = (None, self.scan.id)
+                continue
+
+            pk, scan_id = match
+            if scan_id != self.scan.id:
+                linked_ids.add(pk)
+
+        if linked_ids:
+            Link = ScanResult.linked_scans.through
+            Link.objects.bulk_create(
+                [Link(scanresult_id=pk, scan_id=self.scan.id) for pk in linked_ids],
+                ignore_conflicts=True,
+            )
+
+        return new_journals
+
+    def _insert(self, journals):
+        parents = ScanResult.objects.bulk_create([
+            ScanResult(
+                scan=self.scan,
+                source=journal.source,
+                details=journal.details,
+                date_posted=journal.date_posted,
+                url_hash=journal.url_hash,
+                content_hash=journal.content_hash,
+                page_title=journal.page_title,
+                full_text=journal.full_text,
+            )
+            for journal in journals
+        ])
+        ids = [parent.pk for parent in parents]
+        if None in ids:
+            ids = self._read_back_ids(journals)
+
+        for journal, pk in zip(journals, ids):
+            journal.id = pk
+            journal.scanresult_ptr_id = pk
+            journal._state.adding = False
+            journal._state.db = connection.alias
+
+        # bulk_create() refuses multi-table inherited models, so the child
+        # rows are written with a single executemany.
+        table = connection.ops.quote_name(Journal._meta.db_table)
+        columns = ", ".join(
+            connection.ops.quote_name(Journal._meta.get_field(name).column)
+            for name in ('scanresult_ptr', 'titre', 'auteur')
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} ({columns}) VALUES (%s, %s, %s)",
+                [(journal.pk, journal.titre, journal.auteur) for journal in journals],
+            )
+
+    def _read_back_ids(self, journals):
+        """
+        Recover the ids of rows just inserted by bulk_create() on backends that
+        can't return them: they are the scan's results that have no Journal yet.
+        """
+        rows = (
+            ScanResult.objects
+            .filter(scan=self.scan, journal__isnull=True, source__in={journal.source for journal in journals})
+            .order_by('-id')
+            .values_list('id', 'source')
+        )
+        ids_by_source = {}
+        for pk, source in rows:
+            ids_by_source.setdefault(source, []).append(pk)
+
+        # Newest rows of each source, consumed oldest first, line up with the
+        # order of the batch.
+        ids = []
+        for journal in reversed(journals):
+            ids.append(ids_by_source[journal.source].pop(0))
+        return list(reversed(ids))
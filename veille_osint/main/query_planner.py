@@ -0,0 +1,222 @@
+from django.conf import settings
+
+from .connectors import ConnectorError, get_connector_class
+from .connectors.newsapi import build_query
+from .models import Sites
+from .pipeline import JournalBatchWriter
+from .rate_limits import PRIORITY_BACKFILL, PRIORITY_QUICK, PRIORITY_SCHEDULED, RateLimited
+from .upstreams import CircuitOpen
+from .watermarks import WatermarkTracker, found_terms, keyword_terms
+
+
+def default_sites():
+    """
+    Sites of scans created without any: NewsAPI, which every scan used
+    before sites had connectors.
+    """
+    return list(Sites.objects.filter(connector='newsapi')[:1]) or [
+        Sites(name='News API', url='https://newsapi.org', connector='newsapi')
+    ]
+
+
+def distinct_sites(sites):
+    """
+    The sites to fetch for a scan: of sites read from the same endpoint by the
+    same connector (every NewsAPI site is), only the first by id is kept, so
+    the same queries aren't sent once per site.
+    """
+    kept = {}
+    for site in sorted(sites, key=lambda site: site.pk):
+        try:
+            key = (site.connector, get_connector_class(site.connector).endpoint(site))
+        except ConnectorError:
+            key = (site.connector, site.pk)  # Reported when the sources are planned
+        kept.setdefault(key, site)
+    return list(kept.values())
+
+
+class ScanPlan:
+    """
+    A claimed scan within a plan: its terms, sites, per-site watermarks and
+    batch writer.
+
+    `error` is set once the scan can no longer complete, `deferred` when it
+    must run again later because an upstream's budget ran out or it is down.
+    A site failing otherwise only fails the scan if no other site could be
+    fetched (`failures`, `fetched`).
+    """
+
+    def __init__(self, scan):
+        self.scan = scan
+        self.terms = keyword_terms(scan.keywords)
+        self.sites = distinct_sites(scan.sites.all()) or default_sites()
+        self.trackers = {site.id: WatermarkTracker(scan.schedule, self.terms, site) for site in self.sites}
+        self.writer = JournalBatchWriter(scan)
+        self.seen = set()
+        self.error = None
+        self.deferred = False
+        self.failures = []
+        self.fetched = False
+
+    def since(self):
+        """Start of the oldest window fetched for the scan, None for a full one."""
+        sinces = [tracker.since() for tracker in self.trackers.values()]
+        return None if None in sinces else min(sinces, default=None)
+
+    def priority(self, site):
+        if self.scan.schedule_id is None:
+            return PRIORITY_QUICK
+        if self.trackers[site.id].since() is None:
+            return PRIORITY_BACKFILL
+        return PRIORITY_SCHEDULED
+
+    def commit(self):
+        for tracker in self.trackers.values():
+            tracker.commit()
+
+
+class Source:
+    """
+    One fetch from a site on behalf of some scans: the terms it covers, the
+    start of its window and the scans its articles may belong to.
+    """
+
+    def __init__(self, site, terms, plans, since, query_based):
+        self.site = site
+        self.terms = terms
+        self.plans = plans
+        self.since = since
+        self.query_based = query_based
+        self.priority = min(plan.priority(site) for plan in plans)
+
+    def route(self, *texts):
+        """
+        Yield each scan an article of this source belongs to, with the terms
+        it matched for that scan. NewsAPI also matches on content we don't
+        receive, so an article of a query showing none of its terms is
+        credited to all of them; a feed article must show one.
+        """
+        found = found_terms(self.terms, *texts)
+        if not found and self.query_based:
+            found = self.terms
+        for plan in self.plans:
+            terms = [term for term in plan.terms if term in found]
+            if terms:
+                yield plan, terms
+
+    def tracker(self, plan):
+        return plan.trackers[self.site.id]
+
+    def fail(self, error):
+        """
+        Nothing could be fetched: the scans are deferred if the upstream's
+        budget is spent or its circuit is open, else the site counts as failed
+        for them and their watermarks for it stay put.
+        """
+        for plan in self.plans:
+            if isinstance(error, (RateLimited, CircuitOpen)):
+                plan.deferred = True
+            else:
+                plan.failures.append(error)
+                self.tracker(plan).complete = False
+
+    def split(self):
+        """
+        Two queries sharing this one's terms, for when the upstream capped its
+        results: each half matches fewer articles, so fewer are left out.
+        """
+        middle = len(self.terms) // 2
+        return [query_source(self.site, terms, self.plans) for terms in (self.terms[:middle], self.terms[middle:])]
+
+    def done(self, complete):
+        """The fetch ended, having missed part of the window if not `complete`."""
+        for plan in self.plans:
+            plan.fetched = True
+            if not complete:
+                self.tracker(plan).complete = False
+
+
+def term_since(term, plans, site):
+    """
+    Where fetching a term from a site must start for every scan using it: its
+    oldest watermark, or None if one of the scans never fetched it.
+    """
+    sinces = []
+    for plan in plans:
+        watermark = plan.trackers[site.id].current.get(term)
+        if watermark is None:
+            return None
+        sinces.append(watermark[0])
+    return min(sinces)
+
+
+def plan_queries(site, plans, max_length=None):
+    """
+    Deduplicate the terms of the scans fetching a query-based site and pack
+    them into as few queries as NEWS_API_MAX_QUERY_LENGTH allows.
+
+    Terms are packed by watermark, so that terms fetched recently share a
+    query instead of being fetched again from the start of a new term's window.
+    A query matching more results than NewsAPI lets through is split when
+    fetched (Source.split), so packing costs requests rather than articles.
+    """
+    max_length = max_length or settings.NEWS_API_MAX_QUERY_LENGTH
+
+    users = {}
+    for plan in plans:
+        for term in plan.terms:
+            users.setdefault(term, []).append(plan)
+    sinces = {term: term_since(term, term_plans, site) for term, term_plans in users.items()}
+    ordered = sorted(users, key=lambda term: (sinces[term] is not None, sinces[term].timestamp() if sinces[term] else 0, term))
+
+    groups = []
+    for term in ordered:
+        if groups and len(build_query(groups[-1] + [term])) <= max_length:
+            groups[-1].append(term)
+        else:
+            groups.append([term])
+
+    return [query_source(site, terms, plans) for terms in groups]
+
+
+def query_source(site, terms, plans):
+    """The query of `terms` to a query-based site, for those of the scans using them."""
+    query_plans = [plan for plan in plans if any(term in plan.terms for term in terms)]
+    sinces = [term_since(term, [plan for plan in query_plans if term in plan.terms], site) for term in terms]
+    since = None if None in sinces else min(sinces)
+    return Source(site, terms, query_plans, since, query_based=True)
+
+
+def plan_sources(plans, max_length=None):
+    """
+    The fetches covering every site of every scan: query-based sites get
+    shared queries, feeds are fetched once for all the scans using them.
+    """
+    sites = {}
+    for plan in plans:
+        for site in plan.sites:
+            sites.setdefault(site.id, (site, []))[1].append(plan)
+
+    sources = []
+    for site, site_plans in sites.values():
+        site_plans = [plan for plan in site_plans if plan.terms]
+        if not site_plans:
+            continue
+        try:
+            connector_class = get_connector_class(site.connector)
+        except ConnectorError as e:
+            print(f"[Ingestion] Site {site} skipped: {e}")
+            for plan in site_plans:
+                plan.failures.append(e)
+            continue
+
+        if connector_class.query_based:
+            sources += plan_queries(site, site_plans, max_length)
+        else:
+            terms = []
+            for plan in site_plans:
+                terms += [term for term in plan.terms if term not in terms]
+            sinces = [plan.trackers[site.id].since() for plan in site_plans]
+            since = None if None in sinces else min(sinces)
+            sources.append(Source(site, terms, site_plans, since, query_based=False))
+    return sources
@@ -0,0 +1,276 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .models import UpstreamQuota
+
+# Priority classes, most urgent first
+PRIORITY_QUICK = 0  # Scans started by a user
+PRIORITY_SCHEDULED = 1  # Scheduled scans fetching from their watermarks
+PRIORITY_BACKFILL = 2  # Scheduled scans fetching their whole window
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+class RateLimited(requests.RequestException):
+    """
+    The upstream's budget is spent, or it asked us to slow down. Existing
+    RequestException handlers treat it like any failed call.
+    """
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} rate limited, retry in {retry_after:.0f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(response, default=60):
+    """
+    Seconds to wait according to a response's Retry-After header (a number
+    of seconds or an HTTP date), or `default` without one.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return default
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - now()).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+def seconds_until_tomorrow():
+    tomorrow = datetime.combine(now().date() + timedelta(days=1), datetime.min.time(), tzinfo=now().tzinfo)
+    return (tomorrow - now()).total_seconds()
+
+
+class UpstreamGovernor:
+    """
+    Budget of one upstream API: a token bucket refilled at `rate` requests
+    per second up to `burst`, shared by the threads of the process, and a
+    daily quota of requests, counted in the database for every process when
+    RATE_LIMIT_SHARED.
+
+    Each lower priority class leaves another RATE_LIMIT_PRIORITY_RESERVE of
+    the bucket and of the daily quota unused, so backfills are refused before
+    scheduled scans, and those before quick scans. A 429 pauses every caller
+    for the Retry-After delay.
+    """
+
+    def __init__(self, name, rate, burst, daily_quota=0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.daily_quota = daily_quota
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0  # Wall-clock time
+        self.day = None
+        self.used_today = 0
+        self.granted = 0
+        self.denied = 0
+        self.throttled = 0
+        self.condition = threading.Condition()
+
+    def reserve(self, capacity, priority):
+        return capacity * settings.RATE_LIMIT_PRIORITY_RESERVE * priority
+
+    def _refill(self):
+        current = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (current - self.updated) * self.rate)
+        self.updated = current
+
+    def paused_for(self):
+        return max(self.blocked_until - time.time(), 0)
+
+    def acquire(self, priority=PRIORITY_SCHEDULED, max_wait=None):
+        """
+        Take one request from the budget, waiting up to `max_wait` seconds
+        (RATE_LIMIT_MAX_WAIT) for a token. Raises RateLimited if none comes in
+        time, the upstream is paused for longer, or the daily quota left to
+        this priority is spent.
+        """
+        max_wait = settings.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        floor = self.reserve(self.burst, priority)
+
+        with self.condition:
+            while True:
+                wait = self.paused_for()
+                if not wait:
+                    self._refill()
+                    if self.tokens - 1 >= floor:
+                        self.tokens -= 1
+                        break
+                    wait = (floor + 1 - self.tokens) / self.rate
+                if wait > deadline - time.monotonic():
+                    self.denied += 1
+                    raise RateLimited(self.name, wait)
+                self.condition.wait(wait)
+
+        retry_after = self.consume_quota(priority)
+        if retry_after is not None:
+            with self.condition:
+                self.tokens = min(self.burst, self.tokens + 1)
+                self.denied += 1
+            raise RateLimited(self.name, retry_after)
+
+        with self.condition:
+            self.granted += 1
+
+    def consume_quota(self, priority):
+        """
+        Count one request against the daily quota. Returns None if it was
+        allowed, else the seconds to wait.
+        """
+        limit = self.daily_quota - self.reserve(self.daily_quota, priority) if self.daily_quota else None
+
+        # Shared counts also carry the pauses asked by 429s to other processes
+        if settings.RATE_LIMIT_SHARED:
+            try:
+                return self._consume_shared(limit)
+            except DatabaseError as e:
+                # Don't stop every call because the quota table is unavailable
+                print(f"[RateLimit] Could not count {self.name} request: {e}")
+
+        if limit is None:
+            return None
+        with self.condition:
+            today = now().date()
+            if self.day != today:
+                self.day, self.used_today = today, 0
+            if self.used_today >= limit:
+                return seconds_until_tomorrow()
+            self.used_today += 1
+        return None
+
+    def _consume_shared(self, limit):
+        today = now().date()
+        available = UpstreamQuota.objects.filter(upstream=self.name).filter(
+            Q(blocked_until__isnull=True) | Q(blocked_until__lte=now())
+        )
+        counted = available.filter(day=today)
+        if limit is not None:
+            counted = counted.filter(used__lt=limit)
+        if counted.update(used=F('used') + 1):
+            return None
+        # First request of the day
+        if (limit is None or limit >= 1) and available.exclude(day=today).update(day=today, used=1):
+            return None
+
+        quota = UpstreamQuota.objects.filter(upstream=self.name).first()
+        if quota is None:
+            try:
+                UpstreamQuota.objects.create(upstream=self.name, day=today, used=1)
+                return None
+            except IntegrityError:
+                return self._consume_shared(limit)
+        if quota.blocked_until and quota.blocked_until > now():
+            # Another process got a 429
+            with self.condition:
+                self.blocked_until = max(self.blocked_until, quota.blocked_until.timestamp())
+            return (quota.blocked_until - now()).total_seconds()
+        return seconds_until_tomorrow()
+
+    def back_off(self, seconds):
+        """
+        Stop every caller, in every process, for `seconds`.
+        """
+        with self.condition:
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+            self.condition.notify_all()
+        print(f"[RateLimit] {self.name} asked us to wait {seconds:.0f}s")
+
+        if settings.RATE_LIMIT_SHARED:
+            blocked_until = now() + timedelta(seconds=seconds)
+            try:
+                updated = UpstreamQuota.objects.filter(upstream=self.name).filter(
+                    Q(blocked_until__isnull=True) | Q(blocked_until__lt=blocked_until)
+                ).update(blocked_until=blocked_until)
+                if not updated:
+                    UpstreamQuota.objects.get_or_create(upstream=self.name, defaults={'blocked_until': blocked_until})
+            except DatabaseError as e:
+                print(f"[RateLimit] Could not share {self.name} pause: {e}")
+
+    def observe(self, response):
+        """
+        Back off and raise RateLimited if the upstream answered 429.
+        """
+        if response.status_code == 429:
+            seconds = retry_after_seconds(response)
+            self.back_off(seconds)
+            raise RateLimited(self.name, seconds)
+
+    def used(self):
+        if settings.RATE_LIMIT_SHARED:
+            try:
+                quota = UpstreamQuota.objects.filter(upstream=self.name).first()
+            except DatabaseError:
+                quota = None
+            if quota is not None:
+                if quota.blocked_until and quota.blocked_until > now():
+                    with self.condition:
+                        self.blocked_until = max(self.blocked_until, quota.blocked_until.timestamp())
+                return quota.used if quota.day == now().date() else 0
+        return self.used_today if self.day == now().date() else 0
+
+    def should_defer(self, priority):
+        """
+        Whether work of this priority should wait: the upstream is paused, or
+        what's left of the daily quota is reserved for higher priorities.
+        """
+        used = self.used()
+        if self.paused_for():
+            return True
+        return bool(self.daily_quota) and used >= self.daily_quota - self.reserve(self.daily_quota, priority)
+
+    def usage(self):
+        used = self.used()
+        with self.condition:
+            self._refill()
+            return {
+                'upstream': self.name,
+                'tokens': round(self.tokens, 2),
+                'burst': self.burst,
+                'rate': self.rate,
+                'daily_quota': self.daily_quota,
+                'used_today': used,
+                'paused_for': round(self.paused_for()),
+                'granted': self.granted,
+                'denied': self.denied,
+                'throttled': self.throttled,
+            }
+
+
+# Configurations shared by many hosts, each getting its own governor, rather
+# than upstreams of their own
+PROFILES = ('feeds', 'articles')
+
+
+def get_governor(name, profile=None):
+    """
+    The process-wide governor of an upstream configured in RATE_LIMITS, or
+    configured like `profile` if it isn't.
+    """
+    with _governors_lock:
+        if name not in _governors:
+            config = settings.RATE_LIMITS.get(name) or settings.RATE_LIMITS[profile]
+            _governors[name] = UpstreamGovernor(name, **config)
+        return _governors[name]
+
+
+def quota_usage():
+    """Current budget of every configured upstream."""
+    return [get_governor(name).usage() for name in settings.RATE_LIMITS if name not in PROFILES]
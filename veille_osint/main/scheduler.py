@@ -1,16 +1,199 @@
 # main/scheduler.py
+import atexit
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from django.conf import settings
-import os
+from django.db import DatabaseError, IntegrityError, close_old_connections
+from django.db.models import Q
+from django.utils.timezone import now
+from django_apscheduler.jobstores import DjangoJobStore
+
+from .models import FREQUENCY_INTERVALS, ScanSchedule, SchedulerLease
+
+# Jobs live in the database so they survive restarts and are shared by every
+# process. All processes start the scheduler paused (so they can still add and
+# remove jobs); only the holder of the "scheduler" lease resumes it and runs them.
+scheduler = BackgroundScheduler(
+    timezone=settings.TIME_ZONE,
+    jobstores={'default': DjangoJobStore()},
+    job_defaults={
+        'coalesce': True,  # Run missed occurrences once, not once per occurrence
+        'max_instances': 1,
+        'misfire_grace_time': settings.SCHEDULER_MISFIRE_GRACE_TIME,
+    },
+)
+
+LEASE_NAME = 'scheduler'
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_started = False
+
+# Management commands that must not touch the job store (it may not exist yet)
+COMMANDS_WITHOUT_SCHEDULER = {
+    'check', 'collectstatic', 'makemigrations', 'migrate', 'showmigrations',
+    'sqlmigrate', 'squashmigrations', 'test',
+}
 
-scheduler = BackgroundScheduler(timezone=settings.TIME_ZONE)
 
 def start_scheduler():
     """
-    Start the APScheduler once when Django boots.
+    Start the APScheduler once when Django boots, paused until this process
+    holds the scheduler lease. Returns True if it was started, so that the
+    process's other background work can start along with it.
+    """
+    global _started
+    if not settings.SCHEDULER_AUTOSTART or _started:
+        return False
+
+    command = sys.argv[1] if len(sys.argv) > 1 and sys.argv[0].endswith('manage.py') else None
+    if command in COMMANDS_WITHOUT_SCHEDULER:
+        return False
+    # Prevent double-start with runserver autoreload
+    if command == 'runserver' and os.environ.get("RUN_MAIN", None) != "true" and '--noreload' not in sys.argv:
+        return False
+
+    # Starting touches the job store, which mustn't happen while apps load
+    threading.Thread(target=lease_loop, name="scheduler-lease", daemon=True).start()
+    atexit.register(release_lease, LEASE_NAME, LEASE_OWNER)
+    _started = True
+    return True
+
+
+def acquire_lease(name, owner, ttl):
+    """
+    Take or renew the named lease for `ttl` seconds. Returns True if `owner`
+    holds it afterwards.
     """
-    if not scheduler.running:
-        # Prevent double-start with runserver autoreload
-        if os.environ.get("RUN_MAIN", None) == "true":
-            scheduler.start()
-            print("✅ APScheduler started")
+    expires_at = now() + timedelta(seconds=ttl)
+    renewed = (
+        SchedulerLease.objects
+        .filter(name=name)
+        .filter(Q(owner=owner) | Q(expires_at__lt=now()))
+        .update(owner=owner, expires_at=expires_at)
+    )
+    if renewed:
+        return True
+
+    try:
+        SchedulerLease.objects.create(name=name, owner=owner, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_lease(name, owner):
+    try:
+        SchedulerLease.objects.filter(name=name, owner=owner).delete()
+    except DatabaseError:
+        pass
+
+
+def lease_loop():
+    """
+    Renew (or try to take) the scheduler lease forever, resuming the scheduler
+    while this process leads and pausing it when the lease is lost.
+    """
+    scheduler.start(paused=True)
+    print(f"✅ APScheduler started ({LEASE_OWNER}), waiting for the scheduler lease")
+
+    while True:
+        close_old_connections()
+        try:
+            leader = acquire_lease(LEASE_NAME, LEASE_OWNER, settings.SCHEDULER_LEASE_TTL)
+        except DatabaseError as e:
+            print(f"[Scheduler] Could not renew lease: {e}")
+            leader = False
+
+        if leader and scheduler.state == STATE_PAUSED:
+            print(f"👑 {LEASE_OWNER} is now the scheduler leader")
+            rehydrate_jobs()
+            scheduler.resume()
+        elif not leader and scheduler.state == STATE_RUNNING:
+            print(f"[Scheduler] {LEASE_OWNER} lost the scheduler lease, pausing")
+            scheduler.pause()
+        elif leader:
+            # Pick up jobs added to the store by other processes
+            scheduler.wakeup()
+
+        time.sleep(settings.SCHEDULER_LEASE_RENEW_SECONDS)
+
+
+def job_id(schedule_id):
+    return f"scan_{schedule_id}"
+
+
+def run_schedule(schedule_id):
+    """
+    Job entry point: create the next scan of a schedule.
+    """
+    close_old_connections()
+    try:
+        schedule = ScanSchedule.objects.filter(id=schedule_id).first()
+        if schedule is None:
+            print(f"Schedule {schedule_id} no longer exists, removing its job.")
+            remove_schedule_job(schedule_id)
+            return
+        schedule.create_scan()
+    finally:
+        close_old_connections()
+
+
+def add_schedule_job(schedule):
+    """
+    Add or replace the job running a schedule: once at schedule_time, then
+    at its frequency.
+    """
+    interval = FREQUENCY_INTERVALS.get(schedule.frequency)
+    if interval:
+        trigger = IntervalTrigger(seconds=int(interval.total_seconds()), start_date=schedule.schedule_time, timezone=settings.TIME_ZONE)
+    else:
+        trigger = DateTrigger(run_date=schedule.schedule_time, timezone=settings.TIME_ZONE)
+
+    scheduler.add_job(
+        run_schedule,
+        trigger,
+        args=[schedule.id],
+        id=job_id(schedule.id),
+        name=schedule.name or job_id(schedule.id),
+        replace_existing=True,
+    )
+    print(f"📅 Scheduled scan {schedule.id}")
+
+
+def remove_schedule_job(schedule_id):
+    try:
+        scheduler.remove_job(job_id(schedule_id))
+        print(f"🗑️ Removed job {job_id(schedule_id)}")
+    except JobLookupError:
+        pass
+
+
+def rehydrate_jobs():
+    """
+    Make the job store match the ScanSchedule table: (re)write the job of
+    every schedule, so that a job missing or left with an outdated trigger
+    (schedule edited while no process led) is fixed, and drop the jobs of
+    deleted schedules.
+    """
+    schedules = list(ScanSchedule.objects.all())
+    wanted = {job_id(schedule.id) for schedule in schedules}
+
+    for job in scheduler.get_jobs():
+        if job.id.startswith('scan_') and job.id not in wanted:
+            scheduler.remove_job(job.id)
+
+    for schedule in schedules:
+        # Replaces the existing job, if any
+        add_schedule_job(schedule)
+    print(f"[Scheduler] {len(schedules)} schedule jobs restored")
@@ -0,0 +1,130 @@
+import hashlib
+import random
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import F
+from django.utils.timezone import now
+
+from .dedup import MIN_CONTENT_LENGTH, normalize_content
+from .models import ScanResult, StoryBand, StoryCluster
+
+# Words per shingle
+SHINGLE_SIZE = 3
+
+# Mersenne prime of the universal hash family (a * x + b) mod P
+PRIME = (1 << 61) - 1
+
+
+@lru_cache(maxsize=None)
+def permutations(count):
+    """Coefficients of the hash functions, the same in every process."""
+    generator = random.Random(count)
+    return [(generator.randrange(1, PRIME), generator.randrange(0, PRIME)) for _ in range(count)]
+
+
+def shingles(content):
+    words = content.split()
+    if len(words) <= SHINGLE_SIZE:
+        return {content}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def minhash(content):
+    """
+    MinHash signature of a normalized text: for each hash function, the
+    smallest hash of its shingles. Two signatures agree on about as many
+    positions as the Jaccard similarity of the shingle sets.
+    """
+    hashes = [hash64(shingle) for shingle in shingles(content)]
+    return [
+        min((a * value + b) % PRIME for value in hashes)
+        for a, b in permutations(settings.STORY_LSH_BANDS * settings.STORY_LSH_ROWS)
+    ]
+
+
+def band_keys(signature):
+    """
+    LSH buckets of a signature, one per band of STORY_LSH_ROWS values:
+    near-duplicates very likely share at least one.
+    """
+    rows = settings.STORY_LSH_ROWS
+    keys = []
+    for band in range(settings.STORY_LSH_BANDS):
+        values = signature[band * rows:(band + 1) * rows]
+        digest = hashlib.blake2b(repr(values).encode('ascii'), digest_size=8).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+def similarity(signature, other):
+    if len(signature) != len(other):
+        return 0
+    return sum(a == b for a, b in zip(signature, other)) / len(signature)
+
+
+def story_content(scan_result):
+    content = normalize_content(getattr(scan_result, 'titre', ''), scan_result.details)
+    return content if len(content) >= MIN_CONTENT_LENGTH else None
+
+
+def assign_clusters(scan_results):
+    """
+    Put each stored result in the cluster of the story it tells: that of a
+    near-duplicate seen in the last STORY_CLUSTER_WINDOW_HOURS, found through
+    the LSH buckets, or a new cluster it represents. Results without enough
+    text to compare stay out of clusters.
+    """
+    signatures = {}
+    for scan_result in scan_results:
+        content = story_content(scan_result)
+        if content:
+            signatures[scan_result.pk] = minhash(content)
+    if not signatures:
+        return
+
+    cutoff = now() - timedelta(hours=settings.STORY_CLUSTER_WINDOW_HOURS)
+    StoryBand.objects.filter(cluster__last_seen_at__lt=cutoff).delete()
+
+    keys = {pk: band_keys(signature) for pk, signature in signatures.items()}
+    buckets = {}
+    for band in (
+        StoryBand.objects
+        .filter(key__in={key for result_keys in keys.values() for key in result_keys})
+        .select_related('cluster')
+    ):
+        buckets.setdefault(band.key, {})[band.cluster_id] = band.cluster
+
+    joined = {}
+    clustered = []
+    for scan_result in scan_results:
+        signature = signatures.get(scan_result.pk)
+        if signature is None:
+            continue
+
+        candidates = {}
+        for key in keys[scan_result.pk]:
+            candidates.update(buckets.get(key, {}))
+        scores = [(similarity(signature, cluster.signature), cluster) for cluster in candidates.values()]
+        score, cluster = max(scores, key=lambda item: item[0], default=(0, None))
+
+        if cluster is not None and score >= settings.STORY_CLUSTER_THRESHOLD:
+            joined[cluster.pk] = joined.get(cluster.pk, 0) + 1
+        else:
+            cluster = StoryCluster.objects.create(representative=scan_result, signature=signature, last_seen_at=now())
+            StoryBand.objects.bulk_create([StoryBand(key=key, cluster=cluster) for key in keys[scan_result.pk]])
+            # Later results of the batch may be copies of this one
+            for key in keys[scan_result.pk]:
+                buckets.setdefault(key, {})[cluster.pk] = cluster
+        scan_result.cluster = cluster
+        clustered.append(scan_result)
+
+    ScanResult.objects.bulk_update(clustered, ['cluster'])
+    for pk, count in joined.items():
+        StoryCluster.objects.filter(pk=pk).update(size=F('size') + count, last_seen_at=now())
+    print(f"Clustered {len(clustered)} results: {len(clustered) - sum(joined.values())} new stories, {sum(joined.values())} copies")
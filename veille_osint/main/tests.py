@@ -1,3 +1,1118 @@
-from django.test import TestCase
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import timedelta
+import gzip
+import io
+import json
+import re
+from pathlib import Path
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import requests
+import urllib3
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+
+from .ai_model import AlertClassifier, ClassificationError
+from .classification_cache import cache_key, evict_verdicts, get_cached_verdict, store_verdict
+from .classification_queue import fail_task, process_tasks, requeue
+from .connectors import ConnectorError, NewsAPIConnector, get_connector
+from .connectors.base import parse_date
+from .connectors.newsapi import count_pages
+from .connectors.streaming import CHUNK_SIZE, JSONStream
+from .keyword_matcher import KeywordAutomaton
+from .leases import WORKER_ID, claim_scans, finish_scan
+from .local_model import InferenceServer
+from .model_registry import ModelRegistry
+from .models import (
+    ClassificationCache, ClassificationDeadLetter, ClassificationTask, IngestionWatermark, Journal, RawPayload, Scan, ScanResult, ScanSchedule,
+    Sites, UpstreamQuota,
+)
+from .ingestion import fetch_source, replay_scan
+from .payload_archive import ArchivingReader, payload_path, prune_payloads, record_payloads
+from .pipeline import JournalBatchWriter
+from .rate_limits import PRIORITY_BACKFILL, PRIORITY_QUICK, PRIORITY_SCHEDULED, RateLimited, UpstreamGovernor
+from .query_planner import ScanPlan, distinct_sites, plan_queries
+from .story_clusters import assign_clusters
+from .upstreams import BlockingReader, CircuitOpen, Upstream, UpstreamBody, backoff_delay, body_reader
+from .watermarks import WatermarkTracker
+
+FIXTURES = Path(__file__).resolve().parent / 'connectors' / 'fixtures'
+
+BANK_STORY = "A ransomware group encrypted the servers of a regional bank overnight"
+
+
+def create_scan(keywords='ransomware', **kwargs):
+    return Scan.objects.create(name='Test', keywords=keywords, **kwargs)
+
+
+def create_journal(scan, titre, details, source=None):
+    return Journal.objects.create(
+        scan=scan,
+        source=source or f"https://example.org/{titre.lower().replace(' ', '-')}",
+        titre=titre,
+        details=details,
+        auteur='Unknown',
+        date_posted=now(),
+    )
+
+
+class FakeNewsAPI:
+    """
+    /v2/everything over `articles` (newest first), honouring from, to,
+    pageSize and page, and refusing to page past `max_results` like NewsAPI.
+    Requests for `failing_pages` fail. Patched in for NewsAPIConnector.stream.
+    """
+
+    def __init__(self, articles, max_results=None, failing_pages=()):
+        self.articles = articles
+        self.max_results = max_results
+        self.failing_pages = set(failing_pages)
+        self.requests = []
+
+    def matching(self, params):
+        since, until = parse_date(params.get('from')), parse_date(params['to'])
+        return [
+            article for article in self.articles
+            if (since is None or parse_date(article['publishedAt']) >= since)
+            and parse_date(article['publishedAt']) <= until
+        ]
+
+    def page(self, params):
+        self.requests.append(params)
+        matching = self.matching(params)
+        size, page = params['pageSize'], params['page']
+        if page in self.failing_pages:
+            raise ConnectorError(f"Page {page} failed")
+        if self.max_results and page * size > self.max_results:
+            raise ConnectorError("maximumResultsReached")
+        return {'status': 'ok', 'totalResults': len(matching), 'articles': matching[(page - 1) * size:page * size]}
+
+    def patch(self):
+        api = self
+
+        @asynccontextmanager
+        async def stream(connector, url, upstream=None, params=None, **kwargs):
+            yield BlockingReader(io.BytesIO(json.dumps(api.page(params)).encode()))
+
+        return mock.patch.object(NewsAPIConnector, 'stream', stream)
+
+
+class FakeClock:
+    """Monotonic, wall-clock and timezone.now() time that only move with `advance`."""
+
+    def __init__(self, start=None):
+        self.start = start or now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.elapsed = 0
+        self.slept = []
+
+    def advance(self, seconds):
+        self.elapsed += seconds
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.advance(seconds)
+
+    def monotonic(self):
+        return 1000 + self.elapsed
+
+    def time(self):
+        return self.start.timestamp() + self.elapsed
+
+    def now(self):
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def patch(self, module):
+        return mock.patch.multiple(module, time=self, now=self.now)
+
+
+class InlineStorage:
+    """StorageThread running what it is handed on the event loop's thread."""
+
+    async def submit(self, function, *args):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(function(*args))
+        return future
+
+
+class ChunkedReader:
+    """Async reader handing out at most a few bytes of its content at a time."""
+
+    def __init__(self, content, chunk_size=7):
+        self.content = content
+        self.chunk_size = chunk_size
+
+    async def read(self, size=-1):
+        size = self.chunk_size if size < 0 else min(size, self.chunk_size)
+        chunk, self.content = self.content[:size], self.content[size:]
+        return chunk
+
+
+def newsapi_articles(count, newest=None):
+    """`count` NewsAPI articles an hour apart, newest first."""
+    newest = newest or now().replace(microsecond=0)
+    return [
+        {
+            'title': f"Ransomware attack {index}",
+            'description': f"Ransomware attack number {index} on a regional bank",
+            'url': f"https://news.example.com/ransomware-{index}",
+            'author': 'Reporter',
+            'publishedAt': (newest - timedelta(hours=index)).isoformat(),
+        }
+        for index in range(count)
+    ]
+
+
+class FakeGemini:
+    """
+    Stands in for get_recommendations_from_ai: `batch(items)` answers the
+    batch prompts ({"id", "text"} items) and `single(text)` the single-text
+    ones. Records the prompts' items.
+    """
+
+    ITEMS = re.compile(r'(\[\{"id".*?\}\])', re.S)
+    TEXT = re.compile(r'picked up from a site:\s*(.*?)\s*Provide security', re.S)
+
+    def __init__(self, batch=None, single=None):
+        self.batch = batch
+        self.single = single
+        self.calls = []
+
+    def __call__(self, prompt, model_name=None, raise_errors=False):
+        match = self.ITEMS.search(prompt)
+        if match:
+            items = json.loads(match.group(1))
+            self.calls.append([item['text'] for item in items])
+            return self.batch(items)
+        text = self.TEXT.search(prompt).group(1)
+        self.calls.append([text])
+        return self.single(text)
+
+
+def fetch_all(connector, since=None, terms=()):
+    async def collect():
+        return [article async for article in connector.fetch(since, list(terms))]
+    return asyncio.run(collect())
+
+
+@mock.patch('main.leases.hold')
+class ClaimScansTests(TestCase):
+    def test_scan_is_claimed_once(self, hold):
+        scan = create_scan()
+        create_scan(keywords='')
+
+        self.assertEqual(claim_scans(10), [scan])
+        self.assertEqual(claim_scans(10), [])
+        scan.refresh_from_db()
+        self.assertEqual((scan.status, scan.claimed_by, scan.attempts), ('running', WORKER_ID, 1))
+        self.assertGreater(scan.lease_expires_at, now())
+
+    def test_scan_without_keywords_is_completed(self, hold):
+        scan = create_scan(keywords='')
+        self.assertEqual(scan.status, 'completed')
+        self.assertIsNotNone(scan.scan_end_date)
+
+        Scan.objects.filter(id=scan.id).update(status='pending', keywords=None, scan_end_date=None)
+        self.assertEqual(claim_scans(10), [])
+        scan.refresh_from_db()
+        self.assertEqual(scan.status, 'completed')
+
+    def test_expired_lease_is_reclaimed(self, hold):
+        scan = create_scan()
+        claim_scans(10)
+        Scan.objects.filter(id=scan.id).update(claimed_by='other:1', lease_expires_at=now() - timedelta(seconds=1))
+
+        self.assertEqual(claim_scans(10), [scan])
+        scan.refresh_from_db()
+        self.assertEqual((scan.claimed_by, scan.attempts), (WORKER_ID, 2))
+
+    def test_scan_is_failed_after_its_last_attempt(self, hold):
+        scan = create_scan()
+        Scan.objects.filter(id=scan.id).update(
+            status='running',
+            claimed_by='other:1',
+            lease_expires_at=now() - timedelta(seconds=1),
+            attempts=settings.INGESTION_MAX_ATTEMPTS,
+        )
+
+        self.assertEqual(claim_scans(10), [])
+        scan.refresh_from_db()
+        self.assertEqual((scan.status, scan.claimed_by), ('failed', None))
+
+    def test_outcome_is_dropped_once_the_lease_is_lost(self, hold):
+        scan = claim_scans(10, scan_ids=[create_scan().id])[0]
+        Scan.objects.filter(id=scan.id).update(claimed_by='other:1')
+
+        self.assertFalse(finish_scan(scan, 'completed'))
+        scan.refresh_from_db()
+        self.assertEqual(scan.status, 'running')
+
+
+@override_settings(STORY_CLUSTERING_ENABLED=False)
+@mock.patch('main.pipeline.enqueue_classification')
+class JournalBatchWriterTests(TestCase):
+    def test_repeated_articles_are_written_once(self, enqueue):
+        scan = create_scan()
+        with JournalBatchWriter(scan) as writer:
+            writer.add('https://example.org/a', BANK_STORY, now(), 'Bank attack', 'Jane')
+            writer.add('https://example.org/a?utm_source=feed', 'Other text', now(), 'Other title', 'Jane')
+            writer.add('https://example.org/b', BANK_STORY, now(), 'Bank attack', 'Jane')
+
+        self.assertEqual(writer.written, 1)
+        self.assertEqual(Journal.objects.filter(scan=scan).count(), 1)
+        self.assertEqual(len(enqueue.call_args.args[0]), 1)
+
+    def test_article_stored_by_an_earlier_scan_is_linked(self, enqueue):
+        first, second = create_scan(), create_scan()
+        with JournalBatchWriter(first) as writer:
+            writer.add('https://example.org/a', BANK_STORY, now(), 'Bank attack', 'Jane')
+        with JournalBatchWriter(second) as writer:
+            writer.add('https://example.org/a', BANK_STORY, now(), 'Bank attack', 'Jane')
+            writer.add('https://example.org/c', "Smishing messages ask mobile money users for their PIN", now(), 'Phishing', 'Jane')
+
+        self.assertEqual(writer.written, 1)
+        stored = ScanResult.objects.get(scan=first)
+        self.assertEqual(list(stored.linked_scans.all()), [second])
+        self.assertEqual(second.result_count, 2)
+
+    def test_replay_rewrites_its_articles(self, enqueue):
+        original = create_scan()
+        with JournalBatchWriter(original) as writer:
+            writer.add('https://example.org/a', BANK_STORY, now(), 'Bank attack', 'Jane')
+        replay = create_scan(replay_of=original)
+        with JournalBatchWriter(replay, classify=False) as writer:
+            writer.add('https://example.org/a', BANK_STORY, now(), 'Bank attack', 'Jane')
+
+        self.assertEqual(writer.written, 1)
+        self.assertFalse(ScanResult.objects.get(scan=original).linked_scans.exists())
+
+
+@mock.patch('main.signals.add_schedule_job')
+class WatermarkTrackerTests(TestCase):
+    def setUp(self):
+        self.site = Sites.objects.create(name='Feed', url='https://example.org/feed', connector='rss')
+
+    def create_schedule(self):
+        return ScanSchedule.objects.create(name='Daily', schedule_time=now(), frequency='daily', keywords='ransomware')
+
+    def test_commit_moves_the_watermarks(self, add_job):
+        schedule = self.create_schedule()
+        published_at = now() - timedelta(hours=1)
+        tracker = WatermarkTracker(schedule, ['ransomware', 'phishing'], self.site)
+        self.assertIsNone(tracker.since())
+        tracker.record(['ransomware', 'phishing'], published_at, 'hash')
+        tracker.commit()
+
+        tracker = WatermarkTracker(schedule, ['ransomware', 'phishing'], self.site)
+        self.assertEqual(tracker.since(), published_at)
+        self.assertFalse(tracker.is_new(['ransomware'], published_at, 'hash'))
+        self.assertTrue(tracker.is_new(['ransomware'], published_at + timedelta(seconds=1), 'other'))
+
+    def test_incomplete_fetch_keeps_the_watermarks(self, add_job):
+        schedule = self.create_schedule()
+        tracker = WatermarkTracker(schedule, ['ransomware'], self.site)
+        tracker.record(['ransomware'], now(), 'hash')
+        tracker.complete = False
+        tracker.commit()
+
+        self.assertFalse(IngestionWatermark.objects.exists())
+
+    @override_settings(
+        PAYLOAD_ARCHIVE_ENABLED=False, NEWS_API_PAGE_SIZE=2, NEWS_API_MAX_RESULTS=2, NEWS_API_BACKFILL_QUERIES=1,
+    )
+    @mock.patch('main.pipeline.enqueue_classification')
+    def test_capped_single_term_query_moves_the_watermarks(self, enqueue, add_job):
+        site = Sites.objects.create(name='News API', url='https://newsapi.org', connector='newsapi')
+        scan = create_scan(schedule=self.create_schedule())
+        scan.sites.add(site)
+        plan = ScanPlan(scan)
+        [source] = plan_queries(site, [plan])
+        api = FakeNewsAPI(newsapi_articles(7), max_results=2)
+        with api.patch():
+            asyncio.run(fetch_source(source, get_connector(site), InlineStorage()))
+        plan.writer.flush()
+        plan.commit()
+
+        watermark = IngestionWatermark.objects.get(site=site, keyword='ransomware')
+        self.assertEqual(watermark.published_at, parse_date(api.articles[0]['publishedAt']))
+        self.assertEqual(Journal.objects.filter(scan=scan).count(), 3)
+
+    def test_failed_source_keeps_the_watermarks_of_its_scans(self, add_job):
+        schedule = self.create_schedule()
+        scan = create_scan(schedule=schedule)
+        scan.sites.add(self.site)
+        plan = ScanPlan(scan)
+        [source] = plan_queries(self.site, [plan])
+        plan.trackers[self.site.id].record(['ransomware'], now(), 'hash')
+        source.done(complete=False)
+        plan.commit()
+
+        self.assertTrue(plan.fetched)
+        self.assertFalse(IngestionWatermark.objects.exists())
+
+
+class PlanQueriesTests(TestCase):
+    def setUp(self):
+        self.site = Sites.objects.create(name='News API', url='https://newsapi.org', connector='newsapi')
+
+    def plan(self, keywords):
+        scan = create_scan(keywords=keywords)
+        scan.sites.add(self.site)
+        return ScanPlan(scan)
+
+    def test_shared_terms_are_fetched_once(self):
+        first, second = self.plan('ransomware, phishing'), self.plan('phishing, data breach')
+        [source] = plan_queries(self.site, [first, second])
+
+        self.assertEqual(sorted(source.terms), ['data breach', 'phishing', 'ransomware'])
+        self.assertEqual(source.plans, [first, second])
+
+    def test_terms_are_packed_within_the_query_length(self):
+        plan = self.plan('ransomware, phishing, data breach, zero-day')
+        sources = plan_queries(self.site, [plan], max_length=25)
+
+        self.assertEqual(sorted(term for source in sources for term in source.terms), sorted(plan.terms))
+        self.assertGreater(len(sources), 1)
+        for source in sources:
+            self.assertLessEqual(len(' OR '.join(f'"{t}"' if ' ' in t else t for t in source.terms)), 25)
+
+    def test_query_only_serves_the_scans_using_its_terms(self):
+        first, second = self.plan('ransomware'), self.plan('phishing')
+        sources = plan_queries(self.site, [first, second], max_length=10)
+
+        self.assertEqual({tuple(source.terms): source.plans for source in sources}, {
+            ('phishing',): [second],
+            ('ransomware',): [first],
+        })
+
+    def test_capped_query_is_split_in_halves(self):
+        first, second = self.plan('ransomware, phishing'), self.plan('data breach')
+        [source] = plan_queries(self.site, [first, second])
+        halves = source.split()
+
+        self.assertEqual([half.terms for half in halves], [source.terms[:1], source.terms[1:]])
+        self.assertEqual(sorted(term for half in halves for term in half.terms), sorted(source.terms))
+
+    def test_sites_sharing_an_endpoint_are_fetched_once(self):
+        other = Sites.objects.create(name='Le Monde', url='https://www.lemonde.fr', connector='newsapi')
+        feed = Sites.objects.create(name='Feed', url='https://example.org/feed', connector='rss')
+
+        self.assertEqual(distinct_sites([other, feed, self.site]), [self.site, feed])
+
+
+class KeywordAutomatonTests(TestCase):
+    def setUp(self):
+        self.automaton = KeywordAutomaton()
+        self.automaton.add('breach', 'medium', 1.0)
+        self.automaton.add('data breach', 'high', 2.0)
+        self.automaton.add('leak', 'low', 0.5)
+
+    def terms(self, text):
+        return sorted(match.term for match in self.automaton.find(text))
+
+    def test_overlapping_terms_all_match(self):
+        matches = self.automaton.find("A Data Breach at the bank")
+        self.assertEqual(sorted((m.term, m.severity, m.start, m.end) for m in matches), [
+            ('breach', 'medium', 7, 13),
+            ('data breach', 'high', 2, 13),
+        ])
+
+    def test_terms_only_match_whole_words(self):
+        self.assertEqual(self.terms("a bleak outlook, leaked files"), [])
+        self.assertEqual(self.terms("the leak_fix was a leak."), ['leak'])
+
+    def test_terms_can_change_between_matches(self):
+        self.assertEqual(self.terms("data breach"), ['breach', 'data breach'])
+        self.automaton.remove('Breach')
+        self.automaton.add('data', 'low', 0.1)
+
+        self.assertEqual(self.terms("data breach"), ['data', 'data breach'])
+
+
+@override_settings(STORY_CLUSTER_THRESHOLD=0.5)
+class AssignClustersTests(TestCase):
+    STORY = (
+        "A ransomware group encrypted the core banking servers of a regional bank overnight, "
+        "and customers could not withdraw money for two days while the bank restored its backups"
+    )
+
+    def test_near_duplicates_share_a_cluster(self):
+        scan = create_scan()
+        original = create_journal(scan, 'Bank hit by ransomware', self.STORY)
+        copy = create_journal(scan, 'Bank hit by ransomware', self.STORY + " from tapes")
+        other = create_journal(scan, 'Phishing campaign', "Smishing messages impersonating an operator ask users to confirm their PIN code")
+        short = create_journal(scan, 'Short', "Too short")
+        assign_clusters([original, copy, other, short])
+
+        for result in (original, copy, other, short):
+            result.refresh_from_db()
+        self.assertEqual(original.cluster, copy.cluster)
+        self.assertEqual(original.cluster.representative_id, original.pk)
+        self.assertEqual(original.cluster.size, 2)
+        self.assertNotEqual(other.cluster, original.cluster)
+        self.assertIsNone(short.cluster)
+
+    def test_later_copy_joins_the_stored_story(self):
+        original = create_journal(create_scan(), 'Bank hit by ransomware', self.STORY)
+        assign_clusters([original])
+        copy = create_journal(create_scan(), 'Bank hit by ransomware', "Update: " + self.STORY)
+        assign_clusters([copy])
+
+        original.refresh_from_db()
+        copy.refresh_from_db()
+        self.assertEqual(copy.cluster, original.cluster)
+
+
+@mock.patch('main.ai_model.get_local_model', return_value=None)
+class AlertClassifierTests(TestCase):
+    def classify(self, gemini, texts):
+        with mock.patch('main.ai_model.get_recommendations_from_ai', gemini):
+            return AlertClassifier(api_key='test').predict_many(texts)
+
+    @staticmethod
+    def verdict(text):
+        return {'severity': 'high' if 'ransomware' in text.lower() else 'none', 'recommendations': []}
+
+    def test_unusable_single_answers_are_errors(self, local_model):
+        for answer in (
+            [{'severity': 'high'}],
+            {'recommendations': ["Patch"]},
+            {'severity': 3},
+            {'severity': 'high', 'recommendations': [{'text': "Patch"}]},
+            {'severity': 'critical'},
+            "No recommendations available.",
+        ):
+            with self.subTest(answer=answer):
+                [verdict] = self.classify(FakeGemini(single=lambda text: answer), ["Ransomware hits a bank"])
+                self.assertEqual(verdict, {'severity': 'none', 'recommendations': [], 'source': 'error'})
+        self.assertFalse(ClassificationCache.objects.exists())
+
+    def test_single_answer_is_normalized_and_cached(self, local_model):
+        gemini = FakeGemini(single=lambda text: {'severity': ' High', 'recommendations': ["Isoler les serveurs"]})
+        self.classify(gemini, ["Ransomware hits a bank"])
+        [verdict] = self.classify(gemini, ["Ransomware hits a bank"])
+
+        self.assertEqual(verdict, {'severity': 'high', 'recommendations': ["Isoler les serveurs"]})
+        self.assertEqual(len(gemini.calls), 1)
+
+    def test_items_missing_from_a_batch_answer_are_retried(self, local_model):
+        def batch(items):
+            # Only the first item is answered, the second is garbled
+            answers = [{'id': items[0]['id'], **self.verdict(items[0]['text'])}]
+            if len(items) > 1:
+                answers.append({'id': items[1]['id'], 'severity': None})
+            return answers
+
+        texts = ["Ransomware hits a bank", "Local football results", "Ransomware leak", "Ransomware hits a bank"]
+        gemini = FakeGemini(batch=batch, single=self.verdict)
+        verdicts = self.classify(gemini, texts)
+
+        self.assertEqual([verdict['severity'] for verdict in verdicts], ['high', 'none', 'high', 'high'])
+        self.assertEqual(gemini.calls, [
+            ["Ransomware hits a bank", "Local football results", "Ransomware leak"],
+            ["Local football results", "Ransomware leak"],
+            ["Ransomware leak"],
+        ])
+
+    def test_unusable_batch_answer_is_halved(self, local_model):
+        texts = [f"Ransomware attack {index}" for index in range(4)]
+        gemini = FakeGemini(batch=lambda items: "No recommendations available.", single=self.verdict)
+        verdicts = self.classify(gemini, texts)
+
+        self.assertEqual([verdict['severity'] for verdict in verdicts], ['high'] * 4)
+        self.assertEqual([len(call) for call in gemini.calls], [4, 2, 1, 1, 2, 1, 1])
+
+    def test_unreachable_gemini_is_not_retried(self, local_model):
+        def batch(items):
+            raise ClassificationError("down")
+
+        gemini = FakeGemini(batch=batch)
+        with self.assertRaises(ClassificationError):
+            self.classify(gemini, ["Ransomware hits a bank", "Ransomware leak"])
+        self.assertEqual(len(gemini.calls), 1)
+
+
+@override_settings(RATE_LIMIT_PRIORITY_RESERVE=0.2, RATE_LIMIT_MAX_WAIT=0, RATE_LIMIT_SHARED=False)
+class UpstreamGovernorTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = self.clock.patch('main.rate_limits')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def acquire(self, governor, count, priority=PRIORITY_SCHEDULED):
+        for _ in range(count):
+            governor.acquire(priority)
+
+    def test_bucket_refills_at_its_rate(self):
+        governor = UpstreamGovernor('test', rate=1, burst=2)
+        self.acquire(governor, 2, PRIORITY_QUICK)
+        with self.assertRaises(RateLimited) as raised:
+            governor.acquire(PRIORITY_QUICK)
+        self.assertAlmostEqual(raised.exception.retry_after, 1)
+
+        self.clock.advance(1)
+        governor.acquire(PRIORITY_QUICK)
+        self.assertEqual((governor.granted, governor.denied), (3, 1))
+
+    def test_lower_priorities_leave_a_reserve_of_the_bucket(self):
+        governor = UpstreamGovernor('test', rate=1, burst=10)
+        for priority, allowed in ((PRIORITY_BACKFILL, 6), (PRIORITY_SCHEDULED, 2), (PRIORITY_QUICK, 2)):
+            self.acquire(governor, allowed, priority)
+            with self.assertRaises(RateLimited):
+                governor.acquire(priority)
+
+    def test_daily_quota_is_reserved_for_higher_priorities(self):
+        governor = UpstreamGovernor('test', rate=100, burst=100, daily_quota=10)
+        self.acquire(governor, 6, PRIORITY_BACKFILL)
+        with self.assertRaises(RateLimited) as raised:
+            governor.acquire(PRIORITY_BACKFILL)
+        self.assertEqual(raised.exception.retry_after, 12 * 3600)
+        self.assertTrue(governor.should_defer(PRIORITY_BACKFILL))
+        self.assertFalse(governor.should_defer(PRIORITY_SCHEDULED))
+
+        self.acquire(governor, 2, PRIORITY_SCHEDULED)
+        self.assertTrue(governor.should_defer(PRIORITY_SCHEDULED))
+        self.acquire(governor, 2, PRIORITY_QUICK)
+        self.assertTrue(governor.should_defer(PRIORITY_QUICK))
+        with self.assertRaises(RateLimited):
+            governor.acquire(PRIORITY_QUICK)
+
+    def test_daily_quota_rolls_over_at_midnight(self):
+        governor = UpstreamGovernor('test', rate=100, burst=100, daily_quota=10)
+        self.acquire(governor, 10, PRIORITY_QUICK)
+        self.assertTrue(governor.should_defer(PRIORITY_QUICK))
+
+        self.clock.advance(12 * 3600)
+        self.assertFalse(governor.should_defer(PRIORITY_BACKFILL))
+        self.assertEqual(governor.used(), 0)
+        governor.acquire(PRIORITY_BACKFILL)
+        self.assertEqual(governor.used(), 1)
+
+    @override_settings(RATE_LIMIT_SHARED=True)
+    def test_shared_daily_quota_rolls_over_at_midnight(self):
+        governor, other = UpstreamGovernor('test', 100, 100, 10), UpstreamGovernor('test', 100, 100, 10)
+        self.acquire(governor, 5, PRIORITY_QUICK)
+        self.acquire(other, 5, PRIORITY_QUICK)
+        self.assertEqual(UpstreamQuota.objects.get(upstream='test').used, 10)
+        with self.assertRaises(RateLimited):
+            governor.acquire(PRIORITY_QUICK)
+
+        self.clock.advance(12 * 3600)
+        other.acquire(PRIORITY_BACKFILL)
+        quota = UpstreamQuota.objects.get(upstream='test')
+        self.assertEqual((quota.day, quota.used), (self.clock.now().date(), 1))
+
+    def test_retry_after_pauses_every_caller(self):
+        governor = UpstreamGovernor('test', rate=100, burst=100)
+        with self.assertRaises(RateLimited) as raised:
+            governor.observe(mock.Mock(status_code=429, headers={'Retry-After': '30'}))
+        self.assertEqual(raised.exception.retry_after, 30)
+        self.assertTrue(governor.should_defer(PRIORITY_QUICK))
+        with self.assertRaises(RateLimited):
+            governor.acquire(PRIORITY_QUICK)
+
+        self.clock.advance(30)
+        self.assertFalse(governor.should_defer(PRIORITY_QUICK))
+        governor.acquire(PRIORITY_QUICK)
+
+    @override_settings(RATE_LIMIT_SHARED=True)
+    def test_retry_after_date_pauses_other_processes(self):
+        governor, other = UpstreamGovernor('test', 100, 100), UpstreamGovernor('test', 100, 100)
+        retry_at = self.clock.now() + timedelta(minutes=2)
+        with self.assertRaises(RateLimited):
+            governor.observe(mock.Mock(status_code=429, headers={'Retry-After': retry_at.strftime('%a, %d %b %Y %H:%M:%S GMT')}))
+
+        self.assertTrue(other.should_defer(PRIORITY_QUICK))
+        with self.assertRaises(RateLimited) as raised:
+            other.acquire(PRIORITY_QUICK)
+        self.assertAlmostEqual(raised.exception.retry_after, 120)
+
+
+@override_settings(UPSTREAM_CIRCUIT_FAILURES=3, UPSTREAM_CIRCUIT_RESET_SECONDS=60, UPSTREAM_MAX_RETRIES=0,
+                   UPSTREAM_BACKOFF_BASE=0.5, UPSTREAM_BACKOFF_MAX=10)
+@mock.patch('main.upstreams.get_governor')
+class UpstreamTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('main.upstreams.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upstream(self, *replies):
+        upstream = Upstream('test', connect_timeout=1, read_timeout=1)
+        upstream.session = mock.Mock()
+        upstream.session.request.side_effect = replies
+        return upstream
+
+    def test_circuit_opens_after_consecutive_failures(self, get_governor):
+        upstream = self.upstream(*[requests.ConnectionError("refused")] * 3)
+        for _ in range(3):
+            with self.assertRaises(requests.ConnectionError):
+                upstream.get('https://example.org')
+        with self.assertRaises(CircuitOpen) as raised:
+            upstream.get('https://example.org')
+        self.assertEqual(raised.exception.retry_in, 60)
+        self.assertEqual((upstream.status()['state'], upstream.rejected), ('open', 1))
+
+    def test_half_open_trial_decides_whether_the_circuit_closes(self, get_governor):
+        upstream = self.upstream(*[requests.ConnectionError("refused")] * 4, mock.Mock(status_code=200))
+        for _ in range(3):
+            with self.assertRaises(requests.ConnectionError):
+                upstream.get('https://example.org')
+
+        self.clock.advance(60)
+        self.assertEqual(upstream.status()['state'], 'half-open')
+        with self.assertRaises(requests.ConnectionError):
+            upstream.get('https://example.org')
+        with self.assertRaises(CircuitOpen):
+            upstream.get('https://example.org')
+
+        self.clock.advance(60)
+        upstream.before_call()
+        with self.assertRaises(CircuitOpen):
+            upstream.before_call()
+        upstream.after_call(0.1, 200)
+        self.assertEqual(upstream.status()['state'], 'closed')
+        self.assertEqual(upstream.get('https://example.org').status_code, 200)
+        self.assertEqual(upstream.failures, 0)
+
+    def test_failures_are_retried_after_a_growing_backoff(self, get_governor):
+        upstream = self.upstream(mock.Mock(status_code=503), requests.Timeout("slow"), mock.Mock(status_code=200))
+        with override_settings(UPSTREAM_MAX_RETRIES=2), mock.patch('main.upstreams.random.uniform', lambda low, high: high):
+            self.assertEqual(upstream.get('https://example.org').status_code, 200)
+        self.assertEqual(self.clock.slept, [0.5, 1])
+        self.assertEqual((upstream.retries, upstream.errors, upstream.failures), (2, 2, 0))
+
+    def test_backoff_delay_is_jittered_below_a_capped_ceiling(self, get_governor):
+        with mock.patch('main.upstreams.random.uniform', lambda low, high: high):
+            self.assertEqual([backoff_delay(attempt) for attempt in range(1, 7)], [0.5, 1, 2, 4, 8, 10])
+        for attempt in range(1, 7):
+            self.assertTrue(0 <= backoff_delay(attempt) <= min(10, 0.5 * 2 ** (attempt - 1)))
+
+    def test_broken_body_counts_against_the_breaker(self, get_governor):
+        upstream = self.upstream()
+        response = requests.Response()
+        response.url = 'https://example.org/feed'
+        response.raw = mock.Mock(read=mock.Mock(side_effect=urllib3.exceptions.ProtocolError("Connection broken")))
+        response.upstream = upstream
+        with self.assertRaises(requests.ConnectionError):
+            asyncio.run(body_reader(response).read(1024))
+
+        stalled = mock.Mock(read=mock.AsyncMock(side_effect=asyncio.TimeoutError))
+        with self.assertRaises(requests.Timeout):
+            asyncio.run(UpstreamBody(stalled, upstream, response.url).read(1024))
+        self.assertEqual((upstream.failures, upstream.errors), (2, 2))
+
+
+class ModelRegistryTests(TestCase):
+    def setUp(self):
+        self.version = 'v1'
+        self.models = {'v1': mock.Mock(), 'v2': None}
+        self.registry = ModelRegistry()
+        self.registry.register('local', self.load, lambda: (self.version, {}))
+        self.registry.refresh()
+
+    def load(self, version, config):
+        return self.models[version]
+
+    def test_version_without_a_model_keeps_the_current_one(self):
+        current = self.registry.get('local')
+        self.version = 'v2'
+        self.registry.swap('local', 'v2', {})
+
+        self.assertEqual((self.registry.version('local'), self.registry.failed), ('v1', {'local': 'v2'}))
+        current.close.assert_not_called()
+        self.registry.invalidate()
+        with mock.patch('main.model_registry.threading.Thread') as thread:
+            self.assertIs(self.registry.get('local'), current)
+        thread.assert_not_called()
+
+    def test_new_version_is_swapped_in_and_the_old_one_closed(self):
+        current = self.registry.get('local')
+        self.version, self.models['v2'] = 'v2', mock.Mock()
+        self.registry.swap('local', 'v2', {})
+
+        self.assertIs(self.registry.get('local'), self.models['v2'])
+        current.close.assert_called_once()
+
+    def test_first_load_runs_without_the_lock_and_once(self):
+        started, release, probed, loads = threading.Event(), threading.Event(), [], []
+
+        def load(version, config):
+            loads.append(version)
+            probe = threading.Thread(target=lambda: probed.append(self.registry.version('other')))
+            probe.start()
+            probe.join(timeout=5)
+            started.set()
+            release.wait(timeout=5)
+            return self.models[version]
+        self.registry.loaders['local'] = load
+
+        served = []
+        threads = [threading.Thread(target=lambda: served.append(self.registry.get('local'))) for _ in range(2)]
+        threads[0].start()
+        started.wait(timeout=5)
+        threads[1].start()
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual(probed, [None])
+        self.assertEqual(loads, ['v1'])
+        self.assertEqual(served, [self.models['v1']] * 2)
+
+
+class StubModel:
+    """LocalAlertModel scoring a text by its length, recording the size of each batch."""
+    labels = ['none', 'high']
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts):
+        return [[len(text)] for text in texts]
+
+    def predict_sequences(self, sequences):
+        self.batches.append(len(sequences))
+        return [[sequence[0], 0] for sequence in sequences]
+
+
+class InferenceServerTests(TestCase):
+    def setUp(self):
+        self.model = StubModel()
+        self.server = InferenceServer(self.model, max_batch=4, max_wait=5)
+        self.addCleanup(self.server.close)
+
+    def test_concurrent_requests_are_scored_in_one_batch(self):
+        futures = {}
+
+        def submit(texts):
+            futures[texts] = self.server.submit(texts)
+        threads = [threading.Thread(target=submit, args=(texts,)) for texts in (('a', 'bb'), ('ccc', 'dddd'))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        scores = [future.result(timeout=5)[0] for texts in (('a', 'bb'), ('ccc', 'dddd')) for future in futures[texts]]
+        self.assertEqual(scores, [1, 2, 3, 4])
+        self.assertEqual(self.model.batches, [4])
+        self.assertEqual((self.server.batches, self.server.items), (1, 4))
+
+    def test_submitted_texts_are_scored_before_closing(self):
+        futures = self.server.submit(['a', 'bb'])
+        self.server.close()
+        self.server.thread.join(timeout=5)
+
+        self.assertEqual([future.result(timeout=0)[0] for future in futures], [1, 2])
+        self.assertFalse(self.server.thread.is_alive())
+        with self.assertRaises(RuntimeError):
+            self.server.submit(['ccc'])
+
+
+@override_settings(CLASSIFICATION_CACHE_TTL=3600, CLASSIFICATION_CACHE_MAX_ENTRIES=2)
+class ClassificationCacheTests(TestCase):
+    VERDICT = {'severity': 'High', 'recommendations': ["Isoler les serveurs"]}
+
+    def store(self, text):
+        key = cache_key(text, 'v1', 'gemini')
+        store_verdict(key, self.VERDICT, 'v1', 'gemini')
+        return key
+
+    def test_verdict_is_found_under_the_normalized_text(self):
+        self.store("Ransomware hits a bank!")
+
+        self.assertEqual(get_cached_verdict(cache_key("  ransomware HITS a bank ", 'v1', 'gemini')), {
+            'severity': 'high',
+            'recommendations': ["Isoler les serveurs"],
+        })
+        self.assertIsNone(get_cached_verdict(cache_key("Ransomware hits a bank", 'v2', 'gemini')))
+        self.assertIsNone(get_cached_verdict(cache_key("Ransomware hits a bank", 'v1', 'other-model')))
+        self.assertEqual(ClassificationCache.objects.get().hits, 1)
+
+    def test_expired_verdict_is_dropped(self):
+        key = self.store("Ransomware hits a bank")
+        ClassificationCache.objects.update(created_at=now() - timedelta(seconds=3601))
+
+        self.assertIsNone(get_cached_verdict(key))
+        self.assertFalse(ClassificationCache.objects.exists())
+
+    def test_least_recently_used_verdicts_are_evicted(self):
+        keys = [self.store(text) for text in ("First story", "Second story", "Third story")]
+        for age, key in zip((10, 30, 20), keys):
+            ClassificationCache.objects.filter(key=key).update(last_used_at=now() - timedelta(seconds=age))
+        evict_verdicts()
+
+        self.assertEqual(set(ClassificationCache.objects.values_list('key', flat=True)), {keys[0], keys[2]})
+
+
+class ClassificationQueueTests(TestCase):
+    def create_task(self, attempts=1):
+        result = create_journal(create_scan(), f'Result {attempts}', "Ransomware hits a bank", source=f'https://example.org/{attempts}')
+        return ClassificationTask.objects.create(
+            result=result,
+            status='running',
+            claimed_by=WORKER_ID,
+            lease_expires_at=now() + timedelta(minutes=5),
+            attempts=attempts,
+            available_at=now(),
+        )
+
+    def test_failed_task_is_retried_after_a_backoff(self):
+        task = self.create_task()
+        fail_task(task, ValueError("boom"))
+
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.claimed_by, task.last_error), ('pending', None, "ValueError: boom"))
+        self.assertGreater(task.available_at, now() + timedelta(seconds=settings.CLASSIFICATION_RETRY_BASE - 5))
+
+    def test_task_is_dead_lettered_after_its_last_attempt(self):
+        task = self.create_task(attempts=settings.CLASSIFICATION_MAX_ATTEMPTS)
+        fail_task(task, ValueError("boom"))
+
+        self.assertFalse(ClassificationTask.objects.exists())
+        dead = ClassificationDeadLetter.objects.get(result_id=task.result_id)
+        self.assertEqual((dead.attempts, dead.error), (settings.CLASSIFICATION_MAX_ATTEMPTS, "ValueError: boom"))
+
+        self.assertEqual(requeue(ClassificationDeadLetter.objects.all()), 1)
+        self.assertFalse(ClassificationDeadLetter.objects.exists())
+        task = ClassificationTask.objects.get(result_id=task.result_id)
+        self.assertEqual((task.status, task.attempts), ('pending', 0))
+
+    def test_whole_batch_backs_off_when_gemini_is_down(self):
+        tasks = [self.create_task(), self.create_task(attempts=2)]
+        with mock.patch('main.classification_queue.check_results_for_alerts', side_effect=ClassificationError("down")) as check:
+            process_tasks(tasks)
+
+        self.assertEqual(check.call_count, 1)
+        self.assertEqual(set(ClassificationTask.objects.values_list('status', flat=True)), {'pending'})
+
+    def test_failing_batch_is_classified_one_by_one(self):
+        tasks = [self.create_task(), self.create_task(attempts=2)]
+
+        def check(results):
+            if len(results) > 1 or results[0].pk == tasks[0].result_id:
+                raise ValueError("bad result")
+
+        with mock.patch('main.classification_queue.check_results_for_alerts', side_effect=check):
+            process_tasks(tasks)
+
+        self.assertEqual(list(ClassificationTask.objects.values_list('id', 'status')), [(tasks[0].id, 'pending')])
+
+
+class JSONStreamTests(TestCase):
+    DOCUMENT = json.dumps({
+        'status': 'ok',
+        'totalResults': 3,
+        'articles': [{'title': "Ransomware hits a bank", 'tags': ['é', 1.5]}, {'title': "Leak"}, "third"],
+    }).encode()
+
+    def read(self, stream, items):
+        """Collect the items of `stream` into `items`, which keeps those read before an error."""
+        async def collect():
+            async for item in stream.items():
+                items.append(item)
+        asyncio.run(collect())
+
+    def test_items_are_parsed_across_chunks(self):
+        stream, items = JSONStream(ChunkedReader(self.DOCUMENT), ['articles.item'], scalars=['totalResults']), []
+        self.read(stream, items)
+
+        self.assertEqual(items, [{'title': "Ransomware hits a bank", 'tags': ['é', 1.5]}, {'title': "Leak"}, "third"])
+        self.assertEqual(stream.values, {'totalResults': 3})
+        self.assertTrue(stream.found)
+
+    def test_document_without_the_item_list(self):
+        stream, items = JSONStream(ChunkedReader(b'{"status": "error", "code": "apiKeyInvalid"}'), ['articles.item']), []
+        self.read(stream, items)
+        self.assertEqual((items, stream.found), ([], False))
+
+    def test_truncated_body_is_invalid(self):
+        content = self.DOCUMENT[:self.DOCUMENT.index(b'"Leak"')]
+        stream, items = JSONStream(ChunkedReader(content), ['articles.item']), []
+        with self.assertRaises(ConnectorError):
+            self.read(stream, items)
+        self.assertEqual(items, [{'title': "Ransomware hits a bank", 'tags': ['é', 1.5]}])
+
+    @mock.patch('main.connectors.streaming.ijson', None)
+    def test_whole_document_is_parsed_without_ijson(self):
+        stream, items = JSONStream(ChunkedReader(self.DOCUMENT), ['articles.item'], scalars=['totalResults']), []
+        self.read(stream, items)
+        self.assertEqual((len(items), stream.values), (3, {'totalResults': 3}))
+
+        with self.assertRaises(ConnectorError):
+            self.read(JSONStream(ChunkedReader(self.DOCUMENT[:-2]), ['articles.item']), [])
+
+
+@override_settings(PAYLOAD_ARCHIVE_ENABLED=False)
+class ConnectorTests(TestCase):
+    def connector(self, connector, fixture):
+        return get_connector(Sites(name=fixture, url=(FIXTURES / fixture).as_uri(), connector=connector))
+
+    def test_rss_feed(self):
+        articles = fetch_all(self.connector('rss', 'feed.rss'))
+
+        self.assertEqual(len(articles), 3)
+        self.assertEqual(articles[0].source, 'https://example.org/news/ransomware-regional-bank')
+        self.assertEqual(articles[0].details, "A ransomware group encrypted the core banking servers of a regional bank overnight.")
+        self.assertEqual([article.auteur for article in articles[:2]], ['Jane Analyst', 'Unknown'])
+        self.assertEqual(articles[0].date_posted.isoformat(), '2026-10-17T08:30:00+00:00')
+
+    def test_feed_is_filtered_by_date(self):
+        since = fetch_all(self.connector('rss', 'feed.rss'))[1].date_posted
+        articles_since = fetch_all(self.connector('rss', 'feed.rss'), since=since)
+
+        self.assertEqual([article.titre for article in articles_since], ['Ransomware attack disrupts a regional bank'])
+
+    def test_atom_feed(self):
+        articles = fetch_all(self.connector('rss', 'feed.atom'))
+
+        self.assertEqual([article.source for article in articles], [
+            'https://example.net/data-breach-payment-provider',
+            'https://example.net/zero-day-vpn',
+        ])
+        self.assertEqual(articles[0].date_posted.isoformat(), '2026-10-17T10:00:00+00:00')
+        self.assertEqual(articles[0].auteur, 'Security Desk')
+        self.assertEqual(articles[1].details, "A zero-day vulnerability lets unauthenticated attackers run code on the appliance.")
+
+    def test_json_feed(self):
+        articles = fetch_all(self.connector('json_feed', 'feed.json'))
+
+        self.assertEqual([article.auteur for article in articles], ['Network Watch', 'Unknown'])
+        self.assertEqual(articles[1].details, "The update server of the vendor distributed a backdoored installer.")
+
+    def test_newsapi(self):
+        connector = self.connector('newsapi', 'newsapi.json')
+        articles = fetch_all(connector, terms=['ransomware'])
+
+        self.assertEqual([article.auteur for article in articles], ['Reporter', 'Unknown'])
+        self.assertEqual(articles[0].titre, 'Banking trojan spreads through fake invoices')
+        self.assertTrue(connector.complete)
+        self.assertFalse(connector.truncated)
+
+    @override_settings(NEWS_API_MAX_RESULTS=1)
+    def test_capped_newsapi_query_is_truncated(self):
+        connector = self.connector('newsapi', 'newsapi.json')
+        fetch_all(connector, terms=['ransomware'])
+
+        self.assertTrue(connector.truncated)
+
+    def test_feed_connector_rejects_other_documents(self):
+        with self.assertRaises(ConnectorError):
+            fetch_all(self.connector('rss', 'feed.json'))
+
+
+@override_settings(PAYLOAD_ARCHIVE_ENABLED=False, NEWS_API_PAGE_SIZE=2, NEWS_API_MAX_RESULTS=0)
+class NewsAPIPagingTests(TestCase):
+    def connector(self):
+        return get_connector(Sites(name='News API', url='https://newsapi.org', connector='newsapi'))
+
+    def test_count_pages(self):
+        self.assertEqual(count_pages(0, 100), 0)
+        self.assertEqual(count_pages(100, 100), 1)
+        self.assertEqual(count_pages(101, 100), 2)
+        self.assertEqual(count_pages(1000, 100, max_results=100), 1)
+        self.assertEqual(count_pages(250, 100, max_results=0), 3)
+
+    def test_every_page_is_read(self):
+        api = FakeNewsAPI(newsapi_articles(5))
+        connector = self.connector()
+        with api.patch():
+            articles = fetch_all(connector, terms=['ransomware'])
+
+        self.assertEqual(sorted(article.source for article in articles), sorted(a['url'] for a in api.articles))
+        self.assertEqual(sorted(params['page'] for params in api.requests), [1, 2, 3])
+        self.assertTrue(connector.complete)
+        self.assertFalse(connector.truncated)
+
+    def test_failed_page_makes_the_fetch_incomplete(self):
+        api = FakeNewsAPI(newsapi_articles(5), failing_pages={2})
+        connector = self.connector()
+        with api.patch():
+            articles = fetch_all(connector, terms=['ransomware'])
+
+        self.assertEqual(len(articles), 3)
+        self.assertFalse(connector.complete)
+
+    @override_settings(NEWS_API_MAX_RESULTS=2, NEWS_API_BACKFILL_QUERIES=10)
+    def test_capped_window_is_read_backward(self):
+        api = FakeNewsAPI(newsapi_articles(7), max_results=2)
+        connector = self.connector()
+        with api.patch():
+            articles = fetch_all(connector, terms=['ransomware'])
+
+        self.assertEqual({article.source for article in articles}, {a['url'] for a in api.articles})
+        self.assertFalse(connector.truncated)
+        self.assertTrue(connector.complete)
+        # Each query ends at the oldest article the previous one read
+        self.assertEqual([parse_date(params['to']) for params in api.requests[1:]], [
+            parse_date(api.articles[index]['publishedAt']) for index in range(1, 6)
+        ])
+
+    @override_settings(NEWS_API_MAX_RESULTS=2, NEWS_API_BACKFILL_QUERIES=1)
+    def test_window_left_unread_after_the_last_backfill_query_is_truncated(self):
+        api = FakeNewsAPI(newsapi_articles(7), max_results=2)
+        connector = self.connector()
+        with api.patch():
+            articles = fetch_all(connector, terms=['ransomware'])
+
+        self.assertEqual({article.source for article in articles}, {a['url'] for a in api.articles[:3]})
+        self.assertTrue(connector.truncated)
+        self.assertEqual(len(api.requests), 2)
+
+
+@override_settings(STORY_CLUSTERING_ENABLED=False)
+class PayloadArchiveTests(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings_override = override_settings(PAYLOAD_ARCHIVE_DIR=archive_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.site = Sites.objects.create(name='Feed', url='https://example.org/feed?token=secret', connector='rss')
+
+    def archive(self, fixture, scan):
+        """Archive a fixture as if the site had sent it for `scan`."""
+        async def read():
+            with (FIXTURES / fixture).open('rb') as file:
+                reader = ArchivingReader(BlockingReader(file), get_connector(self.site), self.site.url)
+                while await reader.read(CHUNK_SIZE):
+                    pass
+                await reader.aclose()
+                return reader.payload
+        payload = asyncio.run(read())
+        record_payloads([payload], [scan])
+        return RawPayload.objects.get(sha256=payload.sha256)
+
+    def test_payload_is_archived_without_credentials(self):
+        payload = self.archive('feed.rss', create_scan())
+
+        self.assertEqual(payload.url, 'https://example.org/feed')
+        with gzip.open(payload_path(payload.sha256)) as file:
+            self.assertEqual(file.read(), (FIXTURES / 'feed.rss').read_bytes())
+
+    def test_replay_parses_the_archived_payloads_into_a_completed_scan(self):
+        scan = create_scan(status='completed')
+        self.archive('feed.rss', scan)
+        replay = replay_scan(scan, classify=False)
+
+        self.assertEqual((replay.status, replay.replay_of_id), ('completed', scan.id))
+        self.assertEqual(list(Journal.objects.filter(scan=replay).values_list('titre', flat=True)), [
+            'Ransomware attack disrupts a regional bank',
+        ])
+        self.assertEqual(list(replay.sites.all()), [self.site])
+
+    def test_old_payloads_are_pruned(self):
+        old_scan, recent_scan = create_scan(), create_scan()
+        Scan.objects.filter(id=old_scan.id).update(scan_start_date=now() - timedelta(days=40))
+        old, used = self.archive('feed.rss', old_scan), self.archive('feed.atom', recent_scan)
+        RawPayload.objects.update(fetched_at=now() - timedelta(days=40))
+
+        self.assertEqual(prune_payloads(30), 1)
+        self.assertEqual(list(RawPayload.objects.all()), [used])
+        self.assertFalse(payload_path(old.sha256).exists())
+        self.assertTrue(payload_path(used.sha256).exists())
@@ -0,0 +1,104 @@
+import re
+
+from lxml import etree, html
+
+# Elements that are never part of an article's text
+NOISE_TAGS = (
+    'script', 'style', 'noscript', 'template', 'nav', 'header', 'footer',
+    'aside', 'form', 'iframe', 'svg', 'button', 'select',
+)
+
+# class / id of page furniture around the article
+NOISE_PATTERN = re.compile(
+    r'comment|share|social|related|promo|sidebar|footer|header|menu|navbar|breadcrumb'
+    r'|cookie|consent|newsletter|subscribe|advert|sponsor|popup|modal',
+    re.IGNORECASE,
+)
+
+# Paragraphs shorter than this (captions, bylines, buttons) don't vote for
+# their container
+MIN_PARAGRAPH_LENGTH = 40
+
+TEXT_TAGS = ('p', 'h2', 'h3', 'h4', 'li', 'blockquote', 'pre')
+
+
+def clean_text(text):
+    return " ".join(text.split())
+
+
+def page_title(document):
+    for xpath in ('//meta[@property="og:title"]/@content', '//meta[@name="twitter:title"]/@content'):
+        values = document.xpath(xpath)
+        if values and values[0].strip():
+            return clean_text(values[0])
+    for tag in ('title', 'h1'):
+        element = document.find(f'.//{tag}')
+        if element is not None and element.text_content().strip():
+            return clean_text(element.text_content())
+    return ''
+
+
+def inside_text_block(element, container):
+    for ancestor in element.iterancestors():
+        if ancestor is container:
+            return False
+        if ancestor.tag in TEXT_TAGS:
+            return True
+    return False
+
+
+def main_container(document):
+    """
+    The element holding most of the article's paragraph text: its <article>
+    if it has one, else the parent of the longest paragraphs.
+    """
+    scores = {}
+    for paragraph in document.iter('p'):
+        length = len(clean_text(paragraph.text_content()))
+        if length >= MIN_PARAGRAPH_LENGTH:
+            parent = paragraph.getparent()
+            scores[parent] = scores.get(parent, 0) + length
+
+    for article in document.iter('article'):
+        if any(element is article or article in element.iterancestors() for element in scores):
+            return article
+    return max(scores, key=scores.get) if scores else None
+
+
+def extract_article(content, max_chars=None):
+    """
+    Title and main text of an article page, as a (title, text) pair of
+    strings, empty when the page doesn't look like an article.
+
+    Runs in the extraction process pool: CPU only, no Django.
+    """
+    try:
+        document = html.document_fromstring(content)
+    except (etree.ParserError, ValueError):
+        return '', ''
+
+    title = page_title(document)
+    etree.strip_elements(document, *NOISE_TAGS, etree.Comment, with_tail=False)
+    for element in list(document.iter()):
+        if element.tag in ('html', 'body', 'article', 'main') or not isinstance(element.tag, str):
+            continue
+        if element.getparent() is not None and NOISE_PATTERN.search(f"{element.get('class', '')} {element.get('id', '')}"):
+            element.drop_tree()
+
+    container = main_container(document)
+    if container is None:
+        return title, ''
+
+    paragraphs = []
+    for element in container.iter(*TEXT_TAGS):
+        # Text of nested blocks (a <p> in an <li>) is taken once, from the outer one
+        if inside_text_block(element, container):
+            continue
+        text = clean_text(element.text_content())
+        if text and (not paragraphs or paragraphs[-1] != text):
+            paragraphs.append(text)
+
+    text = "\n\n".join(paragraphs)
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars].rsplit(' ', 1)[0]
+    return title, text
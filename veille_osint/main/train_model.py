@@ -1,90 +0,0 @@
-# rnn_text_classification.py
-
-import pandas as pd
-import numpy as np
-import tensorflow as tf
-from tensorflow.keras.preprocessing.text import Tokenizer
-from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Embedding, LSTM, Dense, Bidirectional
-from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
-import nltk
-import re
-import string
-
-# Download NLTK resources
-nltk.download('punkt')
-nltk.download('stopwords')
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-
-data = pd.read_csv('CyberBert.csv')
-
-data.dropna(inplace=True)
-data.columns = ['text', 'label']
-
-stop_words = set(stopwords.words('english'))
-
-def preprocess_text(text):
-    text = text.lower()
-    text = text.translate(str.maketrans('', '', string.punctuation))
-    text = re.sub(r'\d+', '', text)
-    words = word_tokenize(text)
-    words = [w for w in words if w not in stop_words]
-    return ' '.join(words)
-
-data['text'] = data['text'].apply(preprocess_text)
-
-# 3. Label encoding
-label_encoder = LabelEncoder()
-data['label_encoded'] = label_encoder.fit_transform(data['label'])
-num_classes = len(label_encoder.classes_)
-
-
-max_vocab_size = 10000
-max_sequence_length = 100
-
-tokenizer = Tokenizer(num_words=max_vocab_size, oov_token='<OOV>')
-tokenizer.fit_on_texts(data['text'])
-sequences = tokenizer.texts_to_sequences(data['text'])
-padded_sequences = pad_sequences(sequences, maxlen=max_sequence_length, padding='post', truncating='post')
-
-X_train, X_test, y_train, y_test = train_test_split(
-    padded_sequences, data['label_encoded'], test_size=0.2, random_state=42, stratify=data['label_encoded']
-)
-
-y_train = tf.keras.utils.to_categorical(y_train, num_classes=num_classes)
-y_test = tf.keras.utils.to_categorical(y_test, num_classes=num_classes)
-
-
-embedding_dim = 128
-rnn_units = 64
-
-model = Sequential([
-    Embedding(input_dim=max_vocab_size, output_dim=embedding_dim, input_length=max_sequence_length),
-    Bidirectional(LSTM(rnn_units, return_sequences=False)),
-    Dense(64, activation='relu'),
-    Dense(num_classes, activation='softmax')
-])
-
-model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-model.summary()
-
-# Entraineement du modele
-epochs = 10
-batch_size = 32
-
-history = model.fit(
-    X_train, y_train,
-    validation_split=0.1,
-    epochs=epochs,
-    batch_size=batch_size
-)
-
-# 8. Evaluation du modele
-loss, accuracy = model.evaluate(X_test, y_test)
-print(f"Test Loss: {loss:.4f}, Test Accuracy: {accuracy:.4f}")
-
-# 9. Enregistre le modele
-model.save("rnn_alert_classifier.h5")
@@ -0,0 +1,328 @@
+"""
+Training of the local alert classifier (train_local_model command), and
+fine-tuning of its versions (main.distillation).
+
+Imports nothing from Django, nor NumPy or TensorFlow at import time:
+main.local_model uses clean_text at runtime, and the preprocessing workers
+are spawned processes that only import this module.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import string
+
+# Bump when the cleaning or the encoding below changes, so that cached
+# datasets are rebuilt
+PREPROCESSING_VERSION = 1
+# Texts cleaned per worker task, and encoded per memmap write
+CHUNK_SIZE = 10000
+
+PUNCTUATION = str.maketrans('', '', string.punctuation)
+DIGITS = re.compile(r'\d+')
+
+
+def clean_text(text, stop_words):
+    """Lowercase, drop punctuation, digits and stop words: the text the model sees."""
+    text = DIGITS.sub('', text.lower().translate(PUNCTUATION))
+    return ' '.join(w for w in text.split() if w not in stop_words)
+
+
+def clean_chunk(texts, stop_words):
+    stop_words = frozenset(stop_words)
+    return [clean_text(text, stop_words) for text in texts]
+
+
+def clean_texts(texts, stop_words, processes=None):
+    """
+    clean_text over every text, in chunks spread over `processes` worker
+    processes (one per core by default). Small corpora are cleaned inline.
+    """
+    texts = list(texts)
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(texts) <= CHUNK_SIZE:
+        return clean_chunk(texts, stop_words)
+    chunks = [texts[start:start + CHUNK_SIZE] for start in range(0, len(texts), CHUNK_SIZE)]
+    stop_words = sorted(stop_words)
+    # Spawned rather than forked: the parent may be running threads
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        cleaned = []
+        for chunk in pool.map(clean_chunk, chunks, [stop_words] * len(chunks)):
+            cleaned.extend(chunk)
+    return cleaned
+
+
+def english_stop_words():
+    """NLTK's English stop words, downloaded only if they aren't there yet."""
+    import nltk
+    from nltk.corpus import stopwords
+
+    try:
+        return set(stopwords.words('english'))
+    except LookupError:
+        nltk.download('stopwords', quiet=True)
+        return set(stopwords.words('english'))
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dataset_key(csv_path, max_vocab, max_length):
+    """Cache key of a corpus: its content and how it is encoded."""
+    digest = hashlib.sha256(file_digest(csv_path).encode())
+    digest.update(json.dumps([PREPROCESSING_VERSION, max_vocab, max_length]).encode())
+    return digest.hexdigest()[:24]
+
+
+def read_corpus(csv_path):
+    """Texts and labels of a two-column (text, label) CSV, like CyberBert.csv."""
+    import pandas as pd
+
+    data = pd.read_csv(csv_path).dropna()
+    data.columns = ['text', 'label']
+    return data['text'].astype(str).tolist(), data['label'].astype(str).tolist()
+
+
+class Dataset:
+    """
+    A corpus cleaned, tokenized and padded, as memory-mapped arrays in its
+    cache directory: `sequences` (rows x max_length token ids) and `labels`
+    (index into `label_names` of each row).
+    """
+
+    def __init__(self, directory):
+        import numpy as np
+
+        self.directory = directory
+        self.key = os.path.basename(directory)
+        self.sequences = np.load(os.path.join(directory, 'sequences.npy'), mmap_mode='r')
+        self.labels = np.load(os.path.join(directory, 'labels.npy'), mmap_mode='r')
+        with open(os.path.join(directory, 'tokenizer.json')) as f:
+            self.tokenizer_json = f.read()
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.label_names = meta['labels']
+        self.max_vocab = meta['max_vocab']
+        self.max_length = meta['max_sequence_length']
+        self.stop_words = meta['stop_words']
+
+    def __len__(self):
+        return len(self.labels)
+
+    def model_meta(self):
+        """Metadata of the models trained on this dataset, for save_model."""
+        return {
+            'labels': self.label_names,
+            'max_sequence_length': self.max_length,
+            'stop_words': self.stop_words,
+            'dataset': self.key,
+        }
+
+
+def build_dataset(csv_path, cache_dir, max_vocab=10000, max_length=100, processes=None, rebuild=False):
+    """
+    The Dataset of `csv_path`, from the cache when the same corpus was
+    already encoded the same way. Otherwise the texts are cleaned across
+    processes, the tokenizer fitted, and the padded sequences written chunk
+    by chunk into a memmap, so the corpus is never held twice in memory.
+    """
+    import numpy as np
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+    from tensorflow.keras.preprocessing.text import Tokenizer
+
+    directory = os.path.join(cache_dir, dataset_key(csv_path, max_vocab, max_length))
+    if os.path.exists(directory):
+        if not rebuild:
+            return Dataset(directory)
+        shutil.rmtree(directory)
+
+    texts, labels = read_corpus(csv_path)
+    stop_words = english_stop_words()
+    texts = clean_texts(texts, stop_words, processes)
+    # Sorted like LabelEncoder.classes_
+    label_names = sorted(set(labels))
+    label_ids = {label: index for index, label in enumerate(label_names)}
+
+    tokenizer = Tokenizer(num_words=max_vocab, oov_token='<OOV>')
+    tokenizer.fit_on_texts(texts)
+
+    # Written aside and renamed once complete: a cache directory is always whole
+    partial = f"{directory}.{os.getpid()}.partial"
+    os.makedirs(partial, exist_ok=True)
+    sequences = np.lib.format.open_memmap(
+        os.path.join(partial, 'sequences.npy'), mode='w+', dtype=np.int32, shape=(len(texts), max_length)
+    )
+    for start in range(0, len(texts), CHUNK_SIZE):
+        chunk = tokenizer.texts_to_sequences(texts[start:start + CHUNK_SIZE])
+        sequences[start:start + len(chunk)] = pad_sequences(chunk, maxlen=max_length, padding='post', truncating='post')
+    sequences.flush()
+    del sequences
+    np.save(os.path.join(partial, 'labels.npy'), np.array([label_ids[label] for label in labels], dtype=np.int32))
+    with open(os.path.join(partial, 'tokenizer.json'), 'w') as f:
+        f.write(tokenizer.to_json())
+    with open(os.path.join(partial, 'meta.json'), 'w') as f:
+        json.dump({
+            'labels': label_names,
+            'max_vocab': max_vocab,
+            'max_sequence_length': max_length,
+            'stop_words': sorted(stop_words),
+            'source': os.path.abspath(csv_path),
+        }, f)
+    try:
+        os.rename(partial, directory)
+    except OSError:
+        # Built meanwhile by another run
+        shutil.rmtree(partial)
+    return Dataset(directory)
+
+
+def stream(sequences, labels, indices, batch_size, shuffle=False, seed=42):
+    """
+    tf.data pipeline of (sequences, labels) batches of the rows `indices`,
+    read from the arrays (memmaps of a Dataset) as they are consumed and
+    prefetched while the previous batch trains. With `shuffle`, each epoch
+    visits the rows in a new order.
+    """
+    import numpy as np
+    import tensorflow as tf
+
+    rng = np.random.default_rng(seed)
+
+    def batches():
+        order = rng.permutation(indices) if shuffle else indices
+        for start in range(0, len(order), batch_size):
+            # Sorted within the batch, so reads move forward through the file
+            rows = np.sort(order[start:start + batch_size])
+            yield sequences[rows], labels[rows]
+
+    dataset = tf.data.Dataset.from_generator(
+        batches,
+        output_signature=(
+            tf.TensorSpec(shape=(None, sequences.shape[1]), dtype=tf.int32),
+            tf.TensorSpec(shape=(None,), dtype=tf.int32),
+        ),
+    )
+    # With a known length, Keras doesn't mistake the end of an epoch for data running out
+    length = -(-len(indices) // batch_size)
+    return dataset.apply(tf.data.experimental.assert_cardinality(length)).prefetch(tf.data.AUTOTUNE)
+
+
+def build_model(max_vocab, max_length, num_classes, embedding_dim=128, rnn_units=64):
+    from tensorflow.keras.layers import LSTM, Bidirectional, Dense, Embedding, Input
+    from tensorflow.keras.models import Sequential
+
+    model = Sequential([
+        Input(shape=(max_length,)),
+        Embedding(input_dim=max_vocab, output_dim=embedding_dim),
+        Bidirectional(LSTM(rnn_units, return_sequences=False)),
+        Dense(64, activation='relu'),
+        Dense(num_classes, activation='softmax'),
+    ])
+    return compile_model(model)
+
+
+def compile_model(model, learning_rate=None):
+    from tensorflow.keras.optimizers import Adam
+
+    # Integer labels: no one-hot copy of the corpus
+    model.compile(
+        loss='sparse_categorical_crossentropy',
+        optimizer=Adam(learning_rate) if learning_rate else 'adam',
+        metrics=['accuracy'],
+    )
+    return model
+
+
+def warm_start(model, num_classes, same_labels, learning_rate):
+    """
+    A copy of a trained model to fine-tune with a lower learning rate. When
+    its labels differ from the new ones, its softmax layer is replaced by a
+    fresh one over `num_classes` labels, the embedding and BiLSTM being kept.
+    """
+    from tensorflow.keras.layers import Dense
+    from tensorflow.keras.models import Model, clone_model
+
+    copy = clone_model(model)
+    copy.set_weights(model.get_weights())
+    if not same_labels:
+        features = copy.layers[-2].output
+        copy = Model(copy.inputs, Dense(num_classes, activation='softmax', name='labels')(features))
+    return compile_model(copy, learning_rate)
+
+
+def split(labels, test_size=0.2, validation_size=0.1, seed=42):
+    """Stratified (train, validation, test) row indices; test_size=0 for no test rows."""
+    import numpy as np
+
+    labels = np.asarray(labels)
+    rows = np.arange(len(labels))
+    test = rows[:0]
+    if test_size:
+        rows, test = holdout_split(rows, labels, test_size, seed)
+    train, validation = holdout_split(rows, labels[rows], validation_size, seed)
+    return train, validation, test
+
+
+def holdout_split(rows, labels, size, seed):
+    from sklearn.model_selection import train_test_split
+
+    try:
+        return train_test_split(rows, test_size=size, random_state=seed, stratify=labels)
+    except ValueError:
+        # A label too rare to be on both sides
+        return train_test_split(rows, test_size=size, random_state=seed)
+
+
+def fit(model, sequences, labels, train_rows, validation_rows, epochs, batch_size, patience, seed=42, verbose=1):
+    """
+    Train on streamed batches, stopping early on the validation loss and
+    keeping the best weights. Returns the number of epochs run.
+    """
+    from tensorflow.keras.callbacks import EarlyStopping
+
+    history = model.fit(
+        stream(sequences, labels, train_rows, batch_size, shuffle=True, seed=seed),
+        validation_data=stream(sequences, labels, validation_rows, batch_size),
+        epochs=epochs,
+        callbacks=[EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True)],
+        verbose=verbose,
+    )
+    return len(history.history['loss'])
+
+
+def train(dataset, epochs=10, batch_size=32, patience=2, seed=42, verbose=1):
+    """
+    Train a new model on the dataset, then evaluate it on the held-out test
+    rows. Returns (model, metrics).
+    """
+    train_rows, validation_rows, test_rows = split(dataset.labels, seed=seed)
+    model = build_model(dataset.max_vocab, dataset.max_length, len(dataset.label_names))
+    epochs = fit(
+        model, dataset.sequences, dataset.labels, train_rows, validation_rows, epochs, batch_size, patience, seed, verbose
+    )
+    loss, accuracy = model.evaluate(stream(dataset.sequences, dataset.labels, test_rows, batch_size), verbose=0)
+    return model, {'loss': float(loss), 'accuracy': float(accuracy), 'epochs': epochs}
+
+
+def save_model(model, path, tokenizer_json, meta):
+    """
+    Save the model with the tokenizer and metadata main.local_model loads
+    next to it (<name>.tokenizer.json, <name>.meta.json). `meta` has the
+    labels, max_sequence_length and stop_words, and whatever else describes
+    the version.
+    """
+    base = os.path.splitext(path)[0]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    model.save(path)
+    with open(f"{base}.tokenizer.json", 'w') as f:
+        f.write(tokenizer_json)
+    with open(f"{base}.meta.json", 'w') as f:
+        json.dump(meta, f)
@@ -0,0 +1,413 @@
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from django.conf import settings
+from django.db import close_old_connections
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import aiohttp
+except ImportError:  # Optional: the async client falls back to requests in threads
+    aiohttp = None
+
+from .rate_limits import PRIORITY_SCHEDULED, PROFILES, RateLimited, get_governor
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+# Errors of either client while a streamed body is read
+BODY_ERRORS = (urllib3.exceptions.HTTPError,) + ((aiohttp.ClientError,) if aiohttp is not None else ())
+
+# Statuses worth retrying: the upstream is overloaded or briefly unavailable
+RETRY_STATUSES = {500, 502, 503, 504}
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+class CircuitOpen(requests.RequestException):
+    """
+    The upstream failed too often recently; calls fail fast until it is
+    tried again.
+    """
+
+    def __init__(self, upstream, retry_in):
+        super().__init__(f"{upstream} is unavailable, next try in {retry_in:.0f}s")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+
+class Upstream:
+    """
+    HTTP client for one external API: a keep-alive session whose connection
+    pool is shared by every thread, connect/read timeouts, retries with
+    jittered exponential backoff, the upstream's rate governor and a circuit
+    breaker.
+
+    The breaker opens after UPSTREAM_CIRCUIT_FAILURES consecutive failed
+    calls, and lets one trial call through UPSTREAM_CIRCUIT_RESET_SECONDS
+    later (half-open): it closes again if that call succeeds. A 429 isn't a
+    failure, the governor handles it. State and latencies are kept per
+    process for the operators' status page.
+    """
+
+    def __init__(self, name, connect_timeout, read_timeout, profile=None):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.governor = get_governor(name, profile)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.UPSTREAM_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.trial_running = False
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.statuses = {}
+        self.latencies = [0] * len(LATENCY_BUCKETS)
+        self.latency_total = 0
+        self.last_error = ''
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, priority=PRIORITY_SCHEDULED, **kwargs):
+        """
+        Send a request, retrying connection errors, timeouts, 5xx and 429 up
+        to UPSTREAM_MAX_RETRIES times. Returns the last response (the caller
+        still checks its status) or raises the last RequestException,
+        RateLimited or CircuitOpen.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            self.start_call(priority)
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                response = self.settle(attempt, time.monotonic() - started, error=e)
+            else:
+                response = self.settle(attempt, time.monotonic() - started, response)
+            if response is not None:
+                response.upstream = self
+                return response
+
+            attempt += 1
+            time.sleep(backoff_delay(attempt))
+
+    async def arequest(self, session, method, url, priority=PRIORITY_SCHEDULED, stream=False, **kwargs):
+        """
+        `request` on an aiohttp session: same retries, governor and breaker,
+        without holding a thread while the upstream answers. The body is read
+        into a requests.Response, so callers handle both alike; with `stream`
+        it is left unread, for body_reader().
+        """
+        connect_timeout, read_timeout = kwargs.pop('timeout', self.timeout)
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        attempt = 0
+        while True:
+            # The governor may wait for a token and reads the shared quotas
+            await asyncio.to_thread(run_blocking, self.start_call, priority)
+            started = time.monotonic()
+            try:
+                reply = await session.request(method, url, timeout=timeout, **kwargs)
+                response = requests.Response()
+                response.status_code = reply.status
+                response.reason = reply.reason
+                response.headers = CaseInsensitiveDict(reply.headers)
+                response.url = str(reply.url)
+                response.raw = reply
+                if not stream:
+                    try:
+                        response._content = await reply.read()
+                    finally:
+                        reply.release()
+                    response.encoding = reply.get_encoding() if response._content else None
+            except asyncio.TimeoutError:
+                error = requests.Timeout(f"{self.name}: no answer within {read_timeout}s from {url}")
+                response = await asyncio.to_thread(run_blocking, self.settle, attempt, time.monotonic() - started, error=error)
+            except aiohttp.ClientError as e:
+                error = requests.ConnectionError(f"{self.name}: {e}")
+                response = await asyncio.to_thread(run_blocking, self.settle, attempt, time.monotonic() - started, error=error)
+            else:
+                response = await asyncio.to_thread(run_blocking, self.settle, attempt, time.monotonic() - started, response)
+            if response is not None:
+                response.upstream = self
+                return response
+
+            attempt += 1
+            await asyncio.sleep(backoff_delay(attempt))
+
+    def start_call(self, priority):
+        """
+        Let a call through the breaker and the governor, or raise CircuitOpen
+        or RateLimited.
+        """
+        self.before_call()
+        try:
+            self.governor.acquire(priority)
+        except RateLimited:
+            with self.lock:
+                self.trial_running = False
+            raise
+
+    def settle(self, attempt, duration, response=None, error=None):
+        """
+        Record a try and return the response to hand back, or None to retry.
+        Raises the error, or RateLimited, once the retries are spent.
+        """
+        last = attempt >= settings.UPSTREAM_MAX_RETRIES
+        if error is not None:
+            self.after_call(duration, None, error)
+            if last:
+                raise error
+        else:
+            self.after_call(duration, response.status_code)
+            try:
+                self.governor.observe(response)
+            except RateLimited:
+                if last:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last:
+                    return response
+            response.close()
+
+        with self.lock:
+            self.retries += 1
+        return None
+
+    def before_call(self):
+        with self.lock:
+            if self.state == 'open':
+                retry_in = self.opened_at + settings.UPSTREAM_CIRCUIT_RESET_SECONDS - time.monotonic()
+                if retry_in > 0 or self.trial_running:
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, max(retry_in, 0))
+                # Half-open: this call decides whether the upstream is back
+                self.trial_running = True
+
+    def after_call(self, duration, status, error=None):
+        failed = error is not None or status in RETRY_STATUSES
+        with self.lock:
+            self.calls += 1
+            self.latency_total += duration
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    self.latencies[index] += 1
+                    break
+            key = status or type(error).__name__
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+            if failed:
+                self.count_failure(str(error) if error else f"HTTP {status}")
+            else:
+                if self.state == 'open':
+                    print(f"[Upstream] Circuit for {self.name} closed")
+                self.state = 'closed'
+                self.failures = 0
+            self.trial_running = False
+
+    def body_failed(self, error):
+        """
+        A streamed body broke off after its call was settled: the call counts
+        as failed for the breaker after all.
+        """
+        with self.lock:
+            key = type(error).__name__
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            self.count_failure(str(error))
+
+    def count_failure(self, message):
+        # Called with the lock held
+        self.errors += 1
+        self.failures += 1
+        self.last_error = message
+        if self.trial_running or self.failures >= settings.UPSTREAM_CIRCUIT_FAILURES:
+            if self.state != 'open':
+                print(f"[Upstream] Circuit for {self.name} opened: {self.last_error}")
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls."""
+        target = self.calls * fraction
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latencies):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return None
+
+    def status(self):
+        budget = self.governor.usage()
+        with self.lock:
+            state = self.state
+            if state == 'open' and time.monotonic() >= self.opened_at + settings.UPSTREAM_CIRCUIT_RESET_SECONDS:
+                state = 'half-open'
+            return {
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self.failures,
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'statuses': dict(self.statuses),
+                'last_error': self.last_error,
+                'mean_latency': self.latency_total / self.calls if self.calls else None,
+                'p50': self.percentile(0.5),
+                'p95': self.percentile(0.95),
+                'histogram': [
+                    (f"<= {bound} s" if bound != float('inf') else f"> {LATENCY_BUCKETS[-2]} s", count)
+                    for bound, count in zip(LATENCY_BUCKETS, self.latencies)
+                ],
+                'budget': budget,
+            }
+
+
+class AsyncClient:
+    """
+    HTTP client of one ingestion event loop, sending requests through the
+    upstream clients with at most UPSTREAM_CONNECTIONS_PER_HOST connections
+    per host.
+
+    Uses an aiohttp session when aiohttp is installed; otherwise each request
+    is a blocking call of the upstream's requests session in a worker thread.
+    """
+
+    def __init__(self):
+        self.session = None
+        self.hosts = {}
+
+    async def __aenter__(self):
+        if aiohttp is not None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=settings.UPSTREAM_CONNECTIONS_PER_HOST,
+            ))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.session is not None:
+            await self.session.close()
+
+    async def request(self, upstream, method, url, priority=PRIORITY_SCHEDULED, **kwargs):
+        if self.session is not None:
+            return await upstream.arequest(self.session, method, url, priority=priority, **kwargs)
+
+        host = urlparse(url).netloc
+        semaphore = self.hosts.setdefault(host, asyncio.Semaphore(settings.UPSTREAM_CONNECTIONS_PER_HOST))
+        async with semaphore:
+            return await asyncio.to_thread(run_blocking, upstream.request, method, url, priority=priority, **kwargs)
+
+
+class BlockingReader:
+    """
+    Async `read` of a blocking file-like object, each read in a worker thread.
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    async def read(self, size=-1):
+        return await asyncio.to_thread(self.file.read, size)
+
+
+class UpstreamBody:
+    """
+    Async reader of a streamed body which, like the call itself, turns client
+    errors into requests exceptions and counts them against the upstream's
+    breaker.
+    """
+
+    def __init__(self, reader, upstream, url):
+        self.reader = reader
+        self.upstream = upstream
+        self.url = url
+
+    async def read(self, size=-1):
+        try:
+            return await self.reader.read(size)
+        except (asyncio.TimeoutError, urllib3.exceptions.TimeoutError):
+            error = requests.Timeout(f"{self.upstream.name}: the body of {self.url} stalled")
+        except BODY_ERRORS as e:
+            error = requests.ConnectionError(f"{self.upstream.name}: the body of {self.url} broke off: {e}")
+        except requests.RequestException as e:
+            error = e
+        self.upstream.body_failed(error)
+        raise error
+
+
+def body_reader(response):
+    """
+    Async reader of the body of a response requested with stream=True, on
+    either client. The caller closes the response once done.
+    """
+    if aiohttp is not None and isinstance(response.raw, aiohttp.ClientResponse):
+        reader = response.raw.content
+    else:
+        response.raw.decode_content = True
+        reader = BlockingReader(response.raw)
+    upstream = getattr(response, 'upstream', None)
+    return UpstreamBody(reader, upstream, response.url) if upstream is not None else reader
+
+
+def run_blocking(function, *args, **kwargs):
+    """
+    Run a blocking call in a worker thread, closing the database connection
+    the rate governor may have opened there.
+    """
+    try:
+        return function(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def backoff_delay(attempt):
+    """
+    Full-jitter exponential backoff: a random delay up to
+    UPSTREAM_BACKOFF_BASE * 2^(attempt - 1), capped at UPSTREAM_BACKOFF_MAX.
+    """
+    ceiling = min(settings.UPSTREAM_BACKOFF_MAX, settings.UPSTREAM_BACKOFF_BASE * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+def get_upstream(name, profile=None):
+    """
+    The process-wide client of an upstream configured in UPSTREAM_TIMEOUTS,
+    or configured like `profile` if it isn't (feed hosts use 'feeds', article
+    pages 'articles').
+    """
+    with _upstreams_lock:
+        if name not in _upstreams:
+            config = settings.UPSTREAM_TIMEOUTS.get(name) or settings.UPSTREAM_TIMEOUTS[profile]
+            _upstreams[name] = Upstream(name, profile=profile, **config)
+        return _upstreams[name]
+
+
+def upstream_statuses():
+    """Circuit state, latencies and budget of every upstream used so far."""
+    for name in settings.UPSTREAM_TIMEOUTS:
+        if name not in PROFILES:
+            get_upstream(name)
+    with _upstreams_lock:
+        upstreams = list(_upstreams.values())
+    return [upstream.status() for upstream in upstreams]
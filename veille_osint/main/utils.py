@@ -13,6 +13,8 @@ from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.mail import EmailMessage
 
+from .upstreams import get_upstream
+
 def send_report_as_email(report):
     print(f"Sending report {report.id} as email.")
     subject = f"Report: {report.name}"
@@ -45,7 +47,7 @@ def generate_report_pdf(report, scans, alerts):
     scan_data = [["Name", "Sites", "Number of Results"]]
     for scan in scans:
         sites = ", ".join([site.name for site in scan.sites.all()])
-        result_count = scan.results.count()
+        result_count = scan.result_count
         scan_data.append([scan.name or "N/A", sites, str(result_count)])
 
     scan_table = Table(scan_data, hAlign='LEFT')
@@ -132,7 +134,7 @@ def get_recommendations_from_ai(alert):
     }
 
     try:
-        response = requests.post(api_url, json=payload, headers=headers)
+        response = get_upstream('gemini').post(api_url, json=payload, headers=headers)
         response.raise_for_status()
         # recommendations = response.json().get('recommendations', 'No recommendations available.')
         json_response = response.json()
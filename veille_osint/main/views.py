@@ -2,7 +2,8 @@ from collections import defaultdict
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.urls import reverse
 from django.utils.translation import gettext as _
@@ -21,6 +22,7 @@ from reportlab.lib.pagesizes import A4
 from .forms import *
 from .models import *
 from .utils import send_report_as_email, generate_report_pdf
+from .upstreams import upstream_statuses
 
 # Create your views here.
 def blank_page(request):
@@ -107,7 +109,9 @@ def scans(request):
     if request.method == 'POST':
         form = ScanForm(request.POST)
         if form.is_valid():
-            form.save()
+            # Queued for ingestion on commit, once its sites are set
+            with transaction.atomic():
+                form.save()
             messages.success(request, _("Scan cree avec succes!"))
             return redirect('scans')  
     else:
@@ -121,13 +125,16 @@ def quick_scan(request):
 
     if keywords:
         # Create a Scan object (no schedule)
-        scan = Scan.objects.create(
-            name=f"Quick Scan: {keywords}",
-            keywords=keywords,
-            status="pending"
-        )
-        scan.sites.set(Sites.objects.all())
-        results = ScanResult.objects.filter(scan=scan)
+        # Queued for ingestion on commit, once its sites are set
+        with transaction.atomic():
+            scan = Scan.objects.create(
+                name=f"Quick Scan: {keywords}",
+                keywords=keywords,
+                status="pending"
+            )
+            scan.sites.set(Sites.objects.all())
+        # Articles stored by an earlier scan are linked rather than duplicated
+        results = ScanResult.objects.filter(Q(scan=scan) | Q(linked_scans=scan)).distinct()
 
         return render(request, "main/quick_scan_results.html", {
             "scan": scan, "results": results
@@ -154,7 +161,8 @@ def scan_detail(request, scan_id):
     Render the detail page for a specific Scan.
     """
     scan = Scan.objects.get(id=scan_id)
-    scan_results = ScanResult.objects.filter(scan=scan)
+    # Articles stored by an earlier scan are linked rather than duplicated
+    scan_results = ScanResult.objects.filter(Q(scan=scan) | Q(linked_scans=scan)).distinct()
 
     return render(request, 'main/scan_detail.html', {'scan': scan, 'scan_results': scan_results})
 
@@ -255,6 +263,13 @@ def notifications(request):
     """
     return render(request, 'main/notifications.html')
 
+def upstreams(request):
+    """
+    Circuit breaker state, latencies and rate budget of the external APIs,
+    as seen by this process.
+    """
+    return render(request, 'main/upstreams.html', {'upstreams': upstream_statuses()})
+
 def settings(request):
     if request.method == "POST":
         user = request.user
@@ -0,0 +1,96 @@
+from django.db import transaction
+
+from .dedup import normalize_content
+from .models import IngestionWatermark
+
+
+def keyword_terms(keywords):
+    """
+    Split a scan's comma-separated keywords into distinct lowercase terms.
+    """
+    terms = []
+    for term in (keywords or '').split(','):
+        term = " ".join(term.lower().split())
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def found_terms(terms, *texts):
+    """
+    The terms appearing as whole words in the texts.
+    """
+    content = f" {normalize_content(*texts)} "
+    return [term for term in terms if f" {normalize_content(term)} " in content]
+
+
+class WatermarkTracker:
+    """
+    Per-keyword high-water marks of a schedule on one site during one scan.
+
+    `since()` gives the start of the window to fetch, `is_new()` tells
+    whether an article is strictly newer than the watermark of one of its
+    terms, and `commit()` advances the watermarks to the newest articles seen.
+    It must only be called once those articles are stored, and is skipped if
+    part of the window couldn't be fetched (`complete = False`), so nothing is
+    ever skipped for good. Scans without a schedule have no watermark.
+    """
+
+    def __init__(self, schedule, terms, site=None):
+        self.schedule = schedule
+        self.site = site if site is not None and site.pk else None
+        self.terms = terms
+        self.current = {}
+        if schedule is not None:
+            self.current = {
+                watermark.keyword: (watermark.published_at, watermark.cursor)
+                for watermark in IngestionWatermark.objects.filter(schedule=schedule, site=self.site, keyword__in=terms)
+            }
+        self.newest = dict(self.current)
+        self.complete = True
+
+    def since(self):
+        """
+        Oldest watermark of the terms, or None if one of them was never fetched.
+        """
+        if not self.terms or any(term not in self.current for term in self.terms):
+            return None
+        return min(published_at for published_at, _ in self.current.values())
+
+    def is_new(self, terms, published_at, url_hash):
+        for term in terms:
+            watermark = self.current.get(term)
+            if watermark is None or published_at > watermark[0]:
+                return True
+            if published_at == watermark[0] and url_hash != watermark[1]:
+                return True
+        return False
+
+    def record(self, terms, published_at, url_hash):
+        for term in terms:
+            newest = self.newest.get(term)
+            if newest is None or published_at > newest[0]:
+                self.newest[term] = (published_at, url_hash or '')
+
+    def commit(self):
+        if self.schedule is None:
+            return
+        if not self.complete:
+            print(f"Watermarks of schedule {self.schedule.id} on {self.site or 'NewsAPI'} kept: part of the window wasn't fetched")
+            return
+
+        with transaction.atomic():
+            for term, (published_at, cursor) in self.newest.items():
+                if self.current.get(term) == (published_at, cursor):
+                    continue
+                watermark, created = IngestionWatermark.objects.get_or_create(
+                    schedule=self.schedule,
+                    site=self.site,
+                    keyword=term,
+                    defaults={'published_at': published_at, 'cursor': cursor},
+                )
+                if not created:
+                    # Never move back behind a concurrent scan of the schedule
+                    IngestionWatermark.objects.filter(pk=watermark.pk, published_at__lte=published_at).update(
+                        published_at=published_at, cursor=cursor
+                    )
@@ -30,6 +30,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django_apscheduler',
     'main'
 ]
 
@@ -72,6 +73,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Ingestion and classification workers write concurrently: transactions
+        # take the write lock upfront and wait for it, rather than failing
+        # with "database is locked" when upgrading from a read
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     } if not USE_MYSQL else {
         'ENGINE': 'django.db.backends.mysql',
         'NAME': config.get('MYSQL_DB_NAME', 'osint'),
@@ -133,6 +141,221 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 NEWS_API_KEY = config.get('NEWS_API_KEY', 'your_default_news_api_key')
 GEMINI_API_KEY = config.get('GEMINI_API_KEY', 'your_default_gemini_api_key')
 
+# Number of ingestion worker threads of each web process, each claiming and
+# ingesting its own batch of scans
+INGESTION_WORKERS = int(config.get('INGESTION_WORKERS', 4))
+
+# Whether web processes run scans themselves, or leave them to `manage.py
+# run_ingestion_worker` processes sharing the database. Idle workers look for
+# pending scans (deferred, or abandoned by a stopped worker) every
+# INGESTION_POLL_INTERVAL seconds
+INGESTION_IN_PROCESS = config.get('INGESTION_IN_PROCESS', 'True') == 'True'
+INGESTION_POLL_INTERVAL = float(config.get('INGESTION_POLL_INTERVAL', 5))
+
+# A worker holds a scan for INGESTION_LEASE_SECONDS, renewed every
+# INGESTION_HEARTBEAT_SECONDS; expired scans are reclaimed by another worker,
+# up to INGESTION_MAX_ATTEMPTS times
+INGESTION_LEASE_SECONDS = int(config.get('INGESTION_LEASE_SECONDS', 120))
+INGESTION_HEARTBEAT_SECONDS = int(config.get('INGESTION_HEARTBEAT_SECONDS', 30))
+INGESTION_MAX_ATTEMPTS = int(config.get('INGESTION_MAX_ATTEMPTS', 3))
+
+# Scans claimed together share their NewsAPI queries: keywords are
+# deduplicated and OR-combined into queries of at most NEWS_API_MAX_QUERY_LENGTH
+# characters. In-process workers each claim an even share of the pending
+# scans, up to INGESTION_PLAN_MAX_SCANS
+INGESTION_PLAN_MAX_SCANS = int(config.get('INGESTION_PLAN_MAX_SCANS', 20))
+NEWS_API_MAX_QUERY_LENGTH = int(config.get('NEWS_API_MAX_QUERY_LENGTH', 500))
+
+# NewsAPI paging: articles per page and the maximum number of results the
+# plan lets us page through (pages fetched at once: Sites.max_concurrency).
+# The default is the Developer (free) plan's cap of 100 results, a single
+# page: pages are only fetched concurrently with NEWS_API_MAX_RESULTS raised
+# to the paid plan's limit, or 0 for none
+NEWS_API_PAGE_SIZE = int(config.get('NEWS_API_PAGE_SIZE', 100))
+NEWS_API_MAX_RESULTS = int(config.get('NEWS_API_MAX_RESULTS', 100))
+
+# A query matching more results than that is sent again for the older ones,
+# ending at the oldest article read, up to NEWS_API_BACKFILL_QUERIES more
+# times. Matches older than that are skipped (and logged): the watermarks
+# move on rather than stopping at the same newest articles every scan
+NEWS_API_BACKFILL_QUERIES = int(config.get('NEWS_API_BACKFILL_QUERIES', 5))
+
+# Number of articles written per transaction by the ingestion pipeline
+INGESTION_BATCH_SIZE = int(config.get('INGESTION_BATCH_SIZE', 100))
+
+# Batches of fetched articles waiting for the storage thread before fetching
+# pauses until it catches up
+INGESTION_STORAGE_QUEUE = int(config.get('INGESTION_STORAGE_QUEUE', 8))
+
+# Full-text enrichment: download the page of each new article and extract its
+# title and main text (at most ARTICLE_TEXT_MAX_CHARS characters), which the
+# classifier then judges instead of the description. Pages are parsed by
+# ARTICLE_EXTRACTION_PROCESSES processes, ARTICLE_EXTRACTION_CONCURRENCY
+# downloads at a time, and kept ARTICLE_TEXT_CACHE_TTL seconds per URL
+ARTICLE_EXTRACTION_ENABLED = config.get('ARTICLE_EXTRACTION_ENABLED', 'False') == 'True'
+ARTICLE_EXTRACTION_PROCESSES = int(config.get('ARTICLE_EXTRACTION_PROCESSES', 2))
+ARTICLE_EXTRACTION_CONCURRENCY = int(config.get('ARTICLE_EXTRACTION_CONCURRENCY', 8))
+ARTICLE_MAX_BYTES = int(config.get('ARTICLE_MAX_BYTES', 2 * 1024 * 1024))
+ARTICLE_TEXT_MAX_CHARS = int(config.get('ARTICLE_TEXT_MAX_CHARS', 10000))
+ARTICLE_TEXT_CACHE_TTL = int(config.get('ARTICLE_TEXT_CACHE_TTL', 7 * 24 * 3600))
+
+# Story clustering: results whose title and description are near-duplicates
+# (estimated Jaccard similarity of their word shingles of at least
+# STORY_CLUSTER_THRESHOLD) of a result seen in the last
+# STORY_CLUSTER_WINDOW_HOURS share its verdict instead of being classified.
+# Signatures are split into STORY_LSH_BANDS bands of STORY_LSH_ROWS rows
+STORY_CLUSTERING_ENABLED = config.get('STORY_CLUSTERING_ENABLED', 'True') == 'True'
+STORY_CLUSTER_THRESHOLD = float(config.get('STORY_CLUSTER_THRESHOLD', 0.5))
+STORY_CLUSTER_WINDOW_HOURS = int(config.get('STORY_CLUSTER_WINDOW_HOURS', 72))
+STORY_LSH_BANDS = int(config.get('STORY_LSH_BANDS', 16))
+STORY_LSH_ROWS = int(config.get('STORY_LSH_ROWS', 4))
+
+# Raw payload archive: when enabled, every upstream response body read to the
+# end is kept gzipped under PAYLOAD_ARCHIVE_DIR, named after its SHA-256, so
+# that scans can be replayed offline (replay_scan command). Not served as
+# media. Off by default: it grows with every scan. The prune_payload_archive
+# command (run it daily from cron) deletes the payloads older than
+# PAYLOAD_ARCHIVE_RETENTION_DAYS that no scan of that period used.
+PAYLOAD_ARCHIVE_ENABLED = config.get('PAYLOAD_ARCHIVE_ENABLED', 'False') == 'True'
+PAYLOAD_ARCHIVE_DIR = config.get('PAYLOAD_ARCHIVE_DIR', str(BASE_DIR / 'payload_archive'))
+PAYLOAD_ARCHIVE_RETENTION_DAYS = int(config.get('PAYLOAD_ARCHIVE_RETENTION_DAYS', 30))
+
+# Classifier verdict cache: lifetime in seconds and maximum number of entries
+CLASSIFICATION_CACHE_TTL = int(config.get('CLASSIFICATION_CACHE_TTL', 30 * 24 * 3600))
+CLASSIFICATION_CACHE_MAX_ENTRIES = int(config.get('CLASSIFICATION_CACHE_MAX_ENTRIES', 50000))
+
+# Batched classification: items and estimated prompt tokens per Gemini request
+CLASSIFIER_BATCH_SIZE = int(config.get('CLASSIFIER_BATCH_SIZE', 20))
+CLASSIFIER_BATCH_TOKENS = int(config.get('CLASSIFIER_BATCH_TOKENS', 8000))
+
+# Classification queue: stored results are classified by CLASSIFICATION_WORKERS
+# threads of each process that stores some (if CLASSIFICATION_IN_PROCESS) or
+# by `manage.py run_classification_worker` processes, CLASSIFICATION_BATCH_SIZE
+# at a time under a lease of CLASSIFICATION_LEASE_SECONDS. Idle workers poll
+# every CLASSIFICATION_POLL_INTERVAL seconds. A failure is retried after
+# CLASSIFICATION_RETRY_BASE seconds, doubled each time up to
+# CLASSIFICATION_RETRY_MAX, and dead-lettered after CLASSIFICATION_MAX_ATTEMPTS
+CLASSIFICATION_IN_PROCESS = config.get('CLASSIFICATION_IN_PROCESS', 'True') == 'True'
+CLASSIFICATION_WORKERS = int(config.get('CLASSIFICATION_WORKERS', 2))
+CLASSIFICATION_BATCH_SIZE = int(config.get('CLASSIFICATION_BATCH_SIZE', CLASSIFIER_BATCH_SIZE))
+CLASSIFICATION_LEASE_SECONDS = int(config.get('CLASSIFICATION_LEASE_SECONDS', 300))
+CLASSIFICATION_POLL_INTERVAL = float(config.get('CLASSIFICATION_POLL_INTERVAL', 2))
+CLASSIFICATION_RETRY_BASE = int(config.get('CLASSIFICATION_RETRY_BASE', 30))
+CLASSIFICATION_RETRY_MAX = int(config.get('CLASSIFICATION_RETRY_MAX', 3600))
+CLASSIFICATION_MAX_ATTEMPTS = int(config.get('CLASSIFICATION_MAX_ATTEMPTS', 5))
+
+# Local BiLSTM screening in front of Gemini (trained by `manage.py
+# train_local_model`): texts whose LOCAL_MODEL_NONE_LABEL probability
+# reaches the threshold are dropped
+LOCAL_MODEL_ENABLED = config.get('LOCAL_MODEL_ENABLED', 'True') == 'True'
+LOCAL_MODEL_PATH = config.get('LOCAL_MODEL_PATH', str(BASE_DIR / 'main' / 'rnn_alert_classifier.h5'))
+LOCAL_MODEL_NONE_LABEL = config.get('LOCAL_MODEL_NONE_LABEL', 'none')
+LOCAL_MODEL_NONE_THRESHOLD = float(config.get('LOCAL_MODEL_NONE_THRESHOLD', 0.9))
+LOCAL_MODEL_BATCH_SIZE = int(config.get('LOCAL_MODEL_BATCH_SIZE', 64))
+# Texts scored by the local model are batched across threads: a batch runs
+# once LOCAL_MODEL_BATCH_SIZE texts wait, or LOCAL_MODEL_BATCH_WAIT_MS after
+# its first one (see `manage.py benchmark_local_model` to tune both)
+LOCAL_MODEL_BATCH_WAIT_MS = float(config.get('LOCAL_MODEL_BATCH_WAIT_MS', 5))
+# Corpora cleaned, tokenized and padded by train_local_model, kept as
+# memory-mapped arrays keyed by the hash of the corpus and encoding settings
+LOCAL_MODEL_TRAINING_CACHE_DIR = config.get('LOCAL_MODEL_TRAINING_CACHE_DIR', str(BASE_DIR / 'training_cache'))
+
+# Distillation of Gemini verdicts into the local model (distill_local_model
+# command). DISTILLATION_HOLDOUT_PERCENT of labelled texts are never trained
+# on and compare versions; a run needs DISTILLATION_MIN_EXAMPLES examples new
+# since the active version, and promotes nothing while the holdout has fewer
+# than DISTILLATION_MIN_HOLDOUT. Fine-tuning uses DISTILLATION_LEARNING_RATE.
+# DISTILLATION_AUDIT_PERCENT of the texts the local model drops still go to
+# Gemini, so that its labels cover what the local model handles as well.
+DISTILLATION_HOLDOUT_PERCENT = int(config.get('DISTILLATION_HOLDOUT_PERCENT', 10))
+DISTILLATION_AUDIT_PERCENT = float(config.get('DISTILLATION_AUDIT_PERCENT', 2))
+DISTILLATION_MIN_EXAMPLES = int(config.get('DISTILLATION_MIN_EXAMPLES', 200))
+DISTILLATION_MIN_HOLDOUT = int(config.get('DISTILLATION_MIN_HOLDOUT', 100))
+DISTILLATION_LEARNING_RATE = float(config.get('DISTILLATION_LEARNING_RATE', 0.0001))
+
+# How often (seconds) each process checks the ClassifierModel table for a
+# newly activated classifier version to swap in
+MODEL_REGISTRY_REFRESH_SECONDS = int(config.get('MODEL_REGISTRY_REFRESH_SECONDS', 60))
+
+# How often (seconds) the threat keyword matcher checks the ThreatKeyword table
+THREAT_KEYWORDS_REFRESH_SECONDS = int(config.get('THREAT_KEYWORDS_REFRESH_SECONDS', 60))
+
+# Scan scheduler: every process starts it paused; the one holding the
+# database lease (held SCHEDULER_LEASE_TTL seconds, renewed every
+# SCHEDULER_LEASE_RENEW_SECONDS) runs the jobs. Occurrences missed by more
+# than SCHEDULER_MISFIRE_GRACE_TIME seconds are skipped.
+SCHEDULER_AUTOSTART = config.get('SCHEDULER_AUTOSTART', 'True') == 'True'
+SCHEDULER_LEASE_TTL = int(config.get('SCHEDULER_LEASE_TTL', 60))
+SCHEDULER_LEASE_RENEW_SECONDS = int(config.get('SCHEDULER_LEASE_RENEW_SECONDS', 20))
+SCHEDULER_MISFIRE_GRACE_TIME = int(config.get('SCHEDULER_MISFIRE_GRACE_TIME', 15 * 60))
+
+# Outbound API budgets: requests per second and burst of each upstream's token
+# bucket, and requests per day (0 for no daily quota). Each lower priority
+# class (quick scans, scheduled scans, backfills) leaves another
+# RATE_LIMIT_PRIORITY_RESERVE of the bucket and daily quota to the ones above.
+# Callers wait at most RATE_LIMIT_MAX_WAIT seconds for a token. With
+# RATE_LIMIT_SHARED, daily usage and Retry-After pauses are shared through the
+# database by every process.
+RATE_LIMITS = {
+    'newsapi': {
+        'rate': float(config.get('NEWS_API_RATE', 1)),
+        'burst': int(config.get('NEWS_API_BURST', 5)),
+        'daily_quota': int(config.get('NEWS_API_DAILY_QUOTA', 100)),
+    },
+    'gemini': {
+        'rate': float(config.get('GEMINI_RATE', 0.25)),
+        'burst': int(config.get('GEMINI_BURST', 5)),
+        'daily_quota': int(config.get('GEMINI_DAILY_QUOTA', 1500)),
+    },
+    # Each RSS / JSON feed host gets its own budget
+    'feeds': {
+        'rate': float(config.get('FEEDS_RATE', 1)),
+        'burst': int(config.get('FEEDS_BURST', 2)),
+        'daily_quota': int(config.get('FEEDS_DAILY_QUOTA', 0)),
+    },
+    # Hosts of the article pages downloaded for full-text extraction
+    'articles': {
+        'rate': float(config.get('ARTICLES_RATE', 1)),
+        'burst': int(config.get('ARTICLES_BURST', 2)),
+        'daily_quota': int(config.get('ARTICLES_DAILY_QUOTA', 0)),
+    },
+}
+RATE_LIMIT_PRIORITY_RESERVE = float(config.get('RATE_LIMIT_PRIORITY_RESERVE', 0.2))
+RATE_LIMIT_MAX_WAIT = float(config.get('RATE_LIMIT_MAX_WAIT', 30))
+RATE_LIMIT_SHARED = config.get('RATE_LIMIT_SHARED', 'True') == 'True'
+
+# HTTP clients of the upstreams: connect/read timeouts (seconds), connections
+# kept alive per upstream, retries with jittered exponential backoff
+# (UPSTREAM_BACKOFF_BASE doubling up to UPSTREAM_BACKOFF_MAX seconds), and a
+# circuit breaker failing calls fast for UPSTREAM_CIRCUIT_RESET_SECONDS after
+# UPSTREAM_CIRCUIT_FAILURES consecutive failures
+UPSTREAM_TIMEOUTS = {
+    'newsapi': {
+        'connect_timeout': float(config.get('NEWS_API_CONNECT_TIMEOUT', 5)),
+        'read_timeout': float(config.get('NEWS_API_READ_TIMEOUT', 30)),
+    },
+    'gemini': {
+        'connect_timeout': float(config.get('GEMINI_CONNECT_TIMEOUT', 5)),
+        'read_timeout': float(config.get('GEMINI_READ_TIMEOUT', 60)),
+    },
+    'feeds': {
+        'connect_timeout': float(config.get('FEEDS_CONNECT_TIMEOUT', 5)),
+        'read_timeout': float(config.get('FEEDS_READ_TIMEOUT', 20)),
+    },
+    'articles': {
+        'connect_timeout': float(config.get('ARTICLES_CONNECT_TIMEOUT', 5)),
+        'read_timeout': float(config.get('ARTICLES_READ_TIMEOUT', 15)),
+    },
+}
+UPSTREAM_POOL_SIZE = int(config.get('UPSTREAM_POOL_SIZE', 10))
+# Connections the ingestion engine opens to one host at a time
+UPSTREAM_CONNECTIONS_PER_HOST = int(config.get('UPSTREAM_CONNECTIONS_PER_HOST', 4))
+UPSTREAM_MAX_RETRIES = int(config.get('UPSTREAM_MAX_RETRIES', 3))
+UPSTREAM_BACKOFF_BASE = float(config.get('UPSTREAM_BACKOFF_BASE', 0.5))
+UPSTREAM_BACKOFF_MAX = float(config.get('UPSTREAM_BACKOFF_MAX', 10))
+UPSTREAM_CIRCUIT_FAILURES = int(config.get('UPSTREAM_CIRCUIT_FAILURES', 5))
+UPSTREAM_CIRCUIT_RESET_SECONDS = int(config.get('UPSTREAM_CIRCUIT_RESET_SECONDS', 60))
+
 LOGIN_REDIRECT_URL = reverse_lazy('dashboard')
 LOGIN_URL = reverse_lazy('login')
 